@@ -0,0 +1,145 @@
+# agreement.py
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class AgreementAccumulator:
+    """
+    Agreement between LLM predictions and crowd annotations, updated one prediction at a time.
+
+    The crowd annotations are indexed once (majority label and per-label rating counts of every reference);
+    afterwards the running state is a k x k confusion matrix against the majority plus the O(k) sums needed
+    for Fleiss' kappa with the LLM as an extra rater, so every statistic can be read at any time.
+    """
+
+    def __init__(self, df_crowd: pd.DataFrame, label_column: str, raters: Optional[int] = None,
+                 window: int = 50, min_items: int = 100, tolerance: float = 0.01):
+        """
+        Args:
+            df_crowd: Crowd annotations with ['ref_value', 'X_worker_id', <label_column>].
+            label_column: Name of the label column (e.g., 'author_type').
+            raters: Number of crowd ratings an item needs to count for Fleiss' kappa
+                    (default: the most common number, 5 for the original tasks).
+            window: Number of recent Cohen's kappa values compared by is_stable().
+            min_items: Number of matched predictions before is_stable() can be true.
+            tolerance: Maximum spread of Cohen's kappa over the window for is_stable().
+        """
+        crowd = df_crowd.dropna(subset=['ref_value', label_column])
+        self.labels = sorted(crowd[label_column].unique())
+        self.label_index = {label: j for j, label in enumerate(self.labels)}
+
+        # same majority as evaluation.cohen_kappa_against_majority (first mode)
+        majority = crowd.groupby('ref_value')[label_column].agg(lambda x: x.mode()[0])
+        self.majority = {ref: self.label_index[label] for ref, label in majority.items()}
+
+        counts = pd.crosstab(crowd['ref_value'], crowd[label_column]).reindex(columns=self.labels, fill_value=0)
+        self.raters = int(raters or counts.sum(axis=1).mode()[0])
+        counts = counts[counts.sum(axis=1) == self.raters]
+        self.crowd_counts = dict(zip(counts.index, counts.to_numpy(dtype=np.int64)))
+
+        k = len(self.labels)
+        self.confusion = np.zeros((k, k), dtype=np.int64)  # rows: crowd majority, columns: LLM
+        self.fleiss_totals = np.zeros(k, dtype=np.int64)   # ratings per label, LLM included
+        self.fleiss_squares = 0                            # sum over items of sum_j n_ij^2
+        self.fleiss_items = 0
+        self.seen = set()
+        self.unmatched = 0
+
+        self.min_items = min_items
+        self.tolerance = tolerance
+        self.recent = deque(maxlen=window)
+
+    def _add_label(self, label: str) -> int:
+        # an LLM label the crowd never used becomes a new row/column that only ever disagrees
+        self.labels.append(label)
+        self.label_index[label] = len(self.labels) - 1
+        self.confusion = np.pad(self.confusion, ((0, 1), (0, 1)))
+        self.fleiss_totals = np.pad(self.fleiss_totals, (0, 1))
+        self.crowd_counts = {ref: np.pad(c, (0, 1)) for ref, c in self.crowd_counts.items()}
+        return self.label_index[label]
+
+    def update(self, ref_value: str, label: str) -> bool:
+        """
+        Adds one LLM prediction. Returns False when the reference has no crowd annotation
+        (or was already counted), in which case the state is unchanged.
+        """
+        if ref_value not in self.majority or ref_value in self.seen:
+            self.unmatched += 1
+            return False
+        self.seen.add(ref_value)
+        j = self.label_index.get(label)
+        if j is None:
+            j = self._add_label(label)
+        self.confusion[self.majority[ref_value], j] += 1
+
+        ratings = self.crowd_counts.get(ref_value)
+        if ratings is not None:
+            ratings = ratings.copy()
+            ratings[j] += 1
+            self.fleiss_totals += ratings
+            self.fleiss_squares += int((ratings * ratings).sum())
+            self.fleiss_items += 1
+
+        self.recent.append(self.cohen_kappa())
+        return True
+
+    def update_many(self, predictions: Iterable) -> None:
+        for ref_value, label in predictions:
+            self.update(ref_value, label)
+
+    @property
+    def n_items(self) -> int:
+        return int(self.confusion.sum())
+
+    def cohen_kappa(self) -> float:
+        """Cohen's kappa of the LLM against the crowd majority (same value as sklearn's cohen_kappa_score)."""
+        n = self.confusion.sum()
+        if n == 0:
+            return float('nan')
+        observed = np.trace(self.confusion) / n
+        expected = self.confusion.sum(axis=1).dot(self.confusion.sum(axis=0)) / float(n * n)
+        if expected == 1:
+            return float('nan')
+        return float((observed - expected) / (1 - expected))
+
+    def fleiss_kappa(self) -> float:
+        """Fleiss' kappa of the crowd raters plus the LLM, over the items with the full number of crowd ratings."""
+        N, n = self.fleiss_items, self.raters + 1
+        if N == 0:
+            return float('nan')
+        Pbar = (self.fleiss_squares - N * n) / float(N * n * (n - 1))
+        p = self.fleiss_totals / float(N * n)
+        PbarE = float((p * p).sum())
+        if PbarE == 1:
+            return float('nan')
+        return (Pbar - PbarE) / (1 - PbarE)
+
+    def label_counts(self) -> pd.DataFrame:
+        """Per-label confusion counts of the LLM against the crowd majority."""
+        tp = np.diag(self.confusion)
+        return pd.DataFrame({'label': self.labels,
+                             'tp': tp,
+                             'fp': self.confusion.sum(axis=0) - tp,
+                             'fn': self.confusion.sum(axis=1) - tp,
+                             'support': self.confusion.sum(axis=1)})
+
+    def is_stable(self) -> bool:
+        """True once min_items predictions are matched and Cohen's kappa moved less than tolerance over the window."""
+        if self.n_items < self.min_items or len(self.recent) < self.recent.maxlen:
+            return False
+        return max(self.recent) - min(self.recent) < self.tolerance
+
+    def snapshot(self) -> Dict:
+        return {'items': self.n_items,
+                'unmatched': self.unmatched,
+                'cohen_kappa': self.cohen_kappa(),
+                'fleiss_items': self.fleiss_items,
+                'fleiss_kappa': self.fleiss_kappa()}
+
+    def __repr__(self) -> str:
+        s = self.snapshot()
+        return (f"AgreementAccumulator(items={s['items']}, cohen_kappa={s['cohen_kappa']:.3f}, "
+                f"fleiss_kappa={s['fleiss_kappa']:.3f})")
@@ -0,0 +1,195 @@
+"""
+Concurrent label fetching from the Wikidata API: wbgetentities batches are requested by asyncio tasks, at most
+`concurrency` at a time and no faster than `rate` requests per second (token bucket). Failed requests are retried
+with exponential backoff and full jitter; a 429/503 answer or a maxlag / ratelimited error pauses every task for its
+Retry-After. Other API errors are retried too, and never cached.
+"""
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from label_extractor import API_URL, LabelResolver
+
+# statuses worth retrying: throttled, or the server is busy
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def retry_after_seconds(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` acquisitions per second on average and bursts of up to `burst`. pause(seconds) holds back every
+    acquisition, e.g. for the Retry-After of a throttled answer. No lock is needed: acquire does not yield between
+    checking and taking a token, and the bucket is not bound to an event loop.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(float(burst), 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.refill(now)
+            wait = self.paused_until - now
+            if wait <= 0 and self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(max(wait, (1 - self.tokens) / self.rate))
+
+
+class FetchStats(object):
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failed = 0
+        self.batches = 0
+        self.ids = 0
+
+    def as_dict(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {'batches': self.batches, 'ids': self.ids, 'requests': self.requests, 'retries': self.retries,
+                'throttled': self.throttled, 'failed': self.failed, 'elapsed': elapsed,
+                'requests_per_second': self.requests / elapsed, 'ids_per_second': self.ids / elapsed}
+
+    def __str__(self):
+        stats = self.as_dict()
+        return ('{batches} batches, {ids} ids in {elapsed:.1f}s ({ids_per_second:.1f} ids/s, '
+                '{requests_per_second:.2f} requests/s), {retries} retries, {throttled} throttled, '
+                '{failed} failed').format(**stats)
+
+
+class AsyncLabelResolver(LabelResolver):
+    """
+    LabelResolver whose missing batches are fetched concurrently. aresolve is the coroutine; resolve, labels and
+    descriptions keep the synchronous interface and also work inside a running event loop (e.g. Jupyter), where
+    the fetch runs on a helper thread. The session is shared by the worker threads, so it is sized to concurrency.
+    The rate limit holds across calls; stats describes the last call. progress prints the stats every n batches.
+    """
+
+    def __init__(self, api_url=API_URL, rate=5.0, burst=None, concurrency=4,
+                 retries=5, delay=1.0, max_delay=60.0, maxlag=5, progress=None, **kwargs):
+        super(AsyncLabelResolver, self).__init__(api_url=api_url, retries=retries, delay=delay, **kwargs)
+        self.bucket = TokenBucket(rate, burst if burst is not None else concurrency)
+        self.concurrency = concurrency
+        self.max_delay = max_delay
+        # Wikidata asks bots to back off while replication lag exceeds maxlag seconds
+        self.maxlag = maxlag
+        self.progress = progress
+        self.stats = FetchStats()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def backoff(self, attempt):
+        # full jitter: uniform in [0, min(max_delay, delay * 2^attempt)]
+        return random.uniform(0, min(self.max_delay, self.delay * 2 ** attempt))
+
+    def params(self, ids):
+        params = {'action': 'wbgetentities',
+                  'ids': '|'.join(ids),
+                  'props': 'labels|descriptions',
+                  'languages': '|'.join(self.languages),
+                  'format': 'json'}
+        if self.maxlag is not None:
+            params['maxlag'] = self.maxlag
+        return params
+
+    async def afetch_batch(self, ids, semaphore, executor):
+        """
+        The entities of one batch, or None once the retries are exhausted.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries):
+            await self.bucket.acquire()
+            wait = None
+            async with semaphore:
+                self.stats.requests += 1
+                try:
+                    r = await loop.run_in_executor(executor, lambda: self.session.get(
+                        self.api_url, params=self.params(ids), timeout=self.timeout))
+                    if r.status_code in RETRY_STATUSES:
+                        wait = retry_after_seconds(r.headers.get('Retry-After'))
+                        self.stats.throttled += r.status_code in (429, 503)
+                    else:
+                        r.raise_for_status()
+                        answer = r.json()
+                        if 'error' not in answer:
+                            return answer.get('entities', {})
+                        # API errors come with HTTP 200: every one is a failed attempt, and maxlag / ratelimited
+                        # ask every client to slow down
+                        if answer['error'].get('code') in ('maxlag', 'ratelimited'):
+                            wait = retry_after_seconds(r.headers.get('Retry-After')) or 5.0
+                            self.stats.throttled += 1
+                except (requests.RequestException, ValueError):
+                    pass
+            if wait is not None:
+                # the server said when to come back: hold back every task, not only this one
+                self.bucket.pause(wait)
+            if attempt + 1 < self.retries:
+                self.stats.retries += 1
+                await asyncio.sleep(max(wait or 0.0, self.backoff(attempt)))
+        self.stats.failed += 1
+        return None
+
+    async def aresolve(self, items):
+        """
+        Coroutine version of resolve.
+        """
+        ids, batches = self.missing(items)
+        if not batches:
+            return self.resolved(ids)
+        self.stats = FetchStats()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(batch):
+            entities = await self.afetch_batch(batch, semaphore, executor)
+            if entities is not None:
+                self.remember(self.parse_entities(batch, entities))
+            self.stats.batches += 1
+            self.stats.ids += len(batch)
+            if self.progress and self.stats.batches % self.progress == 0:
+                print('{}/{} batches: {}'.format(self.stats.batches, len(batches), self.stats))
+
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            await asyncio.gather(*[fetch(batch) for batch in batches])
+        if self.progress:
+            print(self.stats)
+        return self.resolved(ids)
+
+    def resolve(self, items):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aresolve(items))
+        # asyncio.run cannot nest in a running loop: run the fetch on its own loop in a helper thread
+        with ThreadPoolExecutor(1) as executor:
+            return executor.submit(asyncio.run, self.aresolve(items)).result()
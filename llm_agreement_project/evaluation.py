@@ -1,10 +1,15 @@
 # evaluation.py
 import os 
 import pandas as pd
+import matplotlib
+
+matplotlib.use("Agg")  # headless: figures are only saved, never shown
 import matplotlib.pyplot as plt
 from sklearn.metrics import cohen_kappa_score, classification_report
 from typing import Tuple
 
+from figure_cache import input_hash, is_current, read_hashes, write_hashes
+
 def load_data(llm_model_name: str, prompt_id : str, task: str = "author") -> Tuple[pd.DataFrame, pd.DataFrame, str]:
     """
     Loads LLM and crowdsource data based on the task.
@@ -58,6 +63,44 @@ def cohen_kappa_against_majority(df_llm, df_crowd, label_column: str):
     return merged , kappa
 
 
+def plot_kappa_bins(df_results: pd.DataFrame, plot_path: str, label_column: str) -> None:
+    """
+    Bar chart of the agreements with the LLM per annotator kappa bin, drawn from the per-user table.
+    """
+    fig = plt.figure(figsize=(10, 6))
+    df_results.groupby('kappa_bin', observed=False)['agree_count'].sum().plot(
+        kind='bar', color='steelblue', edgecolor='black'
+    )
+    plt.title(f"LLM Agreement Counts by Annotator Kappa Bin ({label_column})")
+    plt.xlabel("Cohen's Kappa Bin")
+    plt.ylabel("Total Agreements with LLM")
+    plt.grid(axis='y', linestyle='--', alpha=0.5)
+    plt.tight_layout()
+    fig.savefig(plot_path)
+    plt.close(fig)
+
+
+def render_if_changed(renderer, table: pd.DataFrame, plot_path: str, **options) -> bool:
+    """
+    Renders a figure unless it exists and its table, options and drawing code are unchanged since the last run.
+    The input hashes are kept in report_hashes.json next to the figure (figure_cache.py).
+
+    Returns:
+        True if the figure was rendered.
+    """
+    key = input_hash(table, renderer, options)
+    plot_dir = os.path.dirname(plot_path) or "."
+    hashes = read_hashes(plot_dir)
+    if is_current(hashes, plot_path, key):
+        print(f"⏭️ Unchanged, skipped: {plot_path}")
+        return False
+
+    renderer(table, plot_path, **options)
+    hashes[os.path.basename(plot_path)] = key
+    write_hashes(hashes, plot_dir)
+    return True
+
+
 def plot_kappa_and_flag_low_performance(
     crowd: pd.DataFrame,
     llm: pd.DataFrame,
@@ -65,7 +108,8 @@ def plot_kappa_and_flag_low_performance(
     kappa_thresh=0.4,
     top_k=5,
     model: str = "model",
-    prompt_id: str = "1"
+    prompt_id: str = "1",
+    task: str = "author"
 ):
     """
     Plot agreement counts per kappa bin and print annotators with poor agreement.
@@ -99,30 +143,20 @@ def plot_kappa_and_flag_low_performance(
     labels = ['<0', '0–0.2', '0.2–0.4', '0.4–0.6', '0.6–0.8', '0.8–1.0']
     df_results['kappa_bin'] = pd.cut(df_results['kappa'], bins=bins, labels=labels)
 
-    # Plot
-    plt.figure(figsize=(10, 6))
-    df_results.groupby('kappa_bin')['agree_count'].sum().plot(
-        kind='bar', color='steelblue', edgecolor='black'
-    )
-    plt.title(f"LLM Agreement Counts by Annotator Kappa Bin ({label_column})")
-    plt.xlabel("Cohen's Kappa Bin")
-    plt.ylabel("Total Agreements with LLM")
-    plt.grid(axis='y', linestyle='--', alpha=0.5)
-    plt.tight_layout()
-    plt.show()
-
     # Print worst annotators
     print("\n🛑 Annotators with lowest agreement:\n")
     low_kappa = df_results[df_results['kappa'] < kappa_thresh].sort_values(by='kappa')
     print(low_kappa[['user', 'kappa', 'agree_count']].head(top_k).to_string(index=False))
 
-        # Save the plot
-    folder = f"results_{model}_{prompt_id}/{task}"
+    # Save the plot (same folder as save_results)
+    folder = f"results/results_{model}_{prompt_id}/{task}"
     os.makedirs(folder, exist_ok=True)
     plot_path = os.path.join(folder, "annotator_agreement_bar_chart.png")
-    plt.savefig(plot_path)
-    print(f"📊 Bar chart saved to: {plot_path}")
+    if render_if_changed(plot_kappa_bins, df_results, plot_path, label_column=label_column):
+        print(f"📊 Bar chart saved to: {plot_path}")
     return df_results
+
+
 def save_results(
     merged_df: pd.DataFrame,
     user_kappa_df: pd.DataFrame,
@@ -197,7 +231,8 @@ if __name__ == "__main__":
         kappa_thresh=0.4,
         top_k=10,
         model = model,
-        prompt_id = prompt_id
+        prompt_id = prompt_id,
+        task = task
     )   
     log_cohen_kappa(model=model, prompt_id=prompt_id, task=task, kappa=kappa)
     save_results(merged, user_stats, model=model, prompt_id=prompt_id ,task = task)
@@ -0,0 +1,39 @@
+"""
+Change detection of rendered figures. A figure is current when its file exists and the hash of its table, options
+and drawing code matches the one recorded when it was last rendered. The hashes of a directory are kept in
+report_hashes.json next to its figures, keyed by file name.
+"""
+import hashlib
+import inspect
+import json
+import os
+
+import pandas as pd
+
+HASH_FILE = 'report_hashes.json'
+
+
+def input_hash(table, renderer, options=None):
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(table, index=True).values.tobytes())
+    digest.update(json.dumps([list(map(str, table.columns)), options or {}], sort_keys=True,
+                             default=str).encode('utf-8'))
+    digest.update(inspect.getsource(renderer).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def read_hashes(directory):
+    hash_path = os.path.join(directory, HASH_FILE)
+    if not os.path.exists(hash_path):
+        return {}
+    with open(hash_path) as f:
+        return json.load(f)
+
+
+def write_hashes(hashes, directory):
+    with open(os.path.join(directory, HASH_FILE), 'w') as f:
+        json.dump(hashes, f, indent=1, sort_keys=True)
+
+
+def is_current(hashes, path, key):
+    return hashes.get(os.path.basename(path)) == key and os.path.exists(path)
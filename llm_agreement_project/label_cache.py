@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import threading
+import time
+
+# SQLite allows at most 999 host parameters per statement in older builds
+CHUNK_SIZE = 900
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS labels (
+    id TEXT PRIMARY KEY,
+    label TEXT,
+    description TEXT,
+    fetched_at REAL,
+    accessed_at REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS labels_accessed_at ON labels (accessed_at);
+CREATE INDEX IF NOT EXISTS labels_fetched_at ON labels (fetched_at);
+'''
+
+
+class LabelCache(object):
+    """
+    Persistent cache of entity labels and descriptions in a SQLite file, shared by every process using the same
+    path (WAL journal: readers never block each other or the writer). Entries older than ttl seconds count as
+    misses; beyond max_entries the least recently used entries are evicted. hits and misses count the ids looked up.
+    Eviction counts the table, so it runs once every evict_every written entries rather than on every write: the
+    cache can exceed max_entries by that much in between.
+    """
+
+    def __init__(self, path='label_cache.sqlite', max_entries=2000000, ttl=30 * 24 * 3600, touch_interval=3600,
+                 timeout=30, evict_every=10000):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # last access times are only rewritten when older than this, so hits rarely need the write lock
+        self.touch_interval = touch_interval
+        self.evict_every = evict_every
+        self.written = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def get_many(self, ids):
+        """
+        Returns {id: {'label': ..., 'description': ...}} for the ids cached and not expired.
+        """
+        ids = list(dict.fromkeys(ids))
+        now = time.time()
+        found = {}
+        with self.lock:
+            for start in range(0, len(ids), CHUNK_SIZE):
+                chunk = ids[start:start + CHUNK_SIZE]
+                marks = ','.join('?' * len(chunk))
+                rows = self.connection.execute(
+                    'SELECT id, label, description, accessed_at FROM labels WHERE id IN ({}) AND fetched_at >= ?'.format(
+                        marks), chunk + [now - self.ttl]).fetchall()
+                stale = []
+                for item, label, description, accessed_at in rows:
+                    found[item] = {'label': label, 'description': description}
+                    if accessed_at < now - self.touch_interval:
+                        stale.append(item)
+                if stale:
+                    with self.connection:
+                        self.connection.execute('UPDATE labels SET accessed_at = ? WHERE id IN ({})'.format(
+                            ','.join('?' * len(stale))), [now] + stale)
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+        return found
+
+    def put_many(self, entries):
+        """
+        entries: {id: {'label': ..., 'description': ...}}. Existing entries are replaced.
+        """
+        now = time.time()
+        rows = [(item, value['label'], value['description'], now, now) for item, value in entries.items()]
+        if not rows:
+            return
+        with self.lock:
+            with self.connection:
+                self.connection.executemany('INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?)', rows)
+            self.written += len(rows)
+            if self.written >= self.evict_every:
+                self.evict()
+
+    def get(self, item):
+        return self.get_many([item]).get(item)
+
+    def put(self, item, label, description=''):
+        self.put_many({item: {'label': label, 'description': description}})
+
+    def evict(self):
+        # expired entries first (range on the fetched_at index), then the least recently used beyond max_entries;
+        # in its own transaction, after the write that triggered it has been committed
+        self.written = 0
+        with self.connection:
+            self.connection.execute('DELETE FROM labels WHERE fetched_at < ?', (time.time() - self.ttl,))
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                self.connection.execute('DELETE FROM labels WHERE id IN '
+                                        '(SELECT id FROM labels ORDER BY accessed_at LIMIT ?)', (excess,))
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM labels').fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / float(lookups) if lookups else 0.0}
+
+    def close(self):
+        self.connection.close()
@@ -1,6 +1,11 @@
 # llm_wrapper.py
 
-from ollama import Client
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import httpx
+from ollama import AsyncClient, Client, ResponseError
 
 class LLMWrapper:
     def __init__(
@@ -38,3 +43,109 @@ class LLMWrapper:
             messages=[{"role": "user", "content": prompt}]
         )
         return response["message"]["content"]
+
+
+class AsyncLLMWrapper(LLMWrapper):
+    def __init__(
+        self,
+        model_name: str = "mistral:latest",
+        host: str = "http://localhost:11434",
+        verbose: bool = True,
+        max_in_flight: int = 4,
+        timeout: Optional[float] = 120.0,
+        retries: int = 2,
+        delay: float = 1.0
+    ):
+        """
+        LLMWrapper that keeps several chat requests in flight, so that an Ollama server started with
+        OLLAMA_NUM_PARALLEL > 1 is never idle between prompts. run_prompt stays available (blocking).
+
+        Args:
+            model_name (str): Name of the local Ollama model to use.
+            host (str): Address of the Ollama server.
+            verbose (bool): Whether to print initialization status.
+            max_in_flight (int): Requests sent concurrently by the batch methods; match OLLAMA_NUM_PARALLEL.
+            timeout (float): Seconds allowed per request attempt (None: no limit).
+            retries (int): Extra attempts after a timeout, a connection error or a server error.
+            delay (float): Backoff before the first retry, doubled at each further retry.
+        """
+        super().__init__(model_name=model_name, host=host, verbose=verbose)
+        self.host = host
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.retries = retries
+        self.delay = delay
+        self.async_client = AsyncClient(host=host)
+
+    async def arun_prompt(self, prompt: str) -> str:
+        """
+        Send a prompt to the LLM without blocking the event loop, retrying failed attempts.
+
+        Args:
+            prompt (str): The text prompt to send to the model.
+
+        Returns:
+            str: The model's textual response.
+        """
+        return await self._arun(prompt, self.async_client)
+
+    async def _arun(self, prompt: str, client: AsyncClient, semaphore: Optional[asyncio.Semaphore] = None) -> str:
+        # a slot of semaphore is held during each request only, never during the backoff between attempts
+        for attempt in range(self.retries + 1):
+            try:
+                if semaphore is None:
+                    return await self._chat(prompt, client)
+                async with semaphore:
+                    return await self._chat(prompt, client)
+            except (asyncio.TimeoutError, ConnectionError, httpx.TransportError, ResponseError) as e:
+                # client errors (unknown model, bad request) will not succeed on retry
+                if isinstance(e, ResponseError) and e.status_code < 500 and e.status_code != 429:
+                    raise
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.delay * 2 ** attempt)
+
+    async def _chat(self, prompt: str, client: AsyncClient) -> str:
+        response = await asyncio.wait_for(
+            client.chat(
+                model=self.model_name,
+                messages=[{"role": "user", "content": prompt}]
+            ),
+            timeout=self.timeout
+        )
+        return response["message"]["content"]
+
+    async def arun_prompts(self, prompts: List[str], return_exceptions: bool = False,
+                           client: Optional[AsyncClient] = None) -> List:
+        """
+        Send all prompts with at most max_in_flight requests at a time.
+
+        Args:
+            prompts (List[str]): The text prompts.
+            return_exceptions (bool): Put the exception of a failed prompt in its place instead of raising it.
+            client (AsyncClient): Client bound to the running loop (default: the wrapper's own).
+
+        Returns:
+            List: The responses, in the order of the prompts.
+        """
+        client = client or self.async_client
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        return await asyncio.gather(*(self._arun(prompt, client, semaphore) for prompt in prompts),
+                                    return_exceptions=return_exceptions)
+
+    def run_prompts(self, prompts: List[str], return_exceptions: bool = False) -> List:
+        """
+        Blocking version of arun_prompts. Inside a running event loop (e.g. Jupyter), where asyncio.run
+        cannot nest, the batch runs on its own loop in a helper thread.
+        """
+        async def run_batch():
+            # the async client's connections belong to the loop that opened them: one client per batch loop
+            return await self.arun_prompts(prompts, return_exceptions=return_exceptions,
+                                           client=AsyncClient(host=self.host))
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(run_batch())
+        with ThreadPoolExecutor(1) as executor:
+            return executor.submit(asyncio.run, run_batch()).result()
@@ -1,40 +1,96 @@
+import math
+
+import numpy as np
+from joblib import Parallel, cpu_count, delayed
+
+
+def ratings_array(mat):
+    # N x k integer counts; every item must have been rated by the same number of raters
+    mat = np.asarray(mat, dtype=np.int64)
+    if mat.ndim != 2 or mat.shape[0] == 0:
+        raise ValueError('Ratings must be a non-empty N x k matrix, got shape {}'.format(mat.shape))
+    row_sums = mat.sum(axis=1)
+    if (row_sums != row_sums[0]).any():
+        raise ValueError('Line count != %d (n value) for %d items.' % (row_sums[0], (row_sums != row_sums[0]).sum()))
+    return mat
+
+
+def rating_patterns(mat):
+    # distinct rows and how many items share each; rows are packed into one integer (base n + 1) when they fit
+    n, k = int(mat[0].sum()), mat.shape[1]
+    if k * math.log(n + 1, 2) < 62:
+        codes = mat.dot((n + 1) ** np.arange(k, dtype=np.int64))
+        _, first, counts = np.unique(codes, return_index=True, return_counts=True)
+        return mat[first], counts
+    return np.unique(mat, axis=0, return_counts=True)
+
+
+def _kappa_from_patterns(patterns, weights, n):
+    """
+    Fleiss' kappa of item sets given as counts of distinct rating patterns: patterns is U x k, weights is
+    U (one item set) or B x U (B item sets, e.g. bootstrap resamples). Returns a scalar or a length-B array.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    N = weights.sum(axis=-1)
+    # agreement of every pattern, computed once however many items share it
+    P = ((patterns * patterns).sum(axis=1) - n) / float(n * (n - 1))
+    Pbar = weights.dot(P) / N
+    p = weights.dot(patterns) / (N * n)[..., np.newaxis]
+    PbarE = (p * p).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (Pbar - PbarE) / (1 - PbarE)
+
+
 def computeFleissKappa(mat):
     """
     Computes the Fleiss' Kappa value as described in (Fleiss, 1971)
     https://en.wikibooks.org/wiki/Algorithm_Implementation/Statistics/Fleiss%27_kappa#Python
     """
+    mat = ratings_array(mat)
+    n = int(mat[0].sum())
+    patterns, counts = rating_patterns(mat)
+    return float(_kappa_from_patterns(patterns, counts, n))
+
 
-    n = sum(mat[0])  # PRE : every line count must be equal to n
-    assert all(sum(line) == n for line in mat[1:]), "Line count != %d (n value)." % n
-    N = len(mat)
-    k = len(mat[0])
-
-    # Computing p[]
-    p = [0.0] * k
-    for j in range(k):
-        p[j] = 0.0
-        for i in range(N):
-            p[j] += mat[i][j]
-        p[j] /= N * n
-
-    # Computing P[]
-    P = [0.0] * N
-    for i in range(N):
-        P[i] = 0.0
-        for j in range(k):
-            P[i] += mat[i][j] * mat[i][j]
-        P[i] = (P[i] - n) / (n * (n - 1))
-
-    # Computing Pbar
-    Pbar = sum(P) / N
-
-    # Computing PbarE
-    PbarE = 0.0
-    for pj in p:
-        PbarE += pj * pj
-
-    kappa = (Pbar - PbarE) / (1 - PbarE)
-    return kappa
+def _bootstrap_kappas(patterns, probabilities, N, n, batches):
+    # resampling N items with replacement = drawing how many times each distinct pattern is picked;
+    # batches is a list of (size, seed), each batch drawn from its own generator
+    kappas = []
+    for size, seed in batches:
+        weights = np.random.default_rng(seed).multinomial(N, probabilities, size=size)
+        kappas.append(_kappa_from_patterns(patterns, weights, n))
+    return np.concatenate(kappas) if kappas else np.empty(0)
+
+
+def fleiss_kappa_bootstrap(mat, n_boot=2000, confidence=0.95, random_state=None, n_jobs=1, batch_size=1000):
+    """
+    Fleiss' kappa with a percentile bootstrap confidence interval over the items.
+    The items are reduced to their distinct rating patterns, so every resample costs O(patterns) instead of O(N);
+    resamples are drawn in batches of batch_size, each with its own seed derived from random_state, and the batches
+    are split over n_jobs processes: the interval depends on random_state and batch_size, not on n_jobs.
+    Returns (kappa, low, high).
+    """
+    mat = ratings_array(mat)
+    n = int(mat[0].sum())
+    N = mat.shape[0]
+    patterns, counts = rating_patterns(mat)
+    kappa = float(_kappa_from_patterns(patterns, counts, n))
+
+    probabilities = counts / float(N)
+    sizes = [min(batch_size, n_boot - start) for start in range(0, n_boot, batch_size)]
+    batches = list(zip(sizes, np.random.SeedSequence(random_state).spawn(len(sizes))))
+    n_jobs = max(1, min(n_jobs if n_jobs > 0 else cpu_count(), len(batches)))
+    if n_jobs == 1:
+        kappas = _bootstrap_kappas(patterns, probabilities, N, n, batches)
+    else:
+        # contiguous runs of batches, concatenated back in batch order
+        kappas = np.concatenate(Parallel(n_jobs=n_jobs)(
+            delayed(_bootstrap_kappas)(patterns, probabilities, N, n, [batches[i] for i in share])
+            for share in np.array_split(np.arange(len(batches)), n_jobs)))
+
+    tail = (1 - confidence) / 2.0 * 100
+    low, high = np.nanpercentile(kappas, [tail, 100 - tail])
+    return kappa, float(low), float(high)
 
 
 def mean(numbers):
@@ -7,7 +7,41 @@ import os
 
 import json
 
-def predict_author_type(llm, unique_authors, examples=None, mode="json"):
+UNREACHABLE = "The reference is unreachable"
+
+
+def iter_responses(llm, items, build_prompt, batch_size=None):
+    """
+    Yields (i, item, prompt, response) for every item in order, i starting at 1. Unreachable references are not
+    sent and come with response None.
+
+    Args:
+        llm: The LLM wrapper (run_prompt, and run_prompts for batches).
+        items: Items to build the prompts from.
+        build_prompt: item -> prompt.
+        batch_size: Prompts sent together with llm.run_prompts (default: llm.max_in_flight of an AsyncLLMWrapper,
+            else 1). A failed prompt of a batch yields its exception as response.
+    """
+    if batch_size is None:
+        batch_size = getattr(llm, "max_in_flight", 1)
+    batched = batch_size > 1 and hasattr(llm, "run_prompts")
+    items = list(items)
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        prompts = [build_prompt(item) for item in chunk]
+        reachable = [prompt for prompt in prompts if UNREACHABLE not in prompt]
+        if batched:
+            responses = iter(llm.run_prompts(reachable, return_exceptions=True))
+        else:
+            # one at a time, only when consumed, so that a stopped loop sends nothing more
+            responses = (llm.run_prompt(prompt) for prompt in reachable)
+        for offset, (item, prompt) in enumerate(zip(chunk, prompts)):
+            response = next(responses) if UNREACHABLE not in prompt else None
+            yield start + offset + 1, item, prompt, response
+
+
+def predict_author_type(llm, unique_authors, examples=None, mode="json", agreement=None, stop_when_stable=False,
+                        batch_size=None):
     """
     Predicts author type using a language model, with optional support for different JSON extraction modes.
 
@@ -16,18 +50,22 @@ def predict_author_type(llm, unique_authors, examples=None, mode="json"):
         unique_authors: List of reference values.
         examples: Few-shot examples [(ref, label), ...]
         mode: 'json' (default) if model outputs clean JSON, 'extract' if output includes explanations before JSON.
+        agreement: Optional AgreementAccumulator updated with every prediction.
+        stop_when_stable: Stop once agreement.is_stable(), i.e. Cohen's kappa no longer moves.
+        batch_size: Prompts sent concurrently (see iter_responses).
     """
     author_results = []
     unreachable_refs = []
-    for i, ref in enumerate(unique_authors, start=1):
-        prompt = build_enriched_prompt(ref,"author_type")
-        if "The reference is unreachable" in prompt:
+    for i, ref, prompt, response in iter_responses(llm, unique_authors,
+                                                   lambda ref: build_enriched_prompt(ref, "author_type"), batch_size):
+        if UNREACHABLE in prompt:
             unreachable_refs.append((ref, "unreachable"))
             print(f"⛔ Unreachable reference: {ref}")
             continue
-        response = llm.run_prompt(prompt)
 
         try:
+            if isinstance(response, Exception):
+                raise response
             if mode == "json":
                 label = json.loads(response)["label"]
             elif mode == "extract":
@@ -43,8 +81,16 @@ def predict_author_type(llm, unique_authors, examples=None, mode="json"):
             print(f"⚠️ Skipped {ref} at index {i} due to error: {e}")
             continue
 
+        if agreement is not None:
+            agreement.update(ref, label)
+            if stop_when_stable and agreement.is_stable():
+                print(f"🛑 Agreement stable after {i}/{len(unique_authors)} references: {agreement}")
+                break
+
         if i % 10 == 0 or i == len(unique_authors):
             print(f"✅ Processed {i}/{len(unique_authors)} references")
+            if agreement is not None:
+                print(f"📈 {agreement}")
 
     return author_results, unreachable_refs
 
@@ -54,18 +100,21 @@ def predict_author_type(llm, unique_authors, examples=None, mode="json"):
 
 import json
 
-def predict_publisher_type(llm, unique_publishers, examples_publisher=None, mode="json"):
+def predict_publisher_type(llm, unique_publishers, examples_publisher=None, mode="json", agreement=None, stop_when_stable=False,
+                           batch_size=None):
     publisher_results = []
     unreachable_refs = []
-    for i, ref in enumerate(unique_publishers, start=1):
-        prompt = build_enriched_prompt(ref, "publisher_type")
-        if "The reference is unreachable" in prompt:
+    for i, ref, prompt, response in iter_responses(llm, unique_publishers,
+                                                   lambda ref: build_enriched_prompt(ref, "publisher_type"),
+                                                   batch_size):
+        if UNREACHABLE in prompt:
             unreachable_refs.append((ref, "unreachable"))
             print(f"⛔ Unreachable reference: {ref}")
             continue
-        response = llm.run_prompt(prompt)
         
         try:
+            if isinstance(response, Exception):
+                raise response
             if mode == "json":
                 label = json.loads(response)["label"]
             elif mode == "extract":
@@ -80,26 +129,37 @@ def predict_publisher_type(llm, unique_publishers, examples_publisher=None, mode
             print(f"⚠️ Skipped {ref} at index {i} due to error: {e}")
             continue
 
+        if agreement is not None:
+            agreement.update(ref, label)
+            if stop_when_stable and agreement.is_stable():
+                print(f"🛑 Agreement stable after {i}/{len(unique_publishers)} references: {agreement}")
+                break
+
         if i % 10 == 0 or i == len(unique_publishers):
             print(f"✅ Processed {i}/{len(unique_publishers)} references")
+            if agreement is not None:
+                print(f"📈 {agreement}")
 
     return publisher_results, unreachable_refs
 
 
 
 
-def predict_verification_type(llm, unique_verification, examples_verification=None, mode="json"):
+def predict_verification_type(llm, unique_verification, examples_verification=None, mode="json", agreement=None, stop_when_stable=False,
+                              batch_size=None):
     verification_results = []
     unreachable_refs = []
-    for i, ref in enumerate(unique_verification, start=1):
-        prompt = build_enriched_prompt(ref, "publisher_verification")
-        if "The reference is unreachable" in prompt:
+    for i, ref, prompt, response in iter_responses(llm, unique_verification,
+                                                   lambda ref: build_enriched_prompt(ref, "publisher_verification"),
+                                                   batch_size):
+        if UNREACHABLE in prompt:
             unreachable_refs.append((ref, "unreachable"))
             print(f"⛔ Unreachable reference: {ref}")
             continue
-        response = llm.run_prompt(prompt)
         
         try:
+            if isinstance(response, Exception):
+                raise response
             if mode == "json":
                 label = json.loads(response)["label"]
             elif mode == "extract":
@@ -114,8 +174,16 @@ def predict_verification_type(llm, unique_verification, examples_verification=No
             print(f"⚠️ Skipped {ref} at index {i} due to error: {e}")
             continue
 
+        if agreement is not None:
+            agreement.update(ref, label)
+            if stop_when_stable and agreement.is_stable():
+                print(f"🛑 Agreement stable after {i}/{len(unique_verification)} references: {agreement}")
+                break
+
         if i % 10 == 0 or i == len(unique_verification):
             print(f"✅ Processed {i}/{len(unique_verification)} references")
+            if agreement is not None:
+                print(f"📈 {agreement}")
 
     return verification_results, unreachable_refs
 
@@ -158,7 +226,8 @@ def save_all_results(model, prompt_id, author_results=None, publisher_results=No
 
 
 
-def predict_relevance(llm, reference_triples, examples=None, mode="json"):
+def predict_relevance(llm, reference_triples, examples=None, mode="json", agreement=None, stop_when_stable=False,
+                      batch_size=None):
     """
     Predicts relevance of references using an LLM.
 
@@ -167,21 +236,28 @@ def predict_relevance(llm, reference_triples, examples=None, mode="json"):
         reference_triples: List of (ref_url, item_label, property_label, value_label, item_id, stat_property, stat_value).
         examples: Unused for now, placeholder for few-shot.
         mode: 'json' if model returns clean JSON, 'extract' if response includes explanations before JSON.
+        agreement: Optional AgreementAccumulator (crowd labels keyed by ref_value) updated with every prediction.
+        stop_when_stable: Stop once agreement.is_stable(), i.e. Cohen's kappa no longer moves.
+        batch_size: Prompts sent concurrently (see iter_responses).
     """
     relevance_results = []
     unreachable_refs = []
 
-    for i, (ref_url, item_label, property_label, value_label, item_id, stat_property, stat_value) in enumerate(reference_triples, start=1):
-        prompt = build_relevance_prompt_from_ref(ref_url, item_label, property_label, value_label)
+    def build_prompt(triple):
+        ref_url, item_label, property_label, value_label = triple[:4]
+        return build_relevance_prompt_from_ref(ref_url, item_label, property_label, value_label)
 
-        if "The reference is unreachable" in prompt:
+    for i, triple, prompt, response in iter_responses(llm, reference_triples, build_prompt, batch_size):
+        ref_url, item_label, property_label, value_label, item_id, stat_property, stat_value = triple
+
+        if UNREACHABLE in prompt:
             unreachable_refs.append((ref_url, "unreachable"))
             print(f"⛔ Unreachable reference: {ref_url}")
             continue
 
-        response = llm.run_prompt(prompt)
-
         try:
+            if isinstance(response, Exception):
+                raise response
             if mode == "json":
                 label = json.loads(response)["label"]
             elif mode == "extract":
@@ -200,8 +276,16 @@ def predict_relevance(llm, reference_triples, examples=None, mode="json"):
             print(f"⚠️ Skipped {ref_url} at index {i} due to error: {e}")
             continue
 
+        if agreement is not None:
+            agreement.update(ref_url, label)
+            if stop_when_stable and agreement.is_stable():
+                print(f"🛑 Agreement stable after {i}/{len(reference_triples)} references: {agreement}")
+                break
+
         if i % 10 == 0 or i == len(reference_triples):
             print(f"✅ Processed {i}/{len(reference_triples)} references")
+            if agreement is not None:
+                print(f"📈 {agreement}")
 
     return relevance_results, unreachable_refs
 
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Training performance benchmark: fit time, predict time, peak RSS and serialized size of each model on synthetic
+and real feature matrices of several sizes. Every measurement runs in a fresh subprocess, so the peak RSS is
+that of one model only. Results are appended to a JSON-lines history and compared with the previous run.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from joblib import dump
+from sklearn import svm
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.naive_bayes import BernoulliNB
+
+from kernel_approximation import ApproxKernelSVC
+
+# same estimators and settings as model_trainer.py
+BENCHMARK_MODELS = {
+    'svm_model': lambda: svm.SVC(kernel='rbf', C=0.4, cache_size=1000, class_weight='balanced'),
+    'approx_svm_model': lambda: ApproxKernelSVC(n_components=500, C=0.4, class_weight='balanced'),
+    'linear_svm': lambda: svm.LinearSVC(C=0.5, class_weight='balanced'),
+    'rf_model': lambda: RandomForestClassifier(n_estimators=1000, max_depth=None, min_samples_split=3,
+                                               random_state=0),
+    'nb_model': lambda: BernoulliNB(),
+}
+# models trained on the densified matrix, as in model_trainer.py
+DENSE_MODELS = ['nb_model']
+# relative increase over the previous run that is reported as a regression
+TRACKED = ['fit_time', 'predict_time', 'peak_rss_mb', 'model_size_mb']
+TIMINGS = ['fit_time', 'predict_time']
+
+
+def synthetic_features(n_rows, n_features=20000, density=0.002, random_state=0):
+    # TF-IDF-like sparse matrix with 4 dense count columns, labels from a noisy linear rule
+    rng = np.random.RandomState(random_state)
+    X_text = sp.random(n_rows, n_features, density=density, format='csr', random_state=rng)
+    counts = rng.poisson(5, size=(n_rows, 4)).astype(float)
+    X_data = sp.hstack((X_text, counts), format='csr')
+    weights = rng.normal(size=X_data.shape[1])
+    score = X_data.dot(weights) + rng.normal(scale=0.5, size=n_rows)
+    return X_data, (score > np.median(score)).astype(int)
+
+
+def real_features(train_data, target):
+    from data_preprocessing import build_features
+    features = build_features(train_data)
+    return features['X_data'], features['train_df'][target].values
+
+
+def subsample(X_data, y, n, random_state=53):
+    if n >= X_data.shape[0]:
+        return X_data, y
+    index, _ = train_test_split(np.arange(X_data.shape[0]), train_size=n, stratify=y, random_state=random_state)
+    return X_data[index], y[index]
+
+
+def peak_rss_mb():
+    # VmHWM belongs to the new address space, whereas Linux carries ru_maxrss over from the parent across exec
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0
+
+
+def measure(model, matrix_path, work_dir, repeats=3):
+    # runs inside the worker subprocess; the timings are the median of the repeats
+    X_data = sp.load_npz(matrix_path)
+    y = np.load(matrix_path.replace('.npz', '_y.npy'))
+    X_train, X_test, y_train, y_test = train_test_split(X_data, y, test_size=0.3, random_state=53)
+    if model in DENSE_MODELS:
+        X_train = X_train.toarray()
+        X_test = X_test.toarray()
+    rss_before = peak_rss_mb()
+
+    fit_times = []
+    predict_times = []
+    for _ in range(int(repeats)):
+        clf = BENCHMARK_MODELS[model]()
+        start = time.time()
+        clf.fit(X_train, y_train)
+        fit_times.append(time.time() - start)
+        start = time.time()
+        clf.predict(X_test)
+        predict_times.append(time.time() - start)
+    fit_time = float(np.median(fit_times))
+    predict_time = float(np.median(predict_times))
+
+    model_path = os.path.join(work_dir, '{}.joblib'.format(model))
+    dump(clf, model_path)
+    model_size = os.path.getsize(model_path) / (1024.0 * 1024.0)
+    os.remove(model_path)
+    return {'fit_time': fit_time, 'predict_time': predict_time, 'rss_before_mb': rss_before,
+            'peak_rss_mb': peak_rss_mb(), 'model_size_mb': model_size}
+
+
+def run_measurement(model, matrix_path, work_dir, timeout=None, repeats=3):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', model, matrix_path, work_dir, str(repeats)]
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)), universal_newlines=True)
+    except subprocess.TimeoutExpired:
+        return {'error': 'timeout after {}s'.format(timeout)}
+    if process.returncode != 0:
+        print(process.stderr)
+        return {'error': process.stderr.strip().splitlines()[-1] if process.stderr.strip() else 'failed'}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], universal_newlines=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(models, sizes, datasets, train_data=None, target='authoritative', timeout=None, repeats=3):
+    """
+    Measures every model on every dataset ('synthetic', 'real') subsampled to every size.
+    Returns one record per measurement.
+    """
+    run = {'run_id': datetime.datetime.now().strftime('%Y%m%dT%H%M%S'),
+           'commit': git_commit(),
+           'host': platform.node(),
+           'python': platform.python_version(),
+           'repeats': repeats}
+    work_dir = tempfile.mkdtemp(prefix='benchmark_')
+    records = []
+    try:
+        for dataset in datasets:
+            if dataset == 'real':
+                X_full, y_full = real_features(train_data, target)
+            else:
+                X_full, y_full = synthetic_features(max(sizes))
+            for n in sizes:
+                X_data, y = subsample(X_full, y_full, n)
+                matrix_path = os.path.join(work_dir, '{}_{}.npz'.format(dataset, n))
+                sp.save_npz(matrix_path, sp.csr_matrix(X_data), compressed=False)
+                np.save(matrix_path.replace('.npz', '_y.npy'), y)
+                for model in models:
+                    record = dict(run)
+                    record.update({'dataset': dataset, 'model': model, 'n': int(X_data.shape[0]),
+                                   'n_features': int(X_data.shape[1])})
+                    record.update(run_measurement(model, matrix_path, work_dir, timeout, repeats))
+                    print("{dataset} n:{n} {model}: ".format(**record) + "; ".join(
+                        "{}:{}".format(k, record[k]) for k in TRACKED + ['error'] if k in record))
+                    records.append(record)
+    finally:
+        shutil.rmtree(work_dir)
+    return records
+
+
+def append_history(records, history_file):
+    directory = os.path.dirname(history_file)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(history_file, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def previous_run(history_file, run_id):
+    if not os.path.exists(history_file):
+        return pd.DataFrame()
+    history = pd.read_json(history_file, lines=True, dtype={'run_id': str})
+    older = history[history['run_id'] < run_id]
+    if older.empty:
+        return older
+    return older[older['run_id'] == older['run_id'].max()]
+
+
+def find_regressions(records, previous, tolerance=0.2, min_time=0.05):
+    # a metric regresses when it grows by more than tolerance over the same (dataset, model, n) of the last run;
+    # timings below min_time seconds are dominated by noise and never reported
+    if previous.empty:
+        return []
+    keys = ['dataset', 'model', 'n']
+    current = pd.DataFrame(records)
+    merged = current.merge(previous, on=keys, suffixes=('', '_previous'))
+    regressions = []
+    for _, row in merged.iterrows():
+        for metric in TRACKED:
+            before = row.get(metric + '_previous')
+            after = row.get(metric)
+            if metric in TIMINGS and pd.notnull(after) and after < min_time:
+                continue
+            if pd.notnull(before) and pd.notnull(after) and before > 0 and after > before * (1 + tolerance):
+                regressions.append({'dataset': row['dataset'], 'model': row['model'], 'n': row['n'],
+                                    'metric': metric, 'previous': before, 'current': after,
+                                    'change': after / before - 1})
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Training performance benchmark')
+    parser.add_argument('--models', nargs='+', choices=sorted(BENCHMARK_MODELS),
+                        default=['svm_model', 'linear_svm', 'rf_model', 'nb_model'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--datasets', nargs='+', choices=['synthetic', 'real'], default=['synthetic', 'real'])
+    parser.add_argument('--train_data', default='./results/prediction_data.csv',
+                        help='Train dataset path of the real feature matrix')
+    parser.add_argument('--target', default='authoritative', choices=['authoritative', 'support_object'])
+    parser.add_argument('--history', default='./results/benchmark_history.jsonl',
+                        help='JSON-lines file the measurements are appended to')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative increase over the previous run reported as a regression')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Fits per measurement, the median time is kept')
+    parser.add_argument('--min_time', type=float, default=0.05,
+                        help='Timings below this many seconds are not compared')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Seconds after which a single measurement is abandoned')
+    parser.add_argument('--fail_on_regression', action='store_true',
+                        help='Exit with status 1 when a regression is found')
+    return parser.parse_args()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        print(json.dumps(measure(*sys.argv[2:6])))
+        return
+    args = parse_args()
+    records = run_benchmark(args.models, args.sizes, args.datasets, args.train_data, args.target, args.timeout,
+                            args.repeats)
+    previous = previous_run(args.history, records[0]['run_id']) if records else pd.DataFrame()
+    append_history(records, args.history)
+    regressions = find_regressions(records, previous, args.tolerance, args.min_time)
+    for r in regressions:
+        print("REGRESSION {dataset} n:{n} {model} {metric}: {previous:.3f} -> {current:.3f} (+{change:.0%})".format(
+            **r))
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
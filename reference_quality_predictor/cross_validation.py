@@ -0,0 +1,65 @@
+import time
+
+from joblib import Parallel, delayed
+from scipy.sparse import issparse
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold
+
+from data_preprocessing import reduce_features
+
+
+def prediction_scores(clf, X):
+    # positive-class score stored next to the predictions: probability, else decision value, else the label
+    if hasattr(clf, 'predict_proba'):
+        return clf.predict_proba(X)[:, 1]
+    if hasattr(clf, 'decision_function'):
+        return clf.decision_function(X)
+    return clf.predict(X)
+
+
+def fit_fold(clf, reducer, X_data, y, train_index, test_index, dense=False, return_estimator=False,
+             return_score=False):
+    # every fold works on its own clone, so folds can run in separate processes
+    X_train, X_test = X_data[train_index], X_data[test_index]
+    y_train, y_test = y.iloc[train_index], y.iloc[test_index]
+    reducer, X_train, X_test = reduce_features(reducer, X_train, y_train, X_test)
+    if dense and issparse(X_train):
+        X_train = X_train.toarray()
+        X_test = X_test.toarray()
+
+    clf = clone(clf)
+    start = time.time()
+    clf.fit(X_train, y_train)
+    fit_time = time.time() - start
+    start = time.time()
+    predicted = clf.predict(X_test)
+    predict_time = time.time() - start
+
+    fold = {'test_index': test_index,
+            'predicted': predicted,
+            'expected': y_test,
+            'fit_time': fit_time,
+            'predict_time': predict_time,
+            'feature_importances': getattr(clf, 'feature_importances_', None),
+            'reducer': reducer}
+    if return_score:
+        fold['score'] = prediction_scores(clf, X_test)
+    if return_estimator:
+        fold['clf'] = clf
+    return fold
+
+
+def run_folds(clf, X_data, y, reducer=None, dense=False, n_splits=10, n_jobs=1, return_score=False,
+              random_state=None):
+    """
+    Runs a stratified k-fold evaluation of clf, one process per fold.
+    The feature matrix is memory-mapped by joblib and shared with the workers. Results are returned in fold
+    order; only the estimator of the last fold is sent back (to be dumped by the caller).
+    With random_state=None the folds differ on every run.
+    """
+    crossvalidation = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    splits = list(crossvalidation.split(X_data, y))
+    return Parallel(n_jobs=n_jobs)(
+        delayed(fit_fold)(clf, reducer, X_data, y, train_index, test_index, dense,
+                          return_estimator=(i == len(splits) - 1), return_score=return_score)
+        for i, (train_index, test_index) in enumerate(splits))
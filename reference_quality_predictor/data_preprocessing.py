@@ -1,11 +1,23 @@
+import numpy as np
 import pandas as pd
 import scipy as sp
+from sklearn.base import clone
+from sklearn.decomposition import TruncatedSVD
 from sklearn.feature_extraction import DictVectorizer
 from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_selection import SelectKBest, chi2, mutual_info_classif
 from sklearn.model_selection import train_test_split
 
+REDUCTION_METHODS = ['chi2', 'mutual_info', 'svd']
+# columns densified at a time when scoring the mutual information
+MI_BLOCK_SIZE = 1000
 
-def dataset_preprocess(prediction_column, train_data, test_data, cv=False):
+
+def build_features(train_data, test_data=None):
+    """
+    Fits the item/object TF-IDF and property vectorizers on the training set and builds the feature matrices.
+    Nothing here depends on the prediction column, so the result can be shared by every model and target.
+    """
     # train_data = os.path.realpath('./results/train_set_references.csv')
     # train_data = '/Users/alessandro/Documents/WD_references_analysis/results/prediction_data.csv'
     # train_df = pd.read_csv(train_data, sep='\t', header=0)
@@ -37,33 +49,110 @@ def dataset_preprocess(prediction_column, train_data, test_data, cv=False):
     data_columns = column_names_from_item_features + column_names_from_object_features + vec.feature_names_ + [
         'user_edits', 'user_ref_edits_p',
         'url_use', 'domain_use']
+    vectorizers = {'item_vectorizer': item_vectorizer,
+                   'object_vectorizer': object_vectorizer,
+                   'dict_vectorizer': vec}
+
+    X_test = None
+    test_df = None
+    if test_data:
+        test_df = pd.read_csv(test_data, sep='\t')
+        X_test = transform_features(test_df, vectorizers)
+        print(X_test.shape)
+
+    return {'X_data': X_data,
+            'X_test': X_test,
+            'train_df': train_df,
+            'test_df': test_df,
+            'data_columns': data_columns,
+            'vectorizers': vectorizers}
+
+
+def transform_features(df, vectorizers):
+    # same column layout as build_features, using vectorizers fitted on the training set
+    item_vec = vectorizers['item_vectorizer'].transform(df['item_text_clean'])
+    object_vec = vectorizers['object_vectorizer'].transform(df['object_text'])
+    vec_features = vectorizers['dict_vectorizer'].transform(df[['stat_property',
+                                                                'user_type',
+                                                                'code_2']].to_dict(orient='records')).toarray()
+    return sp.sparse.hstack((item_vec,
+                             object_vec, vec_features,
+                             df[['user_edits', 'user_ref_edits_pc', 'ref_count', 'domain_count']].values),
+                            format='csr')
+
+
+def dataset_preprocess(prediction_column, train_data, test_data, cv=False, features=None):
+    # features built once by build_features can be passed in to skip the featurization
+    if features is None:
+        features = build_features(train_data, test_data if not cv else None)
+    X_data = features['X_data']
+    train_df = features['train_df']
+    data_columns = features['data_columns']
+    vectorizers = dict(features['vectorizers'])
 
     if cv:
         y = train_df[prediction_column]
 
-        return X_data, y, data_columns
+        return X_data, y, data_columns, vectorizers
     else:
         # prediction_column = raw_input('Type authoritative or support_object:\n')
         if test_data:
-            test_df = pd.read_csv(test_data, sep='\t')
-            item_vec_test = item_vectorizer.transform(test_df['item_text_clean'])
-            object_vec_test = object_vectorizer.transform(test_df['object_text'])
-            vec_features_test = vec.transform(test_df[['stat_property',
-                                                       'user_type',
-                                                       'code_2']].to_dict(orient='records')).toarray()
-            X_test = sp.sparse.hstack((item_vec_test,
-                                       object_vec_test, vec_features_test,
-                                       test_df[['user_edits', 'user_ref_edits_pc', 'ref_count', 'domain_count']].values),
-                                      format='csr')
-            print(X_test.shape)
-
             y_train = train_df[prediction_column]
-            y_test = test_df[prediction_column]
+            y_test = features['test_df'][prediction_column]
 
-            return X_data, X_test, y_train, y_test, data_columns
+            return X_data, features['X_test'], y_train, y_test, data_columns, vectorizers
 
         X_train, X_test, y_train, y_test = train_test_split(X_data, train_df[prediction_column],
                                                             test_size=0.3,
                                                             random_state=53)
 
-        return X_train, X_test, y_train, y_test, data_columns
+        return X_train, X_test, y_train, y_test, data_columns, vectorizers
+
+
+def continuous_mutual_info(X, y, block_size=MI_BLOCK_SIZE):
+    # the tf-idf weights and counts are continuous: mutual_info_classif would treat sparse input as discrete
+    # ('auto') and refuses continuous features on a sparse matrix, so the columns are scored densified by blocks
+    if sp.sparse.issparse(X):
+        X = sp.sparse.csc_matrix(X)
+    scores = []
+    for start in range(0, X.shape[1], block_size):
+        block = X[:, start:start + block_size]
+        block = block.toarray() if sp.sparse.issparse(block) else np.asarray(block)
+        scores.append(mutual_info_classif(block, y, discrete_features=False, random_state=0))
+    return np.concatenate(scores)
+
+
+def feature_reducer(method, n_components=1000):
+    # supervised top-k selection or unsupervised projection; None keeps all columns
+    if method is None:
+        return None
+    if method == 'chi2':
+        return SelectKBest(chi2, k=n_components)
+    if method == 'mutual_info':
+        return SelectKBest(continuous_mutual_info, k=n_components)
+    if method == 'svd':
+        return TruncatedSVD(n_components=n_components, random_state=0)
+    raise ValueError('Unknown reduction method: {}'.format(method))
+
+
+def reduce_features(reducer, X_train, y_train, X_test=None):
+    # the reducer is cloned and fitted on the training fold only, so test rows never leak into the selection
+    if reducer is None:
+        return None, X_train, X_test
+    reducer = clone(reducer)
+    if isinstance(reducer, SelectKBest):
+        reducer.set_params(k=min(reducer.k, X_train.shape[1]))
+    else:
+        reducer.set_params(n_components=min(reducer.n_components, X_train.shape[1] - 1))
+    X_train = reducer.fit_transform(X_train, y_train)
+    if X_test is not None:
+        X_test = reducer.transform(X_test)
+    return reducer, X_train, X_test
+
+
+def reduced_columns(reducer, data_columns):
+    if reducer is None:
+        return data_columns
+    if isinstance(reducer, SelectKBest):
+        return [data_columns[i] for i in reducer.get_support(indices=True)]
+    return ['svd_{}'.format(i) for i in range(reducer.n_components)]
@@ -4,7 +4,7 @@ import  json
 import re
 import chardet
 
-from label_extractor import get_item_label
+from label_extractor import default_resolver
 
 
 def claim_maker(line):
@@ -187,10 +187,12 @@ def fix_encoding(text):
 
 
 
-# add subject and object labels
-posts['item_label'] = posts['item_id'].apply(lambda x: get_item_label(x))
+# add subject and object labels, all the distinct ids resolved in batches ($LABEL_INDEX offline, else $LABEL_CACHE)
+resolver = default_resolver()
+resolver.resolve(list(posts['item_id']) + list(posts['stat_value']))
+posts['item_label'] = resolver.labels(posts['item_id'])
 
-posts['stat_value_label'] = posts['stat_value'].apply(lambda x: get_item_label(x))
+posts['stat_value_label'] = resolver.labels(posts['stat_value'])
 posts.stat_value_label = posts['stat_value_label'].apply(lambda x: clean_dates(x))
 posts['item_labels'] = posts['item_labels'].apply(lambda x: fix_encoding(x))
 posts['item_labels'] = posts['item_labels'].apply(lambda x: x.replace('"', ''))
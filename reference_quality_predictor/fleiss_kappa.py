@@ -3,120 +3,132 @@
 Created on May 15 2017
 
 @author: Alessandro
+
+Inter-rater agreement of the crowdsourcing tasks. Every task is described by a spec (annotation file, unit column,
+label column, categories); the units x categories count matrix is built in one pass and Fleiss' kappa,
+Randolph's free-marginal kappa and Krippendorff's alpha are computed from it. Tasks run in parallel.
 """
 
+import argparse
+import json
+
+import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed
 
 from metrics import computeFleissKappa
 
+TASKS = {
+    'T1': {'file': '~/Documents/PhD/relevance_results_new.csv',
+           'unit': 'X_unit_id',
+           'label': 'response',
+           'categories': ['yes', 'no', 'no_item', 'nw_item', 'no_property', 'ne_item']},
+    'T2': {'file': '~/Documents/PhD/author_all_new.csv',
+           'unit': 'ref_value',
+           'label': 'author_type',
+           'categories': ['organisation', 'collective', 'nw', 'individual', 'ne', 'dn']},
+    'T3.A': {'file': '~/Documents/PhD/publisher_all_new.csv',
+             'unit': 'domain',
+             'label': 'publisher_type',
+             'categories': ['news', 'company', 'nw', 'sp_source', 'academia', 'other', 'govt', 'ne']},
+    'T3.B': {'file': '~/Documents/PhD/publisher_verify_full_new.csv',
+             'unit': 'domain',
+             'label': 'results',
+             'categories': ['vendor', 'no_profit', 'nw', 'cultural', 'political', 'non_trad_news', 'academia_pub',
+                            'trad_news', 'academia_uni', 'academia_other', 'ne', 'no', 'yes']},
+}
+
+
+def count_matrix(df, unit, label, categories):
+    """
+    Units x categories rating counts in one bincount. Labels outside categories and rows without a unit are not
+    counted. Returns the unit values and the count matrix.
+    """
+    codes = pd.Categorical(df[label], categories=categories).codes.astype(np.int64)
+    # a missing unit would be factorized to -1, as groupby does those rows are left out
+    rated = (codes >= 0) & df[unit].notnull().values
+    unit_codes, units = pd.factorize(df[unit][rated], sort=True)
+    k = len(categories)
+    counts = np.bincount(unit_codes * k + codes[rated], minlength=len(units) * k).reshape(len(units), k)
+    return units, counts
+
+
+def randolph_kappa(mat):
+    # free-marginal kappa: chance agreement is 1/k whatever the label distribution
+    mat = np.asarray(mat, dtype=np.int64)
+    n = mat[0].sum()
+    k = mat.shape[1]
+    Pbar = (((mat * mat).sum(axis=1) - n) / float(n * (n - 1))).mean()
+    return (Pbar - 1.0 / k) / (1 - 1.0 / k)
+
+
+def krippendorff_alpha(mat):
+    """
+    Krippendorff's alpha for nominal data from a units x categories count matrix.
+    Units may have any number of ratings; units with fewer than 2 are not pairable and are ignored.
+    """
+    mat = np.asarray(mat, dtype=np.int64)
+    m = mat.sum(axis=1)
+    mat, m = mat[m >= 2], m[m >= 2]
+    if len(m) == 0:
+        return float('nan')
+    # diagonal of the coincidence matrix and the category totals of the pairable values
+    o_cc = ((mat * (mat - 1)).sum(axis=1) / (m - 1.0)).sum()
+    n_c = mat.sum(axis=0).astype(np.float64)
+    n = n_c.sum()
+    expected = n * n - (n_c * n_c).sum()
+    if expected == 0:
+        return float('nan')
+    return 1 - (n - 1) * (n - o_cc) / expected
+
+
+def task_agreement(name, spec, raters=5):
+    """
+    Agreement of one task. Fleiss' and Randolph's kappa use the units with exactly `raters` ratings,
+    as in the original analysis; Krippendorff's alpha uses every unit.
+    """
+    df = pd.read_csv(spec['file'], usecols=[spec['unit'], spec['label']])
+    units, counts = count_matrix(df, spec['unit'], spec['label'], spec['categories'])
+    complete = counts.sum(axis=1) == raters
+    fixed = counts[complete]
+    return {'task': name,
+            'units': len(units),
+            'complete_units': int(complete.sum()),
+            'dropped_units': int((~complete).sum()),
+            'fleiss_kappa': computeFleissKappa(fixed) if len(fixed) else float('nan'),
+            'randolph_kappa': float(randolph_kappa(fixed)) if len(fixed) else float('nan'),
+            'krippendorff_alpha': float(krippendorff_alpha(counts))}
+
+
+def run_tasks(tasks, raters=5, n_jobs=-1):
+    return Parallel(n_jobs=n_jobs)(delayed(task_agreement)(name, spec, raters) for name, spec in tasks.items())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Inter-rater agreement of the crowdsourcing tasks')
+    parser.add_argument('--spec', default=None,
+                        help='JSON file of task specs {name: {file, unit, label, categories}} (default: T1-T3.B)')
+    parser.add_argument('--tasks', nargs='+', default=None, help='Subset of the tasks to run')
+    parser.add_argument('--raters', type=int, default=5,
+                        help="Number of ratings a unit needs for Fleiss' and Randolph's kappa")
+    parser.add_argument('--n_jobs', type=int, default=-1)
+    parser.add_argument('--output', default=None, help='CSV file for the agreement table')
+    return parser.parse_args()
 
-###T1
 
 def main():
-    file_name = '~/Documents/PhD/relevance_results_new.csv'
-
-    file_pd = pd.read_csv(file_name)
-
-    grouped = file_pd.groupby('X_unit_id')
-    ratings = []
-    fleiss_ratings = []
-    for group in grouped:
-        ratings.append(len(group[1][group[1]['response'] == 'yes']))
-        ratings.append(len(group[1][group[1]['response'] == 'no']))
-        ratings.append(len(group[1][group[1]['response'] == 'no_item']))
-        ratings.append(len(group[1][group[1]['response'] == 'nw_item']))
-        ratings.append(len(group[1][group[1]['response'] == 'no_property']))
-        ratings.append(len(group[1][group[1]['response'] == 'ne_item']))
-        if sum(ratings) == 5:
-            fleiss_ratings.append(ratings)
-        else:
-            print(ratings)
-        ratings = []
-
-    T1_fleiss = computeFleissKappa(fleiss_ratings)
-    print(T1_fleiss)
-
-    ###T2
-    file_name = '~/Documents/PhD/author_all_new.csv'
-
-    file_pd = pd.read_csv(file_name)
-
-    grouped = file_pd.groupby('ref_value')
-    ratings = []
-    fleiss_ratings = []
-    for group in grouped:
-        ratings.append(len(group[1][group[1]['author_type'] == 'organisation']))
-        ratings.append(len(group[1][group[1]['author_type'] == 'collective']))
-        ratings.append(len(group[1][group[1]['author_type'] == 'nw']))
-        ratings.append(len(group[1][group[1]['author_type'] == 'individual']))
-        ratings.append(len(group[1][group[1]['author_type'] == 'ne']))
-        ratings.append(len(group[1][group[1]['author_type'] == 'dn']))
-        if sum(ratings) == 5:
-            fleiss_ratings.append(ratings)
-        else:
-            print(ratings)
-        ratings = []
-
-    T2_fleiss = computeFleissKappa(fleiss_ratings)
-    print(T2_fleiss)
-
-    ###T3.A
-    file_name = '~/Documents/PhD/publisher_all_new.csv'
-
-    file_pd = pd.read_csv(file_name)
-
-    grouped = file_pd.groupby('domain')
-    ratings = []
-    fleiss_ratings = []
-    for group in grouped:
-        ratings.append(len(group[1][group[1]['publisher_type'] == 'news']))
-        ratings.append(len(group[1][group[1]['publisher_type'] == 'company']))
-        ratings.append(len(group[1][group[1]['publisher_type'] == 'nw']))
-        ratings.append(len(group[1][group[1]['publisher_type'] == 'sp_source']))
-        ratings.append(len(group[1][group[1]['publisher_type'] == 'academia']))
-        ratings.append(len(group[1][group[1]['publisher_type'] == 'other']))
-        ratings.append(len(group[1][group[1]['publisher_type'] == 'govt']))
-        ratings.append(len(group[1][group[1]['publisher_type'] == 'ne']))
-        if sum(ratings) == 5:
-            fleiss_ratings.append(ratings)
-        else:
-            print(ratings)
-        ratings = []
-
-    T3A_fleiss = computeFleissKappa(fleiss_ratings)
-    print(T3A_fleiss)
-
-    ###T3.b
-
-    file_name = '~/Documents/PhD/publisher_verify_full_new.csv'
-
-    file_pd = pd.read_csv(file_name)
-
-    grouped = file_pd.groupby('domain')
-    ratings = []
-    fleiss_ratings = []
-    for group in grouped:
-        ratings.append(len(group[1][group[1]['results'] == 'vendor']))
-        ratings.append(len(group[1][group[1]['results'] == 'no_profit']))
-        ratings.append(len(group[1][group[1]['results'] == 'nw']))
-        ratings.append(len(group[1][group[1]['results'] == 'cultural']))
-        ratings.append(len(group[1][group[1]['results'] == 'political']))
-        ratings.append(len(group[1][group[1]['results'] == 'non_trad_news']))
-        ratings.append(len(group[1][group[1]['results'] == 'academia_pub']))
-        ratings.append(len(group[1][group[1]['results'] == 'trad_news']))
-        ratings.append(len(group[1][group[1]['results'] == 'academia_uni']))
-        ratings.append(len(group[1][group[1]['results'] == 'academia_other']))
-        ratings.append(len(group[1][group[1]['results'] == 'ne']))
-        ratings.append(len(group[1][group[1]['results'] == 'no']))
-        ratings.append(len(group[1][group[1]['results'] == 'yes']))
-        if sum(ratings) == 5:
-            fleiss_ratings.append(ratings)
-        else:
-            print(ratings)
-        ratings = []
-
-    T3B_fleiss = computeFleissKappa(fleiss_ratings)
-    print(T3B_fleiss)
+    args = parse_args()
+    tasks = TASKS
+    if args.spec:
+        with open(args.spec) as f:
+            tasks = json.load(f)
+    if args.tasks:
+        tasks = dict((name, tasks[name]) for name in args.tasks)
+
+    results = pd.DataFrame(run_tasks(tasks, args.raters, args.n_jobs))
+    print(results.to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Compiles a fitted RandomForestClassifier into flat node arrays and scores many rows against all the trees at
+once with numpy. The probabilities (and therefore the predictions) are identical to forest.predict_proba.
+Without sklearn's per-tree dispatch, small batches are scored about 10x faster; for large batches of deep trees
+sklearn's compiled traversal remains faster, so the scoring service only uses it up to a batch size.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from scipy.sparse import issparse
+
+TREE_LEAF = -1
+
+
+def float32_thresholds(thresholds):
+    # sklearn compares float32 features with float64 thresholds; for a float32 x, x <= t holds exactly when
+    # x <= the largest float32 not above t, so the thresholds are rounded down rather than to nearest
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    rounded = thresholds.astype(np.float32)
+    above = rounded.astype(np.float64) > thresholds
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+class FlatForest(object):
+    """
+    All the nodes of all the trees in contiguous arrays, indexed by global node id:
+    split[node] holds the feature (renumbered over the columns the forest actually uses) and the float32
+    threshold bits, children[2 * node] / children[2 * node + 1] the left / right child, stored as ~id when the
+    child is a leaf, and value[leaf] the class probabilities of the leaf.
+    """
+
+    def __init__(self, split, children, value, roots, used_features, classes, max_depth):
+        self.split = split
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.used_features = used_features
+        self.classes_ = classes
+        self.max_depth = max_depth
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def leaves(self, X):
+        # global leaf id reached by every (row, tree) pair; only the pairs still at an internal node move down
+        n_rows, n_columns = X.shape
+        X_flat = np.ascontiguousarray(X).ravel()
+        index_type = np.int32 if X_flat.size < np.iinfo(np.int32).max else np.int64
+        nodes = np.tile(self.roots, n_rows)
+        pairs = np.flatnonzero(nodes >= 0)
+        current = nodes[pairs]
+        row_start = (pairs // self.n_trees * n_columns).astype(index_type)
+        while len(pairs):
+            split = self.split[current]
+            go_right = X_flat[row_start + split[:, 0]] > split[:, 1].view(np.float32)
+            current = self.children[2 * current + go_right]
+            done = current < 0
+            if done.any():
+                nodes[pairs[done]] = current[done]
+                moving = ~done
+                pairs, current, row_start = pairs[moving], current[moving], row_start[moving]
+        return ~nodes.reshape(n_rows, self.n_trees)
+
+    def used_columns(self, X):
+        # only the used columns are densified, as float32 like sklearn's own input validation
+        if issparse(X):
+            return X.tocsc()[:, self.used_features].toarray().astype(np.float32)
+        return np.asarray(X)[:, self.used_features].astype(np.float32)
+
+    def predict_proba(self, X, batch_size=1000):
+        probas = []
+        for start in range(0, X.shape[0], batch_size):
+            X_used = self.used_columns(X[start:start + batch_size])
+            leaf_values = self.value[self.leaves(X_used)]
+            # trees are added one after the other, in the same order and precision as sklearn
+            proba = np.cumsum(leaf_values, axis=1)[:, -1]
+            probas.append(proba / self.n_trees)
+        if not probas:
+            return np.zeros((0, len(self.classes_)))
+        return np.vstack(probas)
+
+    def predict(self, X, batch_size=1000):
+        return self.classes_.take(np.argmax(self.predict_proba(X, batch_size), axis=1), axis=0)
+
+    def save(self, path):
+        np.savez(path, split=self.split, children=self.children, value=self.value, roots=self.roots,
+                 used_features=self.used_features, classes=self.classes_, max_depth=np.array(self.max_depth))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        arrays = np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+        return cls(arrays['split'], arrays['children'], arrays['value'], arrays['roots'], arrays['used_features'],
+                   arrays['classes'], int(arrays['max_depth']))
+
+
+def compile_forest(forest):
+    """
+    Flattens the trees of a fitted RandomForestClassifier (single output) into a FlatForest.
+    """
+    if forest.n_outputs_ != 1:
+        raise ValueError('Only single-output forests can be compiled')
+    trees = [estimator.tree_ for estimator in forest.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+    used_features = np.unique(np.concatenate([tree.feature[tree.feature >= 0] for tree in trees]))
+    column = np.full(forest.n_features_in_, -1, dtype=np.int32)
+    column[used_features] = np.arange(len(used_features), dtype=np.int32)
+
+    splits, children, roots, values = [], [], [], []
+    for offset, tree in zip(offsets, trees):
+        leaf = tree.children_left == TREE_LEAF
+        node_ids = np.arange(tree.node_count, dtype=np.int64) + offset
+        split = np.zeros((tree.node_count, 2), dtype=np.int32)
+        split[:, 0] = np.where(leaf, 0, column[np.maximum(tree.feature, 0)])
+        split[:, 1] = float32_thresholds(np.where(leaf, 0.0, tree.threshold)).view(np.int32)
+        splits.append(split)
+        # leaves are encoded as ~id, so finished (row, tree) pairs are recognised without another lookup
+        encoded = np.where(leaf, ~node_ids, node_ids)
+        child = np.zeros((tree.node_count, 2), dtype=np.int64)
+        child[~leaf, 0] = encoded[tree.children_left[~leaf]]
+        child[~leaf, 1] = encoded[tree.children_right[~leaf]]
+        children.append(child.ravel())
+        roots.append(encoded[0])
+        # same normalisation as DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(value / normalizer)
+
+    index_type = np.int32 if offsets[-1] < np.iinfo(np.int32).max else np.int64
+    return FlatForest(np.concatenate(splits), np.concatenate(children).astype(index_type), np.concatenate(values),
+                      np.array(roots, dtype=index_type), used_features.astype(np.int32), np.asarray(forest.classes_),
+                      max(tree.max_depth for tree in trees))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compile the RF of a model bundle and compare it with sklearn')
+    parser.add_argument('--bundle', required=True, help='Model bundle directory, e.g. bundles/rf_model_authoritative')
+    parser.add_argument('--data', required=True, help='Tab-separated references to score')
+    parser.add_argument('--output', default=None, help='Where to save the compiled forest (.npz)')
+    return parser.parse_args()
+
+
+def main():
+    import pandas as pd
+    from data_preprocessing import transform_features
+    from model_bundle import load_bundle
+
+    args = parse_args()
+    bundle = load_bundle(args.bundle)
+    forest = bundle['model']
+    X = transform_features(pd.read_csv(args.data, sep='\t'), bundle['vectorizers'])
+    if bundle['vectorizers'].get('reducer') is not None:
+        X = bundle['vectorizers']['reducer'].transform(X)
+
+    start = time.time()
+    flat = compile_forest(forest)
+    print('compiled {} trees, {} nodes, {} used features in {:.3f}s'.format(
+        flat.n_trees, len(flat.split), len(flat.used_features), time.time() - start))
+    start = time.time()
+    expected = forest.predict_proba(X)
+    sklearn_time = time.time() - start
+    start = time.time()
+    proba = flat.predict_proba(X)
+    flat_time = time.time() - start
+    print('sklearn: {:.3f}s; flat: {:.3f}s; identical: {}'.format(sklearn_time, flat_time,
+                                                                  np.array_equal(expected, proba)))
+    if args.output:
+        flat.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
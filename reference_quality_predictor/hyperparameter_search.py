@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Successive-halving hyperparameter search over the models of model_trainer.py.
+All candidates of a round are fitted in parallel processes on growing subsamples of the same feature matrix,
+which is built once per run; only the best third of the candidates goes on to the next round.
+"""
+
+import argparse
+import json
+import time
+
+import pandas as pd
+from scipy.sparse import issparse
+from sklearn import svm
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.metrics import make_scorer, matthews_corrcoef
+from sklearn.model_selection import HalvingGridSearchCV, StratifiedKFold
+from sklearn.naive_bayes import BernoulliNB
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+from data_preprocessing import build_features, feature_reducer, REDUCTION_METHODS
+from kernel_approximation import ApproxKernelSVC
+
+# estimator with the defaults of model_trainer.py, and the grid searched around them
+PARAM_GRIDS = {
+    'svm': (lambda: svm.SVC(kernel='rbf', C=0.4, cache_size=1000, class_weight='balanced'),
+            {'C': [0.1, 0.4, 1.0, 4.0],
+             'gamma': ['scale', 0.01, 0.1]}),
+    'approx_svm': (lambda: ApproxKernelSVC(n_components=500, C=0.4, class_weight='balanced'),
+                   {'kernel_approximation': ['nystroem', 'rff'],
+                    'n_components': [300, 1000],
+                    'C': [0.1, 0.4, 1.0]}),
+    'linear_svm': (lambda: svm.LinearSVC(C=0.5, class_weight='balanced'),
+                   {'C': [0.01, 0.1, 0.5, 1.0, 5.0]}),
+    'rf': (lambda: RandomForestClassifier(n_estimators=1000, max_depth=None, min_samples_split=3, random_state=0),
+           {'n_estimators': [300, 1000],
+            'min_samples_split': [2, 3, 5],
+            'max_features': ['sqrt', 'log2']}),
+    'hgb': (lambda: HistGradientBoostingClassifier(max_iter=500, early_stopping=True, validation_fraction=0.1,
+                                                   n_iter_no_change=10, class_weight='balanced', random_state=0),
+            {'learning_rate': [0.05, 0.1, 0.2],
+             'max_leaf_nodes': [15, 31, 63],
+             'l2_regularization': [0.0, 1.0]}),
+    'nb': (lambda: BernoulliNB(),
+           {'alpha': [0.01, 0.1, 1.0],
+            'binarize': [0.0, 0.5]}),
+}
+
+
+def to_dense(X):
+    # module level, so the pipeline can be sent to the worker processes
+    return X.toarray() if issparse(X) else X
+
+
+def search_estimator(model, reducer=None):
+    clf, grid = PARAM_GRIDS[model]
+    steps = []
+    if reducer is not None:
+        steps.append(('reducer', reducer))
+    if model == 'hgb':
+        steps.append(('dense', FunctionTransformer(to_dense, accept_sparse=True)))
+    steps.append(('clf', clf()))
+    return Pipeline(steps), dict(('clf__' + k, v) for k, v in grid.items())
+
+
+def halving_search(model, X_data, y, reducer=None, n_jobs=-1, factor=3, n_splits=5, random_state=0):
+    """
+    Runs successive halving for one model: every round fits the surviving candidates on factor times more
+    references, scored by MCC on stratified folds. Returns the fitted HalvingGridSearchCV.
+    """
+    estimator, grid = search_estimator(model, reducer)
+    search = HalvingGridSearchCV(estimator, grid, factor=factor, resource='n_samples', min_resources='exhaust',
+                                 cv=StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state),
+                                 scoring=make_scorer(matthews_corrcoef), refit=False, n_jobs=n_jobs,
+                                 random_state=random_state)
+    search.fit(X_data, y)
+    return search
+
+
+def search_summary(model, label, search, search_time):
+    best_params = dict((k.replace('clf__', '', 1), v) for k, v in search.best_params_.items())
+    return {'model': model,
+            'target': label,
+            'best_params': best_params,
+            'best_mcc': float(search.best_score_),
+            'n_candidates': [int(n) for n in search.n_candidates_],
+            'n_resources': [int(n) for n in search.n_resources_],
+            'search_time': search_time}
+
+
+def tune_models(models, targets, train_data, reduction=None, n_components=1000, n_jobs=-1, factor=3):
+    # one featurization for all the models and targets; joblib memory-maps the matrix for the workers
+    features = build_features(train_data)
+    reducer = feature_reducer(reduction, n_components)
+    summaries = []
+    for label in targets:
+        y = features['train_df'][label]
+        for model in models:
+            print('\n>>> Tuning model: {}, task: {}'.format(model, label))
+            start = time.time()
+            search = halving_search(model, features['X_data'], y, reducer=reducer, n_jobs=n_jobs, factor=factor)
+            summary = search_summary(model, label, search, time.time() - start)
+            summary['reduction'] = reduction
+            print("{} best mcc:{}; params:{}; candidates per round:{}; search_time:{}".format(
+                model, summary['best_mcc'], summary['best_params'], summary['n_candidates'], summary['search_time']))
+            pd.DataFrame(search.cv_results_).to_csv('tuning_results_{}_{}.csv'.format(model, label), index=False)
+            summaries.append(summary)
+        with open('best_params_{}.json'.format(label), 'w') as f:
+            json.dump(dict((s['model'], s) for s in summaries if s['target'] == label), f, indent=2, default=str)
+    return summaries
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Successive-halving hyperparameter search')
+    parser.add_argument('--train_data', default='./results/prediction_data.csv',
+                        help='Train dataset path')
+    parser.add_argument('--models', nargs='+', choices=sorted(PARAM_GRIDS), default=['svm', 'rf'])
+    parser.add_argument('--targets', nargs='+', choices=['authoritative', 'support_object'],
+                        default=['authoritative', 'support_object'])
+    parser.add_argument('--reduction', default=None, choices=REDUCTION_METHODS,
+                        help='Feature reduction fitted inside every candidate fold')
+    parser.add_argument('--n_components', type=int, default=1000)
+    parser.add_argument('--n_jobs', type=int, default=-1,
+                        help='Number of processes fitting the candidates (-1 uses all cores)')
+    parser.add_argument('--factor', type=int, default=3,
+                        help='Fraction of candidates kept (1/factor) and growth of the sample size per round')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    tune_models(args.models, args.targets, args.train_data, reduction=args.reduction,
+                n_components=args.n_components, n_jobs=args.n_jobs, factor=args.factor)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+RBF-kernel SVM approximated by an explicit feature map (Nystroem or random Fourier features) and a linear SVM.
+Training grows linearly with the number of references instead of quadratically/cubically as for svm.SVC.
+"""
+
+import argparse
+import time
+
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy.sparse import issparse
+from sklearn import svm
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.metrics import matthews_corrcoef
+from sklearn.model_selection import train_test_split
+
+from data_preprocessing import build_features
+
+KERNEL_APPROXIMATIONS = ['nystroem', 'rff']
+
+
+def scale_gamma(X):
+    # same value as svm.SVC(gamma='scale'), so the approximation targets the kernel of svm_model
+    if issparse(X):
+        variance = X.multiply(X).mean() - X.mean() ** 2
+    else:
+        variance = X.var()
+    return 1.0 / (X.shape[1] * variance) if variance != 0 else 1.0
+
+
+class ApproxKernelSVC(BaseEstimator, ClassifierMixin):
+
+    def __init__(self, kernel_approximation='nystroem', n_components=500, C=0.4, class_weight='balanced',
+                 random_state=0):
+        self.kernel_approximation = kernel_approximation
+        self.n_components = n_components
+        self.C = C
+        self.class_weight = class_weight
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        gamma = scale_gamma(X)
+        if self.kernel_approximation == 'nystroem':
+            # Nystroem cannot use more landmarks than training rows
+            self.feature_map_ = Nystroem(kernel='rbf', gamma=gamma, n_components=min(self.n_components, X.shape[0]),
+                                         random_state=self.random_state)
+        elif self.kernel_approximation == 'rff':
+            self.feature_map_ = RBFSampler(gamma=gamma, n_components=self.n_components,
+                                           random_state=self.random_state)
+        else:
+            raise ValueError('Unknown kernel approximation: {}'.format(self.kernel_approximation))
+        self.svm_ = svm.LinearSVC(C=self.C, class_weight=self.class_weight)
+        self.svm_.fit(self.feature_map_.fit_transform(X), y)
+        self.classes_ = self.svm_.classes_
+        return self
+
+    def decision_function(self, X):
+        return self.svm_.decision_function(self.feature_map_.transform(X))
+
+    def predict(self, X):
+        return self.svm_.predict(self.feature_map_.transform(X))
+
+
+def scaling_benchmark(X_data, y, sizes, n_components=500, random_state=53):
+    """
+    Fits the exact SVC and both approximations on stratified subsamples of growing size.
+    Returns one row per (n, model) with fit time, predict time and MCC on a 30% test split.
+    """
+    models = {'svm_rbf': lambda: svm.SVC(kernel='rbf', C=0.4, cache_size=1000, class_weight='balanced'),
+              'nystroem': lambda: ApproxKernelSVC('nystroem', n_components=n_components),
+              'rff': lambda: ApproxKernelSVC('rff', n_components=n_components)}
+    y = np.asarray(y)
+    rows = []
+    for n in sizes:
+        if n < X_data.shape[0]:
+            index, _ = train_test_split(np.arange(X_data.shape[0]), train_size=n, stratify=y,
+                                        random_state=random_state)
+        else:
+            index = np.arange(X_data.shape[0])
+        X_train, X_test, y_train, y_test = train_test_split(X_data[index], y[index], test_size=0.3,
+                                                            random_state=random_state)
+        for name, make_model in models.items():
+            clf = make_model()
+            start = time.time()
+            clf.fit(X_train, y_train)
+            fit_time = time.time() - start
+            start = time.time()
+            predicted = clf.predict(X_test)
+            predict_time = time.time() - start
+            rows.append({'n': len(index), 'model': name, 'fit_time': fit_time, 'predict_time': predict_time,
+                         'mcc': matthews_corrcoef(y_test, predicted)})
+            print("n:{}; model:{}; fit_time:{}; mcc:{}".format(len(index), name, fit_time, rows[-1]['mcc']))
+    return pd.DataFrame(rows)
+
+
+def plot_scaling(benchmark, file_name):
+    fig, (ax_time, ax_mcc) = plt.subplots(1, 2, figsize=(12, 5))
+    for name, group in benchmark.groupby('model'):
+        ax_time.plot(group['n'], group['fit_time'], marker='o', label=name)
+        ax_mcc.plot(group['n'], group['mcc'], marker='o', label=name)
+    ax_time.set_xlabel('training references (n)')
+    ax_time.set_ylabel('fit time (s)')
+    ax_time.set_xscale('log')
+    ax_time.set_yscale('log')
+    ax_mcc.set_xlabel('training references (n)')
+    ax_mcc.set_ylabel('MCC')
+    ax_mcc.set_xscale('log')
+    ax_time.legend()
+    plt.tight_layout()
+    plt.savefig(file_name)
+    plt.close(fig)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Exact vs approximate RBF SVM scaling benchmark')
+    parser.add_argument('--train_data', default='./results/prediction_data.csv',
+                        help='Train dataset path')
+    parser.add_argument('--target', default='authoritative', choices=['authoritative', 'support_object'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 5000, 10000, 20000])
+    parser.add_argument('--n_components', type=int, default=500)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    features = build_features(args.train_data)
+    benchmark = scaling_benchmark(features['X_data'], features['train_df'][args.target], args.sizes,
+                                  n_components=args.n_components)
+    benchmark.to_csv('svm_scaling_{}.csv'.format(args.target), index=False)
+    plot_scaling(benchmark, 'svm_scaling_{}.png'.format(args.target))
+
+
+if __name__ == "__main__":
+    main()
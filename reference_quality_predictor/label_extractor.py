@@ -1,83 +1,173 @@
+import os
 import re
+import time
+
 import requests
-import json
 
+from label_cache import LabelCache
+from label_index import LabelIndex
 
-def get_item_label(item):
-    if re.match(r'[Q|P][0-9]{1,}', item):
-        url = 'https://www.wikidata.org/wiki/Special:EntityData/' + item + '.json'
-        r = requests.get(url, auth=('user', 'pass'))
+API_URL = 'https://www.wikidata.org/w/api.php'
+# fallback chain of the labels and descriptions
+LANGUAGES = ['en', 'de', 'es', 'fr', 'nl']
+# wbgetentities accepts at most 50 ids per request
+BATCH_SIZE = 50
+ENTITY_ID = re.compile(r'^[QP][0-9]+$')
+# persistent cache of the module-level helpers
+LABEL_CACHE = os.environ.get('LABEL_CACHE', 'label_cache.sqlite')
+# offline index built by label_index.py; when set, the helpers never use the network
+LABEL_INDEX = os.environ.get('LABEL_INDEX')
+
+
+def pick_language(values, languages):
+    # first language of the chain with a value
+    for language in languages:
+        if language in values:
+            return values[language]['value']
+    return None
+
+
+class LabelResolver(object):
+    """
+    Resolves the label and description of Wikidata entities with wbgetentities: ids are deduplicated, already
+    resolved ids come from the cache and the others are requested in batches of up to 50, labels and descriptions
+    together. api_url can point to any server answering like the Wikidata API, e.g. a local stand-in.
+    With a store, ids are looked up there before being requested and fetched ids are written to it.
+    With api_url=None nothing is requested: ids missing from the store keep the id as label.
+    """
+
+    def __init__(self, api_url=API_URL, languages=LANGUAGES, batch_size=BATCH_SIZE, session=None, timeout=30,
+                 retries=3, delay=1.0, store=None):
+        self.api_url = api_url
+        self.languages = list(languages)
+        self.batch_size = min(batch_size, BATCH_SIZE)
+        self.session = session or requests.Session()
+        self.session.headers.setdefault('User-Agent', 'WD_references_analysis label resolver')
+        self.timeout = timeout
+        self.retries = retries
+        self.delay = delay
+        self.cache = {}
+        # optional persistent cache (label_cache.LabelCache) shared between runs and processes
+        self.store = store
 
-        try:
-            json_data = r.json()
+    def fetch_batch(self, ids):
+        params = {'action': 'wbgetentities',
+                  'ids': '|'.join(ids),
+                  'props': 'labels|descriptions',
+                  'languages': '|'.join(self.languages),
+                  'format': 'json'}
+        for attempt in range(self.retries):
             try:
-                json_data['entities'][item]
-            except KeyError:
-                item = list(json_data['entities'].keys())[0]
-            except json.decoder.JSONDecodeError:
+                r = self.session.get(self.api_url, params=params, timeout=self.timeout)
+                r.raise_for_status()
+                answer = r.json()
+                # API errors (ratelimited, maxlag, ...) come with HTTP 200 and no entities
+                if 'error' not in answer:
+                    return answer.get('entities', {})
+            except (requests.RequestException, ValueError):
                 pass
-            try:
-                label = json_data['entities'][item]['labels']['en']['value']
-            except KeyError:
-                try:
-                    label = json_data['entities'][item]['labels']['de']['value']
-                except KeyError:
-                    try:
-                        label = json_data['entities'][item]['labels']['es']['value']
-                    except KeyError:
-                        try:
-                            label = json_data['entities'][item]['labels']['fr']['value']
-                        except KeyError:
-                            try:
-                                label = json_data['entities'][item]['labels']['nl']['value']
-                            except KeyError:
-                                label = json_data['entities'][item]['labels']
-            except json.decoder.JSONDecodeError:
-                return item
-            return label
-        except:
-            return item
-    else:
-        return item
+            if attempt + 1 < self.retries:
+                time.sleep(self.delay * 2 ** attempt)
+        return None
+
+    def parse_entities(self, ids, entities):
+        # redirected ids come back under their target; missing ones with a 'missing' flag. Ids absent from the
+        # answer are left out, so they are neither cached nor stored
+        by_id = {}
+        for key, entity in entities.items():
+            by_id[key] = entity
+            redirect = entity.get('redirects', {}).get('from')
+            if redirect:
+                by_id[redirect] = entity
+        resolved = {}
+        for item in ids:
+            if item not in by_id:
+                continue
+            entity = by_id[item]
+            label = pick_language(entity.get('labels', {}), self.languages)
+            description = pick_language(entity.get('descriptions', {}), self.languages)
+            resolved[item] = {'label': label if label is not None else item,
+                              'description': description if description is not None else ''}
+        return resolved
+
+    def missing(self, items):
+        # distinct entity ids among items, and those neither in memory nor in the store
+        ids = list(dict.fromkeys(str(item) for item in items if ENTITY_ID.match(str(item))))
+        missing = [item for item in ids if item not in self.cache]
+        if self.store is not None and missing:
+            self.cache.update(self.store.get_many(missing))
+            missing = [item for item in missing if item not in self.cache]
+        if self.api_url is None:
+            missing = []
+        return ids, [missing[start:start + self.batch_size] for start in range(0, len(missing), self.batch_size)]
+
+    def remember(self, resolved):
+        self.cache.update(resolved)
+        if self.store is not None:
+            self.store.put_many(resolved)
+
+    def resolved(self, ids):
+        return dict((item, self.cache.get(item, {'label': item, 'description': ''})) for item in ids)
+
+    def resolve(self, items):
+        """
+        Returns {id: {'label': ..., 'description': ...}} for the entity ids among items. An id without a label in
+        the fallback chain keeps the id as label; ids of failed requests too, but they are not cached.
+        """
+        ids, batches = self.missing(items)
+        for batch in batches:
+            entities = self.fetch_batch(batch)
+            if entities is not None:
+                self.remember(self.parse_entities(batch, entities))
+        return self.resolved(ids)
+
+    def labels(self, items):
+        # label of every item, in order; values that are not entity ids are returned unchanged
+        items = list(items)
+        resolved = self.resolve(items)
+        return [resolved[str(item)]['label'] if str(item) in resolved else item for item in items]
+
+    def descriptions(self, items):
+        items = list(items)
+        resolved = self.resolve(items)
+        return [resolved[str(item)]['description'] if str(item) in resolved else item for item in items]
+
+
+_resolver = None
+
+
+def default_resolver():
+    global _resolver
+    if _resolver is None:
+        if LABEL_INDEX:
+            _resolver = LabelResolver(api_url=None, store=LabelIndex(LABEL_INDEX))
+        else:
+            _resolver = LabelResolver(store=LabelCache(LABEL_CACHE))
+    return _resolver
+
+
+def get_item_label(item):
+    return default_resolver().labels([item])[0]
 
 
 def get_item_description(item):
-    if re.match(r'[Q|P][0-9]{1,}', item):
-        url = 'https://www.wikidata.org/wiki/Special:EntityData/' + item + '.json'
-        r = requests.get(url, auth=('user', 'pass'))
-        json_data = r.json()
-        try:
-            json_data['entities'][item]
-        except KeyError:
-            item = list(json_data['entities'].keys())[0]
-        try:
-            description = json_data['entities'][item]['descriptions']['en']['value']
-        except KeyError:
-            try:
-                description = json_data['entities'][item]['descriptions']['de']['value']
-            except KeyError:
-                try:
-                    description = json_data['entities'][item]['descriptions']['es']['value']
-                except KeyError:
-                    try:
-                        description = json_data['entities'][item]['descriptions']['fr']['value']
-                    except KeyError:
-                        try:
-                            description = json_data['entities'][item]['descriptions']['nl']['value']
-                        except KeyError:
-                            description = json_data['entities'][item]['descriptions']
-
-        return description
-    else:
-        return item
-
-
-sample['item_label'] = sample['item_id'].apply(lambda x: get_item_label(x))
-sample['item_description'] = sample['item_id'].apply(lambda x: get_item_description(x))
-sample['id'] = sample['reference_id'].apply(lambda x: hash(x))
-sample['property_label'] = sample['stat_property'].apply(lambda x: get_item_label(x))
-sample['value_label'] = sample['stat_value'].apply(lambda x: get_item_label(x))
-sample['value_description'] = sample['stat_value'].apply(lambda x: get_item_description(x))
-
-sample = sample[['id', 'item_id', 'stat_property', 'stat_value', 'item_label',
-                 'item_description', 'property_label', 'value_label', 'value_description', 'ref_value']]
\ No newline at end of file
+    return default_resolver().descriptions([item])[0]
+
+
+def label_sample(sample, resolver=None):
+    """
+    Adds the labels and descriptions of the item, property and value of every statement of sample,
+    with one resolution for all the distinct ids.
+    """
+    resolver = resolver or default_resolver()
+    resolver.resolve(list(sample['item_id']) + list(sample['stat_property']) + list(sample['stat_value']))
+
+    sample['item_label'] = resolver.labels(sample['item_id'])
+    sample['item_description'] = resolver.descriptions(sample['item_id'])
+    sample['id'] = sample['reference_id'].apply(lambda x: hash(x))
+    sample['property_label'] = resolver.labels(sample['stat_property'])
+    sample['value_label'] = resolver.labels(sample['stat_value'])
+    sample['value_description'] = resolver.descriptions(sample['stat_value'])
+
+    return sample[['id', 'item_id', 'stat_property', 'stat_value', 'item_label',
+                   'item_description', 'property_label', 'value_label', 'value_description', 'ref_value']]
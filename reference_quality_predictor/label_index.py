@@ -0,0 +1,260 @@
+"""
+Offline index of Wikidata labels, descriptions and P31/P279 values, built from the local JSON dump
+(latest-all.json.bz2/.gz) or a Parquet export of entities, for lookups without network access.
+
+The index is a directory of three files: keys.npy (sorted numeric keys, Q123 -> 246, P123 -> 247),
+records.npy (start and length of every record, in key order) and records.bin (the records, utf-8,
+fields separated by \\x1f: label language, label, description, P31 ids, P279 ids, description language).
+Lookups are a vectorized binary search on the memory-mapped keys, so opening the index costs nothing and a lookup
+only touches the pages it needs.
+"""
+import argparse
+import bz2
+import gzip
+import json
+import os
+from array import array
+from multiprocessing import Pool
+
+import numpy as np
+
+LANGUAGES = ['en', 'de', 'es', 'fr', 'nl']
+CLAIMS = ['P31', 'P279']
+SEPARATOR = '\x1f'
+
+
+def entity_key(item):
+    # Q and P ids share one sorted integer key space
+    item = str(item)
+    if len(item) < 2 or item[0] not in 'QP' or not item[1:].isdigit():
+        return -1
+    return 2 * int(item[1:]) + (item[0] == 'P')
+
+
+def claim_ids(claims, property_id):
+    values = []
+    for statement in claims.get(property_id, []):
+        value = statement.get('mainsnak', {}).get('datavalue', {}).get('value')
+        if isinstance(value, dict) and 'id' in value:
+            values.append(value['id'])
+    return values
+
+
+def entity_record(entity, languages=LANGUAGES):
+    """
+    (key, record bytes) of one entity of the dump, or None for entities that are not items or properties.
+    """
+    key = entity_key(entity.get('id', ''))
+    if key < 0:
+        return None
+    labels = entity.get('labels') or {}
+    descriptions = entity.get('descriptions') or {}
+    claims = entity.get('claims') or {}
+    label_language = next((language for language in languages if language in labels), '')
+    description_language = next((language for language in languages if language in descriptions), None)
+    fields = [label_language,
+              labels[label_language]['value'] if label_language else '',
+              descriptions[description_language]['value'] if description_language else '']
+    fields += [','.join(claim_ids(claims, property_id)) for property_id in CLAIMS]
+    # last, so that indexes built without it still read: their descriptions are taken in the label's language
+    fields.append(description_language or '')
+    return key, SEPARATOR.join(field.replace(SEPARATOR, ' ') for field in fields).encode('utf-8')
+
+
+def parse_dump_line(line, languages=LANGUAGES):
+    # the dump is a JSON array with one entity per line
+    line = line.strip().rstrip(',')
+    if not line or line in ('[', ']'):
+        return None
+    return entity_record(json.loads(line), languages)
+
+
+def open_dump(path):
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def parquet_entities(path, batch_size=10000):
+    # rows with an id column and labels / descriptions / claims in the dump's format (JSON text or nested values)
+    import glob
+    import pyarrow.parquet as pq
+
+    paths = sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True)) if os.path.isdir(path) else [path]
+    for file_path in paths:
+        parquet_file = pq.ParquetFile(file_path)
+        columns = [c for c in ['id', 'labels', 'descriptions', 'claims'] if c in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            for row in batch.to_pylist():
+                for column in ('labels', 'descriptions', 'claims'):
+                    if isinstance(row.get(column), str):
+                        row[column] = json.loads(row[column])
+                yield row
+
+
+_languages = LANGUAGES
+
+
+def _init_worker(languages):
+    global _languages
+    _languages = languages
+
+
+def _parse_line(line):
+    return parse_dump_line(line, _languages)
+
+
+def iter_records(source, languages=LANGUAGES, n_jobs=1):
+    if source.endswith('.parquet') or os.path.isdir(source):
+        for entity in parquet_entities(source):
+            record = entity_record(entity, languages)
+            if record is not None:
+                yield record
+        return
+    with open_dump(source) as lines:
+        if n_jobs == 1:
+            for line in lines:
+                record = parse_dump_line(line, languages)
+                if record is not None:
+                    yield record
+            return
+        # JSON decoding dominates; lines are decoded in worker processes, in order
+        with Pool(n_jobs, initializer=_init_worker, initargs=(languages,)) as pool:
+            for record in pool.imap(_parse_line, lines, chunksize=2000):
+                if record is not None:
+                    yield record
+
+
+def build_index(source, directory, languages=LANGUAGES, n_jobs=1, limit=None):
+    """
+    Streams the dump into records.bin, then sorts the keys. Returns the number of indexed entities.
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    keys, starts, lengths = array('q'), array('q'), array('l')
+    position = 0
+    with open(os.path.join(directory, 'records.bin'), 'wb') as blob:
+        for count, (key, record) in enumerate(iter_records(source, languages, n_jobs)):
+            if limit is not None and count >= limit:
+                break
+            blob.write(record)
+            keys.append(key)
+            starts.append(position)
+            lengths.append(len(record))
+            position += len(record)
+            if count and count % 1000000 == 0:
+                print('{} entities indexed'.format(count))
+
+    keys = np.frombuffer(keys, dtype=np.int64) if len(keys) else np.zeros(0, dtype=np.int64)
+    order = np.argsort(keys, kind='stable')
+    records = np.empty((len(keys), 2), dtype=np.int64)
+    if len(keys):
+        records[:, 0] = np.frombuffer(starts, dtype=np.int64)[order]
+        records[:, 1] = np.asarray(lengths, dtype=np.int64)[order]
+    np.save(os.path.join(directory, 'keys.npy'), keys[order])
+    np.save(os.path.join(directory, 'records.npy'), records)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({'source': os.path.basename(source), 'languages': list(languages), 'claims': CLAIMS,
+                   'entities': int(len(keys))}, f, indent=1)
+    return len(keys)
+
+
+class LabelIndex(object):
+    """
+    Read-only lookups in an index built by build_index. get_many has the interface of label_cache.LabelCache,
+    so the index can be the store of a LabelResolver (with api_url=None to stay offline).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.keys = np.load(os.path.join(directory, 'keys.npy'), mmap_mode='r')
+        self.records = np.load(os.path.join(directory, 'records.npy'), mmap_mode='r')
+        self.blob = np.memmap(os.path.join(directory, 'records.bin'), dtype=np.uint8, mode='r') \
+            if os.path.getsize(os.path.join(directory, 'records.bin')) else np.zeros(0, dtype=np.uint8)
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, ids):
+        """
+        Returns {id: {'label', 'description', 'language', 'description_language', 'instance_of', 'subclass_of'}}
+        for the indexed ids.
+        """
+        ids = list(dict.fromkeys(str(item) for item in ids))
+        query = np.array([entity_key(item) for item in ids], dtype=np.int64)
+        positions = np.searchsorted(self.keys, query)
+        positions = np.minimum(positions, max(len(self.keys) - 1, 0))
+        found = (query >= 0) & (len(self.keys) > 0)
+        if len(self.keys):
+            found &= np.asarray(self.keys[positions]) == query
+        entries = {}
+        for item, position in zip(np.array(ids, dtype=object)[found], positions[found]):
+            start, length = self.records[position]
+            fields = bytes(self.blob[start:start + length]).decode('utf-8').split(SEPARATOR)
+            entries[item] = {'language': fields[0], 'label': fields[1] if fields[0] else item,
+                             'description': fields[2],
+                             'description_language': fields[5] if len(fields) > 5 else fields[0],
+                             'instance_of': fields[3].split(',') if fields[3] else [],
+                             'subclass_of': fields[4].split(',') if fields[4] else []}
+        self.hits += len(entries)
+        self.misses += len(ids) - len(entries)
+        return entries
+
+    def get_many(self, ids):
+        return dict((item, {'label': entry['label'], 'description': entry['description']})
+                    for item, entry in self.lookup(ids).items())
+
+    def put_many(self, entries):
+        # the index is rebuilt from the dump, never written by lookups
+        pass
+
+    def entity(self, item):
+        """
+        The indexed part of an entity in the dump's format (labels, descriptions, P31/P279 claims), or None.
+        """
+        entry = self.lookup([item]).get(str(item))
+        if entry is None:
+            return None
+        language = entry['language']
+        description_language = entry['description_language'] or language or 'en'
+        description = {'language': description_language, 'value': entry['description']}
+        claims = {}
+        for property_id, values in (('P31', entry['instance_of']), ('P279', entry['subclass_of'])):
+            if values:
+                claims[property_id] = [{'mainsnak': {'datavalue': {'value': {'id': value}}}} for value in values]
+        return {'id': str(item),
+                'labels': {language: {'language': language, 'value': entry['label']}} if language else {},
+                'descriptions': {description_language: description} if entry['description'] else {},
+                'claims': claims}
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / float(lookups) if lookups else 0.0}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build the offline label index from a Wikidata dump')
+    parser.add_argument('--source', required=True,
+                        help='latest-all.json(.bz2|.gz), or a Parquet file/directory of entities')
+    parser.add_argument('--output', default='label_index', help='Index directory')
+    parser.add_argument('--languages', nargs='+', default=LANGUAGES, help='Fallback chain of the labels')
+    parser.add_argument('--n_jobs', type=int, default=1, help='Processes decoding the JSON dump')
+    parser.add_argument('--limit', type=int, default=None, help='Stop after this many entities')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    count = build_index(args.source, args.output, args.languages, args.n_jobs, args.limit)
+    print('{} entities indexed in {}'.format(count, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,192 @@
+import math
+
+import numpy as np
+from joblib import Parallel, cpu_count, delayed
+
+
+def ratings_array(mat):
+    # N x k integer counts; every item must have been rated by the same number of raters
+    mat = np.asarray(mat, dtype=np.int64)
+    if mat.ndim != 2 or mat.shape[0] == 0:
+        raise ValueError('Ratings must be a non-empty N x k matrix, got shape {}'.format(mat.shape))
+    row_sums = mat.sum(axis=1)
+    if (row_sums != row_sums[0]).any():
+        raise ValueError('Line count != %d (n value) for %d items.' % (row_sums[0], (row_sums != row_sums[0]).sum()))
+    return mat
+
+
+def rating_patterns(mat):
+    # distinct rows and how many items share each; rows are packed into one integer (base n + 1) when they fit
+    n, k = int(mat[0].sum()), mat.shape[1]
+    if k * math.log(n + 1, 2) < 62:
+        codes = mat.dot((n + 1) ** np.arange(k, dtype=np.int64))
+        _, first, counts = np.unique(codes, return_index=True, return_counts=True)
+        return mat[first], counts
+    return np.unique(mat, axis=0, return_counts=True)
+
+
+def _kappa_from_patterns(patterns, weights, n):
+    """
+    Fleiss' kappa of item sets given as counts of distinct rating patterns: patterns is U x k, weights is
+    U (one item set) or B x U (B item sets, e.g. bootstrap resamples). Returns a scalar or a length-B array.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    N = weights.sum(axis=-1)
+    # agreement of every pattern, computed once however many items share it
+    P = ((patterns * patterns).sum(axis=1) - n) / float(n * (n - 1))
+    Pbar = weights.dot(P) / N
+    p = weights.dot(patterns) / (N * n)[..., np.newaxis]
+    PbarE = (p * p).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (Pbar - PbarE) / (1 - PbarE)
+
+
 def computeFleissKappa(mat):
     """
     Computes the Fleiss' Kappa value as described in (Fleiss, 1971)
     https://en.wikibooks.org/wiki/Algorithm_Implementation/Statistics/Fleiss%27_kappa#Python
     """
+    mat = ratings_array(mat)
+    n = int(mat[0].sum())
+    patterns, counts = rating_patterns(mat)
+    return float(_kappa_from_patterns(patterns, counts, n))
 
-    n = sum(mat[0])  # PRE : every line count must be equal to n
-    assert all(sum(line) == n for line in mat[1:]), "Line count != %d (n value)." % n
-    N = len(mat)
-    k = len(mat[0])
-
-    # Computing p[]
-    p = [0.0] * k
-    for j in xrange(k):
-        p[j] = 0.0
-        for i in xrange(N):
-            p[j] += mat[i][j]
-        p[j] /= N * n
-
-    # Computing P[]
-    P = [0.0] * N
-    for i in xrange(N):
-        P[i] = 0.0
-        for j in xrange(k):
-            P[i] += mat[i][j] * mat[i][j]
-        P[i] = (P[i] - n) / (n * (n - 1))
 
-    # Computing Pbar
-    Pbar = sum(P) / N
+def _bootstrap_kappas(patterns, probabilities, N, n, batches):
+    # resampling N items with replacement = drawing how many times each distinct pattern is picked;
+    # batches is a list of (size, seed), each batch drawn from its own generator
+    kappas = []
+    for size, seed in batches:
+        weights = np.random.default_rng(seed).multinomial(N, probabilities, size=size)
+        kappas.append(_kappa_from_patterns(patterns, weights, n))
+    return np.concatenate(kappas) if kappas else np.empty(0)
 
-    # Computing PbarE
-    PbarE = 0.0
-    for pj in p:
-        PbarE += pj * pj
 
-    kappa = (Pbar - PbarE) / (1 - PbarE)
-    return kappa
+def fleiss_kappa_bootstrap(mat, n_boot=2000, confidence=0.95, random_state=None, n_jobs=1, batch_size=1000):
+    """
+    Fleiss' kappa with a percentile bootstrap confidence interval over the items.
+    The items are reduced to their distinct rating patterns, so every resample costs O(patterns) instead of O(N);
+    resamples are drawn in batches of batch_size, each with its own seed derived from random_state, and the batches
+    are split over n_jobs processes: the interval depends on random_state and batch_size, not on n_jobs.
+    Returns (kappa, low, high).
+    """
+    mat = ratings_array(mat)
+    n = int(mat[0].sum())
+    N = mat.shape[0]
+    patterns, counts = rating_patterns(mat)
+    kappa = float(_kappa_from_patterns(patterns, counts, n))
+
+    probabilities = counts / float(N)
+    sizes = [min(batch_size, n_boot - start) for start in range(0, n_boot, batch_size)]
+    batches = list(zip(sizes, np.random.SeedSequence(random_state).spawn(len(sizes))))
+    n_jobs = max(1, min(n_jobs if n_jobs > 0 else cpu_count(), len(batches)))
+    if n_jobs == 1:
+        kappas = _bootstrap_kappas(patterns, probabilities, N, n, batches)
+    else:
+        # contiguous runs of batches, concatenated back in batch order
+        kappas = np.concatenate(Parallel(n_jobs=n_jobs)(
+            delayed(_bootstrap_kappas)(patterns, probabilities, N, n, [batches[i] for i in share])
+            for share in np.array_split(np.arange(len(batches)), n_jobs)))
+
+    tail = (1 - confidence) / 2.0 * 100
+    low, high = np.nanpercentile(kappas, [tail, 100 - tail])
+    return kappa, float(low), float(high)
 
 
 def mean(numbers):
     return float(sum(numbers)) / max(len(numbers), 1)
 
 
-def conf_counter(y_pred, y_test):
-    y_pred = list(y_pred)
-    y_test = list(y_test)
-    TP = 0
-    FP = 0
-    TN = 0
-    FN = 0
+def confusion_counts(expected, predicted):
+    # one bincount over 2 * expected + predicted gives [tn, fp, fn, tp] for 0/1 labels
+    expected = np.asarray(expected, dtype=np.int64)
+    predicted = np.asarray(predicted, dtype=np.int64)
+    tn, fp, fn, tp = np.bincount(2 * expected + predicted, minlength=4)[:4]
+    return int(tp), int(fp), int(fn), int(tn)
+
+
+def grouped_confusion_counts(groups, expected, predicted, n_groups):
+    """
+    Confusion counts of every group in one pass; groups holds integer codes in [0, n_groups).
+    Returns tp, fp, fn, tn arrays of length n_groups, ready for scores_from_counts.
+    """
+    codes = 4 * np.asarray(groups, dtype=np.int64) + 2 * np.asarray(expected, dtype=np.int64) + np.asarray(
+        predicted, dtype=np.int64)
+    counts = np.bincount(codes, minlength=4 * n_groups).reshape(n_groups, 4)
+    return counts[:, 3], counts[:, 1], counts[:, 2], counts[:, 0]
 
-    for i in range(len(y_pred)):
 
-        if y_pred[i] == 1 and y_test[i] == 1:
-            TP += 1
+def conf_counter(y_pred, y_test):
+    return confusion_counts(y_test, y_pred)
 
-        elif y_pred[i] == 0 and y_test[i] == 1:
-            FN += 1
 
-        elif y_pred[i] == 1 and y_test[i] == 0:
-            FP += 1
+def _divide(numerator, denominator):
+    # ill-defined ratios are 0, as with sklearn's zero_division default
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    safe = np.where(denominator == 0, 1.0, denominator)
+    return np.where(denominator == 0, 0.0, numerator / safe)
 
-        elif y_pred[i] == 0 and y_test[i] == 0:
-            TN += 1
 
-    return TP, FP, FN, TN
+def scores_from_counts(tp, fp, fn, tn):
+    """
+    Weighted precision/recall/f1, average precision and MCC of binary predictions from their confusion counts.
+    The operations follow sklearn's (precision_score(..., average='weighted'), average_precision_score on
+    0/1 predictions, matthews_corrcoef), so the values are identical. Works elementwise on count arrays.
+    """
+    tp, fp, fn, tn = [np.asarray(c, dtype=np.int64) for c in (tp, fp, fn, tn)]
+    support_0 = tn + fp
+    support_1 = tp + fn
+    n = support_0 + support_1
+
+    def weighted(score_0, score_1):
+        return (score_0 * support_0 + score_1 * support_1) / n
+
+    precision = weighted(_divide(tn, tn + fn), _divide(tp, tp + fp))
+    recall = weighted(_divide(tn, support_0), _divide(tp, support_1))
+    f1 = weighted(_divide(2 * tn, 2 * tn + fn + fp), _divide(2 * tp, 2 * tp + fp + fn))
+
+    # precision-recall curve of a 0/1 score has two thresholds: 1 (tp, fp) and 0 (every reference)
+    recall_1 = _divide(tp, support_1)
+    precision_1 = _divide(tp, tp + fp)
+    precision_0 = support_1 / n
+    auc_pr = -((recall_1 - 1) * precision_0 + (0 - recall_1) * precision_1)
+    auc_pr = np.where(support_1 == 0, 0.0, auc_pr)
+
+    true_0, true_1 = support_0, support_1
+    pred_0, pred_1 = tn + fn, tp + fp
+    cov_ytyp = (tp + tn) * n - (true_0 * pred_0 + true_1 * pred_1)
+    cov_ypyp = n ** 2 - (pred_0 * pred_0 + pred_1 * pred_1)
+    cov_ytyt = n ** 2 - (true_0 * true_0 + true_1 * true_1)
+    denominator = cov_ytyt * cov_ypyp
+    mcc = np.where(denominator == 0, 0.0, cov_ytyp / np.sqrt(np.where(denominator == 0, 1, denominator)))
+
+    scores = {'precision': precision, 'recall': recall, 'f1': f1, 'auc_pr': auc_pr, 'mcc': mcc}
+    if np.ndim(precision) == 0:
+        scores = dict((k, float(v)) for k, v in scores.items())
+    return scores
+
+
+def binary_scores(expected, predicted):
+    # precision, recall, f1, auc_pr, mcc and the confusion counts of one set of 0/1 predictions
+    counts = confusion_counts(expected, predicted)
+    scores = scores_from_counts(*counts)
+    return scores['precision'], scores['recall'], scores['f1'], scores['auc_pr'], scores['mcc'], counts
 
 
 def f1_compute(tp_list, fp_list, fn_list):
-    tp = sum(tp_list)
-    fp = sum(fp_list)
-    fn = sum(fn_list)
+    # pooled f1 over the folds: counts are summed before the ratio
+    tp = int(np.sum(tp_list))
+    fp = int(np.sum(fp_list))
+    fn = int(np.sum(fn_list))
 
     f1_score_custom = (2 * tp) / float(2 * tp + fp + fn)
 
     return f1_score_custom
+
+
+def mcc_compute(tp, fp, fn, tn):
+    denominator = math.sqrt(float(tp + fp) * (tp + fn) * (tn + fp) * (tn + fn))
+    if denominator == 0:
+        return 0.0
+    return (tp * tn - fp * fn) / denominator
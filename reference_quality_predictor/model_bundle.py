@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Versioned model bundle: one directory holding the classifier, the fitted vectorizers (and reducer), the
+feature column names and a manifest with the training-data hash and the evaluation metrics.
+Everything is written uncompressed, so the numpy arrays of the bundle are memory-mapped on load and their pages
+are shared by every process scoring with the same bundle (sklearn trees copy their node arrays in __setstate__,
+but still skip the decompression pass).
+"""
+
+import datetime
+import hashlib
+import json
+import os
+
+import sklearn
+from joblib import dump, load
+
+BUNDLE_VERSION = 1
+MANIFEST = 'manifest.json'
+MODEL_FILE = 'model.joblib'
+VECTORIZERS_FILE = 'vectorizers.joblib'
+COLUMNS_FILE = 'columns.json'
+
+_sha256_cache = {}
+
+
+def sha256_file(path, block_size=1 << 20):
+    # the same training file is hashed once per process, even when many bundles are written from it
+    stat = os.stat(path)
+    key = (os.path.realpath(path), stat.st_size, stat.st_mtime)
+    if key not in _sha256_cache:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+        _sha256_cache[key] = digest.hexdigest()
+    return _sha256_cache[key]
+
+
+def save_bundle(directory, clf, vectorizers, data_columns, model=None, target=None, train_data=None,
+                metrics=None):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    # compress=0 keeps the arrays as raw buffers inside the pickle, which is what mmap_mode needs
+    dump(clf, os.path.join(directory, MODEL_FILE), compress=0)
+    dump(vectorizers, os.path.join(directory, VECTORIZERS_FILE), compress=0)
+    with open(os.path.join(directory, COLUMNS_FILE), 'w') as f:
+        json.dump(list(data_columns), f)
+    manifest = {'format_version': BUNDLE_VERSION,
+                'model': model,
+                'target': target,
+                'estimator': type(clf).__name__,
+                'n_features': getattr(clf, 'n_features_in_', None),
+                'n_columns': len(data_columns),
+                'created': datetime.datetime.now().isoformat(),
+                'sklearn_version': sklearn.__version__,
+                'train_data': train_data,
+                'train_data_sha256': sha256_file(train_data) if train_data and os.path.isfile(train_data) else None,
+                'metrics': metrics or {}}
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, default=float)
+    return directory
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != BUNDLE_VERSION:
+        raise ValueError('Unsupported bundle version {} in {} (expected {})'.format(
+            manifest.get('format_version'), directory, BUNDLE_VERSION))
+    return manifest
+
+
+def load_bundle(directory, mmap_mode='r'):
+    """
+    Loads a bundle written by save_bundle. With mmap_mode='r' the model arrays are read-only memory maps
+    instead of private copies; pass mmap_mode=None to load everything in memory.
+    Returns a dict with manifest, model, vectorizers and data_columns.
+    """
+    manifest = read_manifest(directory)
+    if manifest['sklearn_version'] != sklearn.__version__:
+        print('warning: bundle {} was written with scikit-learn {}, running {}'.format(
+            directory, manifest['sklearn_version'], sklearn.__version__))
+    with open(os.path.join(directory, COLUMNS_FILE)) as f:
+        data_columns = json.load(f)
+    return {'manifest': manifest,
+            'model': load(os.path.join(directory, MODEL_FILE), mmap_mode=mmap_mode),
+            'vectorizers': load(os.path.join(directory, VECTORIZERS_FILE), mmap_mode=mmap_mode),
+            'data_columns': data_columns}
@@ -7,31 +7,34 @@ Created on May 1 2017
 
 import os
 import sys
+import time
 
 import argparse
 
-import requests
-
-from data_preprocessing import dataset_preprocess
-from metrics import mean, conf_counter, f1_compute
-
-reload(sys)
-sys.setdefaultencoding("utf8")
+from cross_validation import run_folds
+from data_preprocessing import build_features, dataset_preprocess, feature_reducer, reduce_features, \
+    reduced_columns, REDUCTION_METHODS
+from kernel_approximation import ApproxKernelSVC, KERNEL_APPROXIMATIONS
+from metrics import mean, binary_scores, f1_compute
+from model_bundle import save_bundle
+from prediction_store import PredictionStore
+from streaming_trainer import save_feature_chunks, train_sgd_streaming
+from webpage_support import webpage_support_baseline
+
+if sys.version_info[0] < 3:
+    reload(sys)
+    sys.setdefaultencoding("utf8")
+else:
+    raw_input = input
 
 import pandas as pd
 
-from joblib import dump
+from scipy.sparse import issparse
 
 from sklearn import svm
-from sklearn.metrics import precision_score
-from sklearn.metrics import recall_score
-from sklearn.metrics import f1_score
-from sklearn.metrics import average_precision_score
-from sklearn.metrics import matthews_corrcoef
-from sklearn.model_selection import StratifiedKFold
-
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
 from sklearn.naive_bayes import BernoulliNB
+from sklearn.model_selection import train_test_split
 
 
 ####starts HERE
@@ -43,80 +46,95 @@ from sklearn.naive_bayes import BernoulliNB
 # path = '/Users/alessandro/Documents/PhD/WD_refs_results/baseline.csv'
 #
 # baseline = pd.read_csv(path)
-def save_predicted_data(label_type, predicted, y_test, writing_mode='w'):
-    prediction_data = {'predicted': predicted,
-                       'expected': y_test}
-    prediction_data_df = pd.DataFrame(prediction_data)
-    prediction_data_df.to_csv('predicted_{}.csv'.format(label_type), mode=writing_mode)
-
-
-def extract_webpage_text(link):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/56.0.2924.76 Safari/537.36',
-        'Upgrade-Insecure-Requests': '1', 'DNT': '1',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5', 'Accept-Encoding': 'gzip, deflate'}
-    try:
-        r = requests.get(link, headers=headers, timeout=5, auth=('user', 'pass'))
-        return r.text
-    except:
-        return 'NA'
-
-
-
-def check_webpage_support(value_1, value_2, link):
-    text = extract_webpage_text(link)
-    if is_not_ascii(text):
-        text = fix_encode_decode(text)
-    if is_not_ascii(value_1):
-        value_1 = fix_encode_decode(value_1)
-    if is_not_ascii(value_2):
-        value_2 = fix_encode_decode(value_2)
-    try:
-        return 1 if str(value_1.encode('utf-8')) in text and str(value_2.encode('utf-8')) in text else 0
-    except UnicodeDecodeError:
-        print(value_1)
-        print(value_2)
-        print (text)
-        return 0
-
-def is_not_ascii(string):
-    return string is not None and any([ord(s) >= 128 for s in string])
-
-def fix_encode_decode(x):
-    try:
-        return x.encode('utf-8')
-    except UnicodeDecodeError:
-        return x.decode('utf-8')
+
+
+MODELS = ['baseline', 'svm_model', 'svm_model_cv', 'approx_svm_model', 'approx_svm_model_cv', 'linear_svm', 'linear_svm_cv', 'rf_model', 'rf_model_cv',
+          'hgb_model', 'hgb_model_cv', 'sgd_model', 'nb_model', 'nb_model_cv', 'all_cv']
+TARGETS = {'0': 'authoritative', 'authoritativeness': 'authoritative', 'authoritative': 'authoritative',
+           '1': 'support_object', 'relevance': 'support_object', 'support_object': 'support_object'}
 
 
 ### Model training
 class modelTrainer(object):
 
-    def __init__(self, train_data, test_data):
+    def __init__(self, train_data, test_data, reduction=None, n_components=1000, n_jobs=-1, means=None,
+                 prediction_column=None, features=None, sgd_loss='hinge', chunk_size=10000,
+                 kernel_approximation='nystroem', approx_components=500, cv_seed=None, sgd_resume=False):
         # values = {'authoritativeness': "authoritative",
         #           'relevance': "support_object"}
+        # means and prediction_column are asked interactively when not given
         models = {'baseline': self.baseline, 'svm_model': self.svm_model, 'svm_model_cv': self.svm_model_cv,
+                  'approx_svm_model': self.approx_svm_model, 'approx_svm_model_cv': self.approx_svm_model_cv,
                   'linear_svm': self.linear_svm, 'linear_svm_cv': self.linear_svm_cv,
                   'rf_model': self.rf_model, 'rf_model_cv': self.rf_model_cv,
+                  'hgb_model': self.hgb_model, 'hgb_model_cv': self.hgb_model_cv,
+                  'sgd_model': self.sgd_model,
                   'nb_model': self.nb_model, 'nb_model_cv': self.nb_model_cv}
-        self.means = raw_input("Which model do you want to train? "
-                               "(Choices: 'baseline', 'svm_model', 'svm_model_cv', 'rf_model', rf_model_cv', 'nb_model', 'nb_model_cv', 'all_cv')\n")
-        prediction_col = raw_input(
-            "Please choose the attribute you want to evaluate (enter 0 for 'authoritativeness', 1 for 'relevance'):")
-        prediction_goal = {'0': 'authoritative',
-                           '1': 'support_object'}
-        self.prediction_column = prediction_goal[prediction_col]
+        if means is None:
+            means = raw_input("Which model do you want to train? "
+                              "(Choices: 'baseline', 'svm_model', 'svm_model_cv', 'approx_svm_model', 'approx_svm_model_cv', 'rf_model', rf_model_cv', 'hgb_model', 'hgb_model_cv', 'sgd_model', 'nb_model', 'nb_model_cv', 'all_cv')\n")
+        self.means = means
+        if prediction_column is None:
+            prediction_column = raw_input(
+                "Please choose the attribute you want to evaluate (enter 0 for 'authoritativeness', 1 for 'relevance'):")
+        self.prediction_column = TARGETS[prediction_column]
         self.train_data = train_data
         self.test_data = test_data
+        # feature matrices from build_features, computed on first use and reused by every model
+        self.features = features
+        # one structured record per trained model
+        self.results = []
+        # optional feature reduction applied before the kernel and tree models
+        self.reduction = reduction
+        self.reducer = feature_reducer(reduction, n_components)
+        # number of processes running the cross-validation folds, and the seed of the folds (None: new folds
+        # on every run)
+        self.n_jobs = n_jobs
+        self.cv_seed = cv_seed
+        # streaming SGD settings: loss, number of rows per CSR block written to disk, and whether training
+        # continues from the last checkpoint
+        self.sgd_loss = sgd_loss
+        self.chunk_size = chunk_size
+        self.sgd_resume = sgd_resume
+        # explicit RBF feature map used by the approximate SVM models
+        self.kernel_approximation = kernel_approximation
+        self.approx_components = approx_components
         if self.means != 'all_cv':
             models[self.means]()
         else:
             self.baseline()
             self.nb_model_cv()
             self.rf_model_cv()
+            # HGB densifies the matrix of every fold, only affordable on reduced features
+            if self.reducer is not None:
+                self.hgb_model_cv()
+            else:
+                print('HGB cross_validation skipped: it needs --reduction')
             self.svm_model_cv()
 
+    def preprocess(self, cv=False):
+        if self.features is None:
+            self.features = build_features(self.train_data, self.test_data)
+        return dataset_preprocess(self.prediction_column, self.train_data, self.test_data, cv=cv,
+                                  features=self.features)
+
+    def record(self, model, precision, recall, f1, auc_pr, mcc, **extra):
+        # structured counterpart of the printed results line
+        result = {'model': model, 'target': self.prediction_column, 'precision': precision, 'recall': recall,
+                  'f1': f1, 'auc_pr': auc_pr, 'mcc': mcc}
+        result.update(extra)
+        self.results.append(result)
+        return result
+
+    def export_bundle(self, clf, vectorizers, reducer, data_columns, result):
+        # classifier, vectorizers + reducer, columns and metrics saved together in bundles/<model>_<target>
+        vectorizers['reducer'] = reducer
+        metrics = dict((k, v) for k, v in result.items() if k not in ('model', 'target'))
+        directory = os.path.join('bundles', '{}_{}'.format(result['model'], self.prediction_column))
+        save_bundle(directory, clf, vectorizers, data_columns, model=result['model'], target=self.prediction_column,
+                    train_data=self.train_data, metrics=metrics)
+        print('model bundle saved to ' + directory)
+
     def baseline(self):
         # train_data = '/Users/alessandro/Documents/WD_references_analysis/results/prediction_data.csv'
 
@@ -139,16 +157,13 @@ class modelTrainer(object):
             try:
                 predicted = posts['statement_match']
             except KeyError:
-                predicted = posts.apply(
-                    lambda x: check_webpage_support(x['item_labels'], x['stat_value_label'], x['ref_value']), axis=1)
+                # distinct pages are fetched concurrently and scanned once for all their labels
+                predicted = webpage_support_baseline(posts['item_labels'], posts['stat_value_label'],
+                                                     posts['ref_value'])
 
             expected = posts['support_object']
 
-        precision = precision_score(expected, predicted, average='weighted', pos_label=1)
-        recall = recall_score(expected, predicted, average='weighted', pos_label=1)
-        f1 = f1_score(expected, predicted, average='weighted', pos_label=1)
-        auc_pr = average_precision_score(expected, predicted, average='weighted')
-        mcc = matthews_corrcoef(expected, predicted)
+        precision, recall, f1, auc_pr, mcc, _ = binary_scores(expected, predicted)
 
         print ("Baseline precision:{0}; recall:{1}; f1:{2}; auc_pr:{3}; mcc:{4}".format(str(precision), str(recall),
                                                                                        str(f1), str(auc_pr), str(mcc)))
@@ -156,46 +171,52 @@ class modelTrainer(object):
         with open(file_name, 'w') as f:
             f.write("Baseline precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
                 f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc))
+        return self.record('baseline', precision, recall, f1, auc_pr, mcc)
 
     def svm_model(self):
         print ('you chose SVM')
-        data = dataset_preprocess(self.prediction_column, self.train_data, self.test_data)
+        data = self.preprocess()
         print ('data processed')
 
         X_train = data[0]
         y_train = data[2]
         X_test = data[1]
         y_test = data[3]
+        vectorizers = data[5]
         label_type = str(self.prediction_column)
 
+        reducer, X_train, X_test = reduce_features(self.reducer, X_train, y_train, X_test)
+
         ###SVM
+        start = time.time()
         clf = svm.SVC(kernel='rbf', C=0.4, cache_size=1000, class_weight='balanced').fit(X_train, y_train)
+        fit_time = time.time() - start
 
         ###compute scores
-        clf.score(X_test, y_test)
+        start = time.time()
         predicted = clf.predict(X_test)
+        predict_time = time.time() - start
         expected = y_test
 
-        precision = precision_score(expected, predicted, average='weighted', pos_label=1)
-        recall = recall_score(expected, predicted, average='weighted', pos_label=1)
-        f1 = f1_score(expected, predicted, average='weighted', pos_label=1)
-        auc_pr = average_precision_score(expected, predicted, average='weighted')
-        mcc = matthews_corrcoef(expected, predicted)
+        precision, recall, f1, auc_pr, mcc, _ = binary_scores(expected, predicted)
 
         print ("SVM model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
-            f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc))
+            f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc) + self.timing_summary(fit_time, predict_time))
         file_name = 'svm_results_' + label_type + '.csv'
         with open(file_name, 'w') as f:
             f.write("SVM model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
-                f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc))
+                f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc) + self.timing_summary(fit_time, predict_time))
 
-        # save model to file
-        dump(clf, 'svm_model_{}.joblib'.format(label_type))
+        result = self.record('svm_model', precision, recall, f1, auc_pr, mcc, fit_time=fit_time,
+                             predict_time=predict_time)
+        # save model to file, the fitted reducer is kept with the vectorizers it was fitted on
+        self.export_bundle(clf, vectorizers, reducer, data[4], result)
+        return result
 
     ###RF cross validation
     def svm_model_cv(self):
         print ('you chose SVM cross_validation')
-        data = dataset_preprocess(self.prediction_column, self.train_data, self.test_data, cv=True)
+        data = self.preprocess(cv=True)
         print ('data processed')
 
         X_train = data[0]
@@ -203,7 +224,6 @@ class modelTrainer(object):
         label_type = str(self.prediction_column)
 
         clf = svm.SVC(kernel='rbf', C=0.4, cache_size=1000, class_weight='balanced')
-        crossvalidation = StratifiedKFold(n_splits=10, shuffle=True, random_state=None)
 
         precision_list = []
         recall_list = []
@@ -213,49 +233,146 @@ class modelTrainer(object):
         true_positive_list = []
         false_positive_list = []
         false_negative_list = []
+        fit_time_list = []
+        predict_time_list = []
+
+        for fold in run_folds(clf, data[0], data[1], reducer=self.reducer, n_jobs=self.n_jobs,
+                              random_state=self.cv_seed):
+            predicted = fold['predicted']
+            fit_time_list.append(fold['fit_time'])
+            predict_time_list.append(fold['predict_time'])
+
+            expected = fold['expected']
+            # all the fold scores come from one confusion matrix
+            precision, recall, f1, auc_pr, mcc, conf_scores = binary_scores(expected, predicted)
+            true_positive_list.append(conf_scores[0])
+            false_positive_list.append(conf_scores[1])
+            false_negative_list.append(conf_scores[2])
 
-        for train_index, test_index in crossvalidation.split(data[0], data[1]):
-            X_train, X_test = data[0][train_index], data[0][test_index]
-            y_train, y_test = data[1][train_index], data[1][test_index]
-
-            clf = clf.fit(X_train, y_train)
-            predicted = clf.predict(X_test)
-
-            expected = y_test
-            conf_scores = conf_counter(predicted, expected)
-            true_positive = conf_scores[0]
-            true_positive_list.append(true_positive)
-            false_positive = conf_scores[1]
-            false_positive_list.append(false_positive)
-            false_negative = conf_scores[2]
-            false_negative_list.append(false_negative)
-
-            precision = precision_score(expected, predicted, average='weighted', pos_label=1)
             precision_list.append(precision)
-            recall = recall_score(expected, predicted, average='weighted', pos_label=1)
             recall_list.append(recall)
-            f1 = f1_score(expected, predicted, average='weighted', pos_label=1)
             f1_list.append(f1)
-            auc_pr = average_precision_score(expected, predicted, average='weighted')
             auc_pr_list.append(auc_pr)
-            mcc = matthews_corrcoef(expected, predicted)
             mcc_list.append(mcc)
 
         f1_new = f1_compute(true_positive_list, false_positive_list, false_negative_list)
+        timing = self.timing_summary(mean(fit_time_list), mean(predict_time_list))
 
         print ("SVM CV model precision:" + str(mean(precision_list)) + "; recall:" + str(
             mean(recall_list)) + "; f1:" + str(mean(f1_list)) + "; auc_pr:" + str(mean(auc_pr_list)) + "; mcc:" + str(
-            mean(mcc_list)) + "; f1_new:" + str(f1_new))
+            mean(mcc_list)) + "; f1_new:" + str(f1_new) + timing)
         file_name = 'svm_cv_results_' + label_type + '.csv'
         with open(file_name, 'w') as f:
             f.write("SVM cv model precision:" + str(mean(precision_list)) + "; recall:" + str(
                 mean(recall_list)) + "; f1:" + str(mean(f1_list)) + "; auc_pr:" + str(
-                mean(auc_pr_list)) + "; mcc:" + str(mean(mcc_list)) + "; f1_new:" + str(f1_new))
+                mean(auc_pr_list)) + "; mcc:" + str(mean(mcc_list)) + "; f1_new:" + str(f1_new) + timing)
+        return self.record('svm_model_cv', mean(precision_list), mean(recall_list), mean(f1_list), mean(auc_pr_list),
+                           mean(mcc_list), f1_new=f1_new, fit_time=mean(fit_time_list),
+                           predict_time=mean(predict_time_list))
+
+    ###SVM with an approximate RBF kernel
+    def approx_svm_classifier(self):
+        return ApproxKernelSVC(kernel_approximation=self.kernel_approximation, n_components=self.approx_components,
+                               C=0.4, class_weight='balanced')
+
+    def approx_svm_model(self):
+        print('you chose approximate kernel SVM')
+        data = self.preprocess()
+        print('data processed')
+
+        X_train = data[0]
+        y_train = data[2]
+        X_test = data[1]
+        y_test = data[3]
+        vectorizers = data[5]
+        label_type = str(self.prediction_column)
+
+        reducer, X_train, X_test = reduce_features(self.reducer, X_train, y_train, X_test)
+
+        start = time.time()
+        clf = self.approx_svm_classifier().fit(X_train, y_train)
+        fit_time = time.time() - start
+
+        start = time.time()
+        predicted = clf.predict(X_test)
+        predict_time = time.time() - start
+        expected = y_test
+
+        precision, recall, f1, auc_pr, mcc, _ = binary_scores(expected, predicted)
+
+        print("Approx SVM model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
+            f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc) + "; kernel:" + self.kernel_approximation + str(
+            self.approx_components) + self.timing_summary(fit_time, predict_time))
+        file_name = 'approx_svm_results_' + label_type + '.csv'
+        with open(file_name, 'w') as f:
+            f.write("Approx SVM model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
+                f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc) + "; kernel:" + self.kernel_approximation + str(
+                self.approx_components) + self.timing_summary(fit_time, predict_time))
+
+        result = self.record('approx_svm_model', precision, recall, f1, auc_pr, mcc, fit_time=fit_time,
+                             predict_time=predict_time)
+        # save model to file
+        self.export_bundle(clf, vectorizers, reducer, data[4], result)
+        return result
+
+    def approx_svm_model_cv(self):
+        print('you chose approximate kernel SVM cross_validation')
+        data = self.preprocess(cv=True)
+        print('data processed')
+
+        label_type = str(self.prediction_column)
+
+        clf = self.approx_svm_classifier()
+
+        precision_list = []
+        recall_list = []
+        f1_list = []
+        auc_pr_list = []
+        mcc_list = []
+        true_positive_list = []
+        false_positive_list = []
+        false_negative_list = []
+        fit_time_list = []
+        predict_time_list = []
+
+        for fold in run_folds(clf, data[0], data[1], reducer=self.reducer, n_jobs=self.n_jobs,
+                              random_state=self.cv_seed):
+            predicted = fold['predicted']
+            fit_time_list.append(fold['fit_time'])
+            predict_time_list.append(fold['predict_time'])
+
+            expected = fold['expected']
+            # all the fold scores come from one confusion matrix
+            precision, recall, f1, auc_pr, mcc, conf_scores = binary_scores(expected, predicted)
+            true_positive_list.append(conf_scores[0])
+            false_positive_list.append(conf_scores[1])
+            false_negative_list.append(conf_scores[2])
+
+            precision_list.append(precision)
+            recall_list.append(recall)
+            f1_list.append(f1)
+            auc_pr_list.append(auc_pr)
+            mcc_list.append(mcc)
+
+        f1_new = f1_compute(true_positive_list, false_positive_list, false_negative_list)
+        timing = self.timing_summary(mean(fit_time_list), mean(predict_time_list))
+
+        print("Approx SVM cv model precision:" + str(mean(precision_list)) + "; recall:" + str(
+            mean(recall_list)) + "; f1:" + str(mean(f1_list)) + "; auc_pr:" + str(mean(auc_pr_list)) + "; mcc:" + str(
+            mean(mcc_list)) + "; f1_new:" + str(f1_new) + timing)
+        file_name = 'approx_svm_cv_results_' + label_type + '.csv'
+        with open(file_name, 'w') as f:
+            f.write("Approx SVM cv model precision:" + str(mean(precision_list)) + "; recall:" + str(
+                mean(recall_list)) + "; f1:" + str(mean(f1_list)) + "; auc_pr:" + str(
+                mean(auc_pr_list)) + "; mcc:" + str(mean(mcc_list)) + "; f1_new:" + str(f1_new) + timing)
+        return self.record('approx_svm_model_cv', mean(precision_list), mean(recall_list), mean(f1_list),
+                           mean(auc_pr_list), mean(mcc_list), f1_new=f1_new, fit_time=mean(fit_time_list),
+                           predict_time=mean(predict_time_list))
 
     ###linear SVM
     def linear_svm(self):
         print('you chose linear SVM')
-        data = dataset_preprocess(self.prediction_column, self.train_data, self.test_data)
+        data = self.preprocess()
         print('data processed')
 
         X_train = data[0]
@@ -272,11 +389,7 @@ class modelTrainer(object):
         predicted = clf.predict(X_test)
         expected = y_test
 
-        precision = precision_score(expected, predicted, average='weighted', pos_label=1)
-        recall = recall_score(expected, predicted, average='weighted', pos_label=1)
-        f1 = f1_score(expected, predicted, average='weighted', pos_label=1)
-        auc_pr = average_precision_score(expected, predicted, average='weighted')
-        mcc = matthews_corrcoef(expected, predicted)
+        precision, recall, f1, auc_pr, mcc, _ = binary_scores(expected, predicted)
 
         print("Linear SVM model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
             f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc))
@@ -284,20 +397,18 @@ class modelTrainer(object):
         with open(file_name, 'w') as f:
             f.write("Linear SVM model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
                 f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc))
+        return self.record('linear_svm', precision, recall, f1, auc_pr, mcc)
 
     def linear_svm_cv(self):
         print('you chose linear SVM cross_validation')
-        data = dataset_preprocess(self.prediction_column, self.train_data, cv=True)
+        data = self.preprocess(cv=True)
         print('data processed')
 
         X_train = data[0]
         y_test = data[1]
         label_type = str(self.prediction_column)
 
-        from sklearn import svm
-        from sklearn.model_selection import StratifiedKFold
         clf = svm.LinearSVC(C=0.5, class_weight='balanced')
-        crossvalidation = StratifiedKFold(n_splits=10, shuffle=True, random_state=None)
 
         precision_list = []
         recall_list = []
@@ -308,31 +419,20 @@ class modelTrainer(object):
         false_positive_list = []
         false_negative_list = []
 
-        for train_index, test_index in crossvalidation.split(data[0], data[1]):
-            X_train, X_test = data[0][train_index], data[0][test_index]
-            y_train, y_test = data[1][train_index], data[1][test_index]
-
-            clf = clf.fit(X_train, y_train)
-            predicted = clf.predict(X_test)
+        for fold in run_folds(clf, data[0], data[1], n_jobs=self.n_jobs, random_state=self.cv_seed):
+            predicted = fold['predicted']
 
-            expected = y_test
-            conf_scores = conf_counter(predicted, expected)
-            true_positive = conf_scores[0]
-            true_positive_list.append(true_positive)
-            false_positive = conf_scores[1]
-            false_positive_list.append(false_positive)
-            false_negative = conf_scores[2]
-            false_negative_list.append(false_negative)
+            expected = fold['expected']
+            # all the fold scores come from one confusion matrix
+            precision, recall, f1, auc_pr, mcc, conf_scores = binary_scores(expected, predicted)
+            true_positive_list.append(conf_scores[0])
+            false_positive_list.append(conf_scores[1])
+            false_negative_list.append(conf_scores[2])
 
-            precision = precision_score(expected, predicted, average='weighted', pos_label=1)
             precision_list.append(precision)
-            recall = recall_score(expected, predicted, average='weighted', pos_label=1)
             recall_list.append(recall)
-            f1 = f1_score(expected, predicted, average='weighted', pos_label=1)
             f1_list.append(f1)
-            auc_pr = average_precision_score(expected, predicted, average='weighted')
             auc_pr_list.append(auc_pr)
-            mcc = matthews_corrcoef(expected, predicted)
             mcc_list.append(mcc)
 
         f1_new = f1_compute(true_positive_list, false_positive_list, false_negative_list)
@@ -346,52 +446,68 @@ class modelTrainer(object):
                 mean(recall_list)) + "; f1:" + str(mean(f1_list)) + "; auc_pr:" + str(
                 mean(auc_pr_list)) + "; mcc:" + str(
                 mean(mcc_list)) + "; f1_new:" + str(f1_new))
+        return self.record('linear_svm_cv', mean(precision_list), mean(recall_list), mean(f1_list),
+                           mean(auc_pr_list), mean(mcc_list), f1_new=f1_new)
 
     ###RF
     def rf_model(self, save_predicted=True):
         print('you chose RF')
-        data = dataset_preprocess(self.prediction_column, self.train_data, self.test_data)
+        data = self.preprocess()
         print('data processed')
 
         X_train = data[0]
         y_train = data[2]
         X_test = data[1]
         y_test = data[3]
-        data_columns = data[4]
+        vectorizers = data[5]
         label_type = str(self.prediction_column)
 
+        reducer, X_train, X_test = reduce_features(self.reducer, X_train, y_train, X_test)
+        data_columns = reduced_columns(reducer, data[4])
+
         clf = RandomForestClassifier(n_estimators=1000, max_depth=None, min_samples_split=3, random_state=0)
+        start = time.time()
         clf = clf.fit(X_train, y_train)
+        fit_time = time.time() - start
         feature_importances = pd.DataFrame(clf.feature_importances_,
                                            index=data_columns,
                                            columns=['importance']).sort_values('importance', ascending=False)
-        feature_importances.to_csv('./rf_feature_importances_{}.csv'.format(label_type))
+        # one file per model: rf_model and rf_model_cv may run at the same time
+        feature_importances.to_csv('./rf_model_feature_importances_{}.csv'.format(label_type))
 
+        start = time.time()
         predicted = clf.predict(X_test)
+        predict_time = time.time() - start
 
         expected = y_test
         if save_predicted:
-            save_predicted_data(label_type, predicted, y_test)
+            # the held-out split is stored as fold 0; row ids are rows of the test file when there is one,
+            # else of the training file
+            if self.test_data:
+                store = PredictionStore('rf_model', label_type, rows='test', data_file=self.test_data)
+            else:
+                store = PredictionStore('rf_model', label_type, rows='train', data_file=self.train_data)
+            store.add(0, y_test.index, expected, predicted, clf.predict_proba(X_test)[:, 1])
+            store.write()
 
-        precision = precision_score(expected, predicted, average='weighted', pos_label=1)
-        recall = recall_score(expected, predicted, average='weighted', pos_label=1)
-        f1 = f1_score(expected, predicted, average='weighted', pos_label=1)
-        auc_pr = average_precision_score(expected, predicted, average='weighted')
-        mcc = matthews_corrcoef(expected, predicted)
+        precision, recall, f1, auc_pr, mcc, _ = binary_scores(expected, predicted)
 
         print("RF model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
-            f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc))
+            f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc) + self.timing_summary(fit_time, predict_time))
         file_name = 'rf_results_' + label_type + '.csv'
         with open(file_name, 'w') as f:
             f.write("RF model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
-                f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc))
+                f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc) + self.timing_summary(fit_time, predict_time))
+        result = self.record('rf_model', precision, recall, f1, auc_pr, mcc, fit_time=fit_time,
+                             predict_time=predict_time)
         # save model to file
-        dump(clf, 'rf_model_{}.joblib'.format(label_type))
+        self.export_bundle(clf, vectorizers, reducer, data[4], result)
+        return result
 
     ###RF cross validation
     def rf_model_cv(self, save_predicted=True):
         print('you chose RF cross_validation')
-        data = dataset_preprocess(self.prediction_column, self.train_data, test_data=None, cv=True)
+        data = self.preprocess(cv=True)
         print('data processed')
 
         # X_train = data[0]
@@ -399,7 +515,6 @@ class modelTrainer(object):
         label_type = str(self.prediction_column)
 
         clf = RandomForestClassifier(n_estimators=1000, max_depth=None, min_samples_split=2, random_state=0)
-        crossvalidation = StratifiedKFold(n_splits=10, shuffle=True, random_state=None)
 
         precision_list = []
         recall_list = []
@@ -410,60 +525,220 @@ class modelTrainer(object):
         false_positive_list = []
         false_negative_list = []
         feature_importances_list = []
-        data_columns = data[2]
-        for train_index, test_index in crossvalidation.split(data[0], data[1]):
-            X_train, X_test = data[0][train_index], data[0][test_index]
-            y_train, y_test = data[1][train_index], data[1][test_index]
-
-            clf = clf.fit(X_train, y_train)
-            predicted = clf.predict(X_test)
-            feature_importances_list.append(pd.DataFrame(clf.feature_importances_,
+        fit_time_list = []
+        predict_time_list = []
+        vectorizers = data[3]
+        store = PredictionStore('rf_model_cv', label_type, rows='train', data_file=self.train_data)
+        for i, fold in enumerate(run_folds(clf, data[0], data[1], reducer=self.reducer, n_jobs=self.n_jobs,
+                                           random_state=self.cv_seed, return_score=save_predicted)):
+            reducer = fold['reducer']
+            data_columns = reduced_columns(reducer, data[2])
+
+            predicted = fold['predicted']
+            fit_time_list.append(fold['fit_time'])
+            predict_time_list.append(fold['predict_time'])
+            feature_importances_list.append(pd.DataFrame(fold['feature_importances'],
                                                          index=data_columns,
                                                          columns=['importance']).sort_values('importance',
                                                                                              ascending=False))
 
-            expected = y_test
+            expected = fold['expected']
             if save_predicted:
-                save_predicted_data(label_type, predicted, y_test, writing_mode='a')
+                store.add(i, expected.index, expected, predicted, fold['score'])
 
-            conf_scores = conf_counter(predicted, expected)
-            true_positive = conf_scores[0]
-            true_positive_list.append(true_positive)
-            false_positive = conf_scores[1]
-            false_positive_list.append(false_positive)
-            false_negative = conf_scores[2]
-            false_negative_list.append(false_negative)
+            # all the fold scores come from one confusion matrix
+            precision, recall, f1, auc_pr, mcc, conf_scores = binary_scores(expected, predicted)
+            true_positive_list.append(conf_scores[0])
+            false_positive_list.append(conf_scores[1])
+            false_negative_list.append(conf_scores[2])
 
-            precision = precision_score(expected, predicted, average='weighted', pos_label=1)
             precision_list.append(precision)
-            recall = recall_score(expected, predicted, average='weighted', pos_label=1)
             recall_list.append(recall)
-            f1 = f1_score(expected, predicted, average='weighted', pos_label=1)
             f1_list.append(f1)
-            auc_pr = average_precision_score(expected, predicted, average='weighted')
             auc_pr_list.append(auc_pr)
-            mcc = matthews_corrcoef(expected, predicted)
             mcc_list.append(mcc)
 
+        # all the folds are written at once
+        store.write()
         f1_new = f1_compute(true_positive_list, false_positive_list, false_negative_list)
         feature_importances = pd.concat(feature_importances_list)
-        feature_importances.to_csv('./rf_feature_importances_{}.csv'.format(label_type))
+        feature_importances.to_csv('./rf_model_cv_feature_importances_{}.csv'.format(label_type))
+        timing = self.timing_summary(mean(fit_time_list), mean(predict_time_list))
 
         print("RF cv model precision:" + str(mean(precision_list)) + "; recall:" + str(
             mean(recall_list)) + "; f1:" + str(mean(f1_list)) + "; auc_pr:" + str(mean(auc_pr_list)) + "; mcc:" + str(
-            mean(mcc_list)) + "; f1_new:" + str(f1_new))
+            mean(mcc_list)) + "; f1_new:" + str(f1_new) + timing)
         file_name = 'rf_cv_results_' + label_type + '.csv'
         with open(file_name, 'w') as f:
             f.write("RF cv model precision:" + str(mean(precision_list)) + "; recall:" + str(
                 mean(recall_list)) + "; f1:" + str(mean(f1_list)) + "; auc_pr:" + str(
-                mean(auc_pr_list)) + "; mcc:" + str(mean(mcc_list)) + "; f1_new:" + str(f1_new))
+                mean(auc_pr_list)) + "; mcc:" + str(mean(mcc_list)) + "; f1_new:" + str(f1_new) + timing)
+        result = self.record('rf_model_cv', mean(precision_list), mean(recall_list), mean(f1_list),
+                             mean(auc_pr_list), mean(mcc_list), f1_new=f1_new, fit_time=mean(fit_time_list),
+                             predict_time=mean(predict_time_list))
+        # save model to file, together with the reducer fitted on the same (last) fold
+        self.export_bundle(fold['clf'], vectorizers, reducer, data[2], result)
+        return result
+
+    ###Histogram gradient boosting
+    def hgb_classifier(self):
+        # early stopping on an internal validation split; trees are built with all available OpenMP threads
+        return HistGradientBoostingClassifier(max_iter=500, learning_rate=0.1, early_stopping=True,
+                                              validation_fraction=0.1, n_iter_no_change=10,
+                                              class_weight='balanced', random_state=0)
+
+    def hgb_model(self):
+        print('you chose HGB')
+        data = self.preprocess()
+        print('data processed')
+
+        X_train = data[0]
+        y_train = data[2]
+        X_test = data[1]
+        y_test = data[3]
+        vectorizers = data[5]
+        label_type = str(self.prediction_column)
+
+        reducer, X_train, X_test = reduce_features(self.reducer, X_train, y_train, X_test)
+        # gradient boosting needs a dense matrix, use --reduction to keep it small
+        if issparse(X_train):
+            X_train = X_train.toarray()
+            X_test = X_test.toarray()
+
+        clf = self.hgb_classifier()
+        start = time.time()
+        clf = clf.fit(X_train, y_train)
+        fit_time = time.time() - start
+
+        start = time.time()
+        predicted = clf.predict(X_test)
+        predict_time = time.time() - start
+        expected = y_test
+
+        precision, recall, f1, auc_pr, mcc, _ = binary_scores(expected, predicted)
+
+        print("HGB model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
+            f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc) + "; n_iter:" + str(
+            clf.n_iter_) + self.timing_summary(fit_time, predict_time))
+        file_name = 'hgb_results_' + label_type + '.csv'
+        with open(file_name, 'w') as f:
+            f.write("HGB model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
+                f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc) + "; n_iter:" + str(
+                clf.n_iter_) + self.timing_summary(fit_time, predict_time))
+        result = self.record('hgb_model', precision, recall, f1, auc_pr, mcc, fit_time=fit_time,
+                             predict_time=predict_time)
         # save model to file
-        dump(clf, 'rf_model_{}.joblib'.format(label_type))
+        self.export_bundle(clf, vectorizers, reducer, data[4], result)
+        return result
+
+    ###Histogram gradient boosting cross validation
+    def hgb_model_cv(self):
+        print('you chose HGB cross_validation')
+        if self.reducer is None:
+            # every parallel fold would hold its own dense copy of the full TF-IDF matrix
+            raise ValueError('hgb_model_cv needs a feature reducer (--reduction)')
+        data = self.preprocess(cv=True)
+        print('data processed')
+
+        label_type = str(self.prediction_column)
+
+        clf = self.hgb_classifier()
+
+        precision_list = []
+        recall_list = []
+        f1_list = []
+        auc_pr_list = []
+        mcc_list = []
+        true_positive_list = []
+        false_positive_list = []
+        false_negative_list = []
+        fit_time_list = []
+        predict_time_list = []
+        for fold in run_folds(clf, data[0], data[1], reducer=self.reducer, dense=True, n_jobs=self.n_jobs,
+                              random_state=self.cv_seed):
+            predicted = fold['predicted']
+            fit_time_list.append(fold['fit_time'])
+            predict_time_list.append(fold['predict_time'])
+
+            expected = fold['expected']
+            # all the fold scores come from one confusion matrix
+            precision, recall, f1, auc_pr, mcc, conf_scores = binary_scores(expected, predicted)
+            true_positive_list.append(conf_scores[0])
+            false_positive_list.append(conf_scores[1])
+            false_negative_list.append(conf_scores[2])
+
+            precision_list.append(precision)
+            recall_list.append(recall)
+            f1_list.append(f1)
+            auc_pr_list.append(auc_pr)
+            mcc_list.append(mcc)
+
+        f1_new = f1_compute(true_positive_list, false_positive_list, false_negative_list)
+        timing = self.timing_summary(mean(fit_time_list), mean(predict_time_list))
+
+        print("HGB cv model precision:" + str(mean(precision_list)) + "; recall:" + str(
+            mean(recall_list)) + "; f1:" + str(mean(f1_list)) + "; auc_pr:" + str(mean(auc_pr_list)) + "; mcc:" + str(
+            mean(mcc_list)) + "; f1_new:" + str(f1_new) + timing)
+        file_name = 'hgb_cv_results_' + label_type + '.csv'
+        with open(file_name, 'w') as f:
+            f.write("HGB cv model precision:" + str(mean(precision_list)) + "; recall:" + str(
+                mean(recall_list)) + "; f1:" + str(mean(f1_list)) + "; auc_pr:" + str(
+                mean(auc_pr_list)) + "; mcc:" + str(mean(mcc_list)) + "; f1_new:" + str(f1_new) + timing)
+        return self.record('hgb_model_cv', mean(precision_list), mean(recall_list), mean(f1_list),
+                           mean(auc_pr_list), mean(mcc_list), f1_new=f1_new, fit_time=mean(fit_time_list),
+                           predict_time=mean(predict_time_list))
+
+    ###Streaming linear model
+    def sgd_model(self):
+        print('you chose streaming SGD')
+        data = self.preprocess()
+        print('data processed')
+
+        X_train = data[0]
+        y_train = data[2]
+        X_test = data[1]
+        y_test = data[3]
+        vectorizers = data[5]
+        label_type = str(self.prediction_column)
+
+        # the training matrix is written as CSR blocks and streamed back, a slice is held out for monitoring.
+        # The matrix itself is built in memory first; only the SGD fit is out-of-core (streaming_trainer.py
+        # trains on blocks written beforehand without loading the data)
+        X_train, X_heldout, y_train, y_heldout = train_test_split(X_train, y_train, test_size=0.1, random_state=53)
+        chunk_dir = 'sgd_chunks_{}'.format(label_type)
+        save_feature_chunks(X_train, y_train, os.path.join(chunk_dir, 'train'), self.chunk_size)
+        save_feature_chunks(X_heldout, y_heldout, os.path.join(chunk_dir, 'heldout'), self.chunk_size)
+
+        start = time.time()
+        clf, history = train_sgd_streaming(os.path.join(chunk_dir, 'train'), os.path.join(chunk_dir, 'heldout'),
+                                           loss=self.sgd_loss, checkpoint='sgd_model_{}.joblib'.format(label_type),
+                                           resume=self.sgd_resume)
+        fit_time = time.time() - start
+
+        start = time.time()
+        predicted = clf.predict(X_test)
+        predict_time = time.time() - start
+        expected = y_test
+
+        precision, recall, f1, auc_pr, mcc, _ = binary_scores(expected, predicted)
+
+        print("SGD model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
+            f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc) + "; loss:" + self.sgd_loss + self.timing_summary(
+            fit_time, predict_time))
+        file_name = 'sgd_results_' + label_type + '.csv'
+        with open(file_name, 'w') as f:
+            f.write("SGD model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
+                f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc) + "; loss:" + self.sgd_loss + self.timing_summary(
+                fit_time, predict_time))
+        result = self.record('sgd_model', precision, recall, f1, auc_pr, mcc, fit_time=fit_time,
+                             predict_time=predict_time)
+        self.export_bundle(clf, vectorizers, None, data[4], result)
+        return result
 
     ###Naive Bayes
     def nb_model(self):
         print('you chose NB')
-        data = dataset_preprocess(self.prediction_column, self.train_data, self.test_data)
+        data = self.preprocess()
         print('data processed')
 
         X_train = data[0]
@@ -479,11 +754,7 @@ class modelTrainer(object):
         expected = y_test
         # print("Number of mislabeled points out of a total %d points : %d" % (X_test.shape[0],(y_test != y_pred).sum()))
 
-        precision = precision_score(expected, predicted, average='weighted', pos_label=1)
-        recall = recall_score(expected, predicted, average='weighted', pos_label=1)
-        f1 = f1_score(expected, predicted, average='weighted', pos_label=1)
-        auc_pr = average_precision_score(expected, predicted, average='weighted')
-        mcc = matthews_corrcoef(expected, predicted)
+        precision, recall, f1, auc_pr, mcc, _ = binary_scores(expected, predicted)
 
         print("NB model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
             f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc))
@@ -491,23 +762,20 @@ class modelTrainer(object):
         with open(file_name, 'w') as f:
             f.write("NB model precision:" + str(precision) + "; recall:" + str(recall) + "; f1:" + str(
                 f1) + "; auc_pr:" + str(auc_pr) + "; mcc:" + str(mcc))
+        return self.record('nb_model', precision, recall, f1, auc_pr, mcc)
 
     ###Naive Bayes cross validation
     def nb_model_cv(self):
         print('you chose NB cross_validation')
-        data = dataset_preprocess(self.prediction_column, self.train_data, cv=True)
+        data = self.preprocess(cv=True)
         print('data processed')
 
         # X_train = data[0]
         # y_test = data[1]
         label_type = str(self.prediction_column)
 
-        from sklearn.naive_bayes import BernoulliNB
         # gnb = GaussianNB()
         ber = BernoulliNB()
-        # y_pred = gnb.fit(X_train.toarray(), y_train).predict(X_test.toarray())
-        # clf = ber#.fit(X_train.toarray(), y_test)
-        crossvalidation = StratifiedKFold(n_splits=10, shuffle=True, random_state=None)
 
         precision_list = []
         recall_list = []
@@ -518,31 +786,20 @@ class modelTrainer(object):
         false_positive_list = []
         false_negative_list = []
 
-        for train_index, test_index in crossvalidation.split(data[0], data[1]):
-            X_train, X_test = data[0][train_index], data[0][test_index]
-            y_train, y_test = data[1][train_index], data[1][test_index]
-
-            clf = ber.fit(X_train.toarray(), y_train)
-            predicted = clf.predict(X_test.toarray())
+        for fold in run_folds(ber, data[0], data[1], dense=True, n_jobs=self.n_jobs, random_state=self.cv_seed):
+            predicted = fold['predicted']
 
-            expected = y_test
-            conf_scores = conf_counter(predicted, expected)
-            true_positive = conf_scores[0]
-            true_positive_list.append(true_positive)
-            false_positive = conf_scores[1]
-            false_positive_list.append(false_positive)
-            false_negative = conf_scores[2]
-            false_negative_list.append(false_negative)
+            expected = fold['expected']
+            # all the fold scores come from one confusion matrix
+            precision, recall, f1, auc_pr, mcc, conf_scores = binary_scores(expected, predicted)
+            true_positive_list.append(conf_scores[0])
+            false_positive_list.append(conf_scores[1])
+            false_negative_list.append(conf_scores[2])
 
-            precision = precision_score(expected, predicted, average='weighted', pos_label=1)
             precision_list.append(precision)
-            recall = recall_score(expected, predicted, average='weighted', pos_label=1)
             recall_list.append(recall)
-            f1 = f1_score(expected, predicted, average='weighted', pos_label=1)
             f1_list.append(f1)
-            auc_pr = average_precision_score(expected, predicted, average='weighted')
             auc_pr_list.append(auc_pr)
-            mcc = matthews_corrcoef(expected, predicted)
             mcc_list.append(mcc)
 
         f1_new = f1_compute(true_positive_list, false_positive_list, false_negative_list)
@@ -555,6 +812,13 @@ class modelTrainer(object):
             f.write("NB cv model precision:" + str(mean(precision_list)) + "; recall:" + str(
                 mean(recall_list)) + "; f1:" + str(mean(f1_list)) + "; auc_pr:" + str(
                 mean(auc_pr_list)) + "; mcc:" + str(mean(mcc_list)) + "; f1_new:" + str(f1_new))
+        return self.record('nb_model_cv', mean(precision_list), mean(recall_list), mean(f1_list), mean(auc_pr_list),
+                           mean(mcc_list), f1_new=f1_new)
+
+    def timing_summary(self, fit_time, predict_time):
+        # appended to the results line so runs with and without reduction can be compared
+        return "; reduction:" + str(self.reduction) + "; fit_time:" + str(fit_time) + "; predict_time:" + str(
+            predict_time)
 
     # def function_chooser(self):
     #
@@ -564,6 +828,22 @@ class modelTrainer(object):
     #     print new_string
 
 
+def train_models(models, targets, train_data, test_data=None, **kwargs):
+    """
+    Trains every model on every target in this process and returns one result record per model run.
+    The feature matrix is built once and shared by all runs, since only y differs between the targets.
+    """
+    features = build_features(train_data, test_data)
+    results = []
+    for target in targets:
+        for model in models:
+            print('\n>>> Running model: {}, task: {}'.format(model, target))
+            trainer = modelTrainer(train_data, test_data, means=model, prediction_column=target, features=features,
+                                   **kwargs)
+            results.extend(trainer.results)
+    return results
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Training dataset')
     train_data = os.path.realpath('./results/prediction_data.csv')
@@ -571,12 +851,45 @@ def parse_args():
                         help='Train dataset path')
     parser.add_argument('--test_data', default=None,
                         help='Test dataset path')
+    parser.add_argument('--reduction', default=None, choices=REDUCTION_METHODS,
+                        help='Feature reduction fitted per training fold before the SVM and RF models')
+    parser.add_argument('--n_components', type=int, default=1000,
+                        help='Number of features (chi2, mutual_info) or components (svd) kept by the reduction')
+    parser.add_argument('--n_jobs', type=int, default=-1,
+                        help='Number of processes running the cross-validation folds (-1 uses all cores)')
+    parser.add_argument('--cv_seed', type=int, default=None,
+                        help='Seed of the cross-validation folds (default: different folds on every run)')
+    parser.add_argument('--sgd_loss', default='hinge', choices=['hinge', 'log_loss'],
+                        help='Loss of the streaming SGD model')
+    parser.add_argument('--chunk_size', type=int, default=10000,
+                        help='Rows per CSR block streamed by the SGD model')
+    parser.add_argument('--sgd_resume', action='store_true',
+                        help='Continue the SGD training from its last checkpoint')
+    parser.add_argument('--kernel_approximation', default='nystroem', choices=KERNEL_APPROXIMATIONS,
+                        help='Explicit RBF feature map of the approximate SVM models')
+    parser.add_argument('--approx_components', type=int, default=500,
+                        help='Number of components of the RBF feature map')
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=None,
+                        help='Models to train; when omitted the model and the task are asked interactively')
+    parser.add_argument('--targets', nargs='+', choices=sorted(TARGETS), default=['authoritative', 'support_object'],
+                        help='Attributes to evaluate (authoritative/authoritativeness, support_object/relevance)')
+    parser.add_argument('--output', default=None,
+                        help='CSV file collecting one result record per model and target')
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
-    modelTrainer(args.train_data, args.test_data)
+    options = {'reduction': args.reduction, 'n_components': args.n_components, 'n_jobs': args.n_jobs,
+               'cv_seed': args.cv_seed, 'sgd_loss': args.sgd_loss, 'chunk_size': args.chunk_size,
+               'sgd_resume': args.sgd_resume,
+               'kernel_approximation': args.kernel_approximation, 'approx_components': args.approx_components}
+    if args.models is None:
+        modelTrainer(args.train_data, args.test_data, **options)
+        return
+    results = train_models(args.models, args.targets, args.train_data, args.test_data, **options)
+    if args.output:
+        pd.DataFrame(results).to_csv(args.output, index=False)
 
 
 if __name__ == "__main__":
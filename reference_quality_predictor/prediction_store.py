@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar store of per-fold predictions: one parquet file per model and task with the columns
+fold, row_id, expected, predicted and score. Row ids are the rows of the file the predictions were made on, so
+predictions can be joined back to any attribute of the references without sorting or de-duplicating. That file
+(training file for the cross-validation and the internal split, test file for held-out predictions) is recorded
+in the parquet metadata, see row_source.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+PREDICTION_COLUMNS = ['fold', 'row_id', 'expected', 'predicted', 'score']
+# parquet metadata key of the file the row ids refer to
+ROW_SOURCE_KEY = b'row_source'
+
+
+def prediction_path(model, label_type, directory='predictions'):
+    return os.path.join(directory, '{}_{}.parquet'.format(model, label_type))
+
+
+class PredictionStore(object):
+    """
+    Collects the predictions of a run in memory and writes them once, one parquet row group per fold,
+    so readers filtering on fold only read the row groups they need.
+    """
+
+    def __init__(self, model, label_type, directory='predictions', rows='train', data_file=None):
+        self.path = prediction_path(model, label_type, directory)
+        self.folds = []
+        # rows: 'train' or 'test', the file whose rows the row ids are
+        self.rows = rows
+        self.data_file = data_file
+
+    def add(self, fold, row_id, expected, predicted, score=None):
+        expected = np.asarray(expected)
+        self.folds.append(pd.DataFrame({'fold': np.full(len(expected), fold, dtype=np.int16),
+                                        'row_id': np.asarray(row_id, dtype=np.int64),
+                                        'expected': expected.astype(np.int8),
+                                        'predicted': np.asarray(predicted).astype(np.int8),
+                                        'score': np.asarray(predicted if score is None else score,
+                                                            dtype=np.float32)}))
+
+    def write(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if not self.folds:
+            return None
+        from model_bundle import sha256_file
+
+        source = {'rows': self.rows,
+                  'data_file': os.path.realpath(self.data_file) if self.data_file else None,
+                  'data_sha256': sha256_file(self.data_file) if self.data_file else None}
+        tables = [pa.Table.from_pandas(fold, preserve_index=False) for fold in self.folds]
+        metadata = dict(tables[0].schema.metadata or {})
+        metadata[ROW_SOURCE_KEY] = json.dumps(source).encode('utf-8')
+        # a run replaces the predictions of the previous run of the same model and task
+        with pq.ParquetWriter(self.path, tables[0].schema.with_metadata(metadata)) as writer:
+            for table in tables:
+                writer.write_table(table.replace_schema_metadata(metadata))
+        self.folds = []
+        return self.path
+
+
+def row_source(path):
+    # {'rows', 'data_file', 'data_sha256'} of a prediction file, {} for files written without it
+    import pyarrow.parquet as pq
+
+    metadata = pq.read_schema(path).metadata or {}
+    return json.loads(metadata[ROW_SOURCE_KEY].decode('utf-8')) if ROW_SOURCE_KEY in metadata else {}
+
+
+def load_predictions(path, columns=None, folds=None):
+    # only the requested columns are read, and only the row groups of the requested folds
+    filters = [('fold', 'in', list(folds))] if folds is not None else None
+    return pd.read_parquet(path, columns=columns, filters=filters)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Report stage: figures are rendered headless (Agg) from precomputed aggregate tables, independent figures in
+parallel worker processes. A figure is skipped when its table and the code drawing it are unchanged since it
+was last rendered (figure_cache.py).
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from figure_cache import input_hash, is_current, read_hashes, write_hashes
+
+
+def render(renderer, table, path, options=None):
+    # runs in a worker process; every figure is closed so long runs do not accumulate them
+    renderer(table, path, **(options or {}))
+    plt.close('all')
+    return path
+
+
+def render_figures(figures, output_dir, n_jobs=None, force=False):
+    """
+    figures: list of (file name, renderer, table, options); renderer(table, path, **options) draws and saves
+    one figure. Returns the paths rendered in this run.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    hashes = {} if force else read_hashes(output_dir)
+
+    pending = []
+    for file_name, renderer, table, options in figures:
+        path = os.path.join(output_dir, file_name)
+        key = input_hash(table, renderer, options)
+        if is_current(hashes, path, key):
+            print('unchanged, skipped: ' + path)
+            continue
+        pending.append((file_name, key, renderer, table, path, options))
+
+    rendered = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [(file_name, key, executor.submit(render, renderer, table, path, options))
+                       for file_name, key, renderer, table, path, options in pending]
+            for file_name, key, future in futures:
+                rendered.append(future.result())
+                hashes[file_name] = key
+                print('rendered: ' + rendered[-1])
+        write_hashes(hashes, output_dir)
+    return rendered
@@ -1,11 +1,15 @@
+import argparse
+import os
+
 import numpy as np
 import pandas as pd
-from sklearn.metrics import precision_score, recall_score, f1_score, average_precision_score, matthews_corrcoef
 
-# matplotlib.use('WX')
+from prediction_store import load_predictions, prediction_path, row_source
+from report import render_figures
+from slice_metrics import join_references, slice_metrics
+
+# headless: report.py selects the Agg backend before pyplot is imported
 import matplotlib.pyplot as plt
-from matplotlib.font_manager import FontProperties
-import matplotlib.dates as mdates
 import matplotlib.lines as mlines
 
 
@@ -16,153 +20,127 @@ def newline(p1, p2, l_width=0.3, color='lightgray'):
     return l
 
 
-df = pd.read_csv('/Users/alessandro/Documents/WD_references_analysis/results/train_set_references.csv')
-df_properties = df['stat_property']
-df_properties = df_properties.to_frame()
-df_properties.reset_index(level=0, inplace=True)
-
-predicted_authoritative = pd.read_csv('/Users/alessandro/Documents/WD_references_analysis/predicted_authoritative.csv')
-predicted_authoritative.columns = ['index', 'expected', 'predicted']
-predicted_authoritative.sort_values(by='index', inplace=True)
-predicted_authoritative['index'].drop_duplicates(keep='first', inplace=True)
-
-predicted_authoritative = predicted_authoritative.merge(df_properties, on='index')
-
-
-def check_metrics(row):
-    expected = row['expected']
-    predicted = row['predicted']
-    precision = precision_score(expected, predicted, average='weighted', pos_label=1)
-    recall = recall_score(expected, predicted, average='weighted', pos_label=1)
-    f1 = f1_score(expected, predicted, average='weighted', pos_label=1)
-    auc_pr = average_precision_score(expected, predicted, average='weighted')
-    mcc = matthews_corrcoef(expected, predicted)
-    return precision, recall, f1, auc_pr, mcc
+def property_table(data_file, predictions_file, top=50):
+    df = pd.read_csv(data_file)
 
+    # every row of the cross-validation appears in exactly one fold, keyed by its row in the training file
+    predicted_authoritative = load_predictions(predictions_file, columns=['row_id', 'expected', 'predicted'])
+    predicted_authoritative = join_references(predicted_authoritative, df, ['stat_property'],
+                                              row_source(predictions_file), data_file)
 
-predicted_by_property = predicted_authoritative.groupby('stat_property').apply(check_metrics)
-predicted_by_property = predicted_by_property.to_frame()
-predicted_by_property.reset_index(level=0, inplace=True)
-predicted_by_property.columns = ['stat_property', 'metrics']
+    # the support of a property is its usage count, since every reference is predicted once
+    predicted_by_property = slice_metrics(predicted_authoritative, 'stat_property')
+    predicted_by_property = predicted_by_property.rename(columns={'support': 'usage_count'})
+    # .loc[predicted_by_property['usage_count'] >= 5, ]
+    predicted_by_property.sort_values(by='usage_count', ascending=False, inplace=True)
 
-predicted_by_property = pd.merge(predicted_by_property, pd.DataFrame(predicted_by_property['metrics'].tolist(),
-                                                                     index=predicted_by_property.index),
-                                 left_index=True, right_index=True)
-predicted_by_property.drop('metrics', axis=1, inplace=True)
-predicted_by_property.columns = ['stat_property', 'precision', 'recall', 'f1', 'auc_pr', 'mcc']
+    predicted_by_property['serial'] = range(0, predicted_by_property.shape[0])
+    return predicted_by_property.loc[predicted_by_property['serial'] < top,]
 
-# add property count
-property_counts = df_properties.stat_property.value_counts().to_frame().reset_index()
-property_counts.columns = ['stat_property', 'usage_count']
-
-predicted_by_property = predicted_by_property.merge(property_counts, on='stat_property')
-# .loc[predicted_by_property['usage_count'] >= 5, ]
-predicted_by_property.sort_values(by='usage_count', ascending=False, inplace=True)
-
-predicted_by_property['serial'] = range(0, predicted_by_property.shape[0])
-predicted_by_property_50 = predicted_by_property.loc[predicted_by_property['serial'] <= 49,]
 
 ###number of uses
 
-fig = plt.figure(figsize=(20, 10))
-
-ax = plt.subplot(121)
-ax.vlines(x=0.2, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax.vlines(x=0.2, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax.vlines(x=0.4, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax.vlines(x=0.6, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax.vlines(x=0.8, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
+def plot_f1_mcc_lollipop(predicted_by_property_50, path):
+    ymax = predicted_by_property_50['serial'].max()
+    fig = plt.figure(figsize=(20, 10))
 
-ax.hlines(y=predicted_by_property_50['serial'], xmin=0, xmax=1, color='lightgray', linewidth=0.2, linestyles='--')
+    ax = plt.subplot(121)
+    ax.vlines(x=0.2, ymin=0, ymax=ymax, color='lightgray', linewidth=0.3, linestyles='--')
+    ax.vlines(x=0.4, ymin=0, ymax=ymax, color='lightgray', linewidth=0.3, linestyles='--')
+    ax.vlines(x=0.6, ymin=0, ymax=ymax, color='lightgray', linewidth=0.3, linestyles='--')
+    ax.vlines(x=0.8, ymin=0, ymax=ymax, color='lightgray', linewidth=0.3, linestyles='--')
 
+    ax.hlines(y=predicted_by_property_50['serial'], xmin=0, xmax=1, color='lightgray', linewidth=0.2, linestyles='--')
 
-for i, p2 in zip(predicted_by_property_50['serial'], predicted_by_property_50['f1']):
-    newline([0, i], [p2, i], l_width=0.4, color='#0c374d')
+    for i, p2 in zip(predicted_by_property_50['serial'], predicted_by_property_50['f1']):
+        newline([0, i], [p2, i], l_width=0.4, color='#0c374d')
 
-ax.scatter(y=predicted_by_property_50['serial'], x=predicted_by_property_50['f1'], s=40, color='#0c374d')
+    ax.scatter(y=predicted_by_property_50['serial'], x=predicted_by_property_50['f1'], s=40, color='#0c374d')
 
-ax.set_yticks(predicted_by_property_50['serial'])
-ax.set_yticklabels(predicted_by_property_50['stat_property'], fontdict={'horizontalalignment': 'right'})
-ax.invert_yaxis()
+    ax.set_yticks(predicted_by_property_50['serial'])
+    ax.set_yticklabels(predicted_by_property_50['stat_property'], fontdict={'horizontalalignment': 'right'})
+    ax.invert_yaxis()
 
-ax2 = plt.subplot(122)
-# ax2.vlines(x=-0.8, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=-0.75, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=-0.50, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=-0.25, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=-0, ymin=0, ymax=49, color='lightgray', linewidth=0.6)
-ax2.vlines(x=0.25, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=0.50, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=0.75, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-# ax2.vlines(x=0.8, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
+    ax2 = plt.subplot(122)
+    for x in np.arange(-0.75, 1, 0.25):
+        if x == 0:
+            ax2.vlines(x=0, ymin=0, ymax=ymax, color='lightgray', linewidth=0.6)
+        else:
+            ax2.vlines(x=x, ymin=0, ymax=ymax, color='lightgray', linewidth=0.3, linestyles='--')
 
+    ax2.hlines(y=predicted_by_property_50['serial'], xmin=-1, xmax=1, color='lightgray', linewidth=0.2,
+               linestyles='--')
 
-ax2.hlines(y=predicted_by_property_50['serial'], xmin=-1, xmax=1, color='lightgray', linewidth=0.2, linestyles='--')
+    ax2.scatter(y=predicted_by_property_50['serial'], x=predicted_by_property_50['mcc'], s=40, color='#eb4034')
+    for i, p2 in zip(predicted_by_property_50['serial'], predicted_by_property_50['mcc']):
+        newline([0, i], [p2, i], l_width=0.4, color='#eb4034')
 
-ax2.scatter(y=predicted_by_property_50['serial'], x=predicted_by_property_50['mcc'], s=40, color='#eb4034')
-for i, p2 in zip(predicted_by_property_50['serial'], predicted_by_property_50['mcc']):
-    newline([0, i], [p2, i], l_width=0.4, color='#eb4034')
+    ax2.set_yticks([])
+    ax2.invert_yaxis()
 
-ax2.set_yticks([])
-ax2.invert_yaxis()
-
-plt.yticks(fontsize=11.7)
-plt.tight_layout()
-plt.show()
-plt.savefig('f1_mcc_by_property.eps', format='eps', transparent=True)
+    plt.yticks(fontsize=11.7)
+    plt.tight_layout()
+    fig.savefig(path, format=os.path.splitext(path)[1][1:], transparent=True)
 
 
 ### Number of uses
 
-
-fig = plt.figure(figsize=(20, 10))
-
-ax = plt.subplot(121)
-ax.vlines(x=-0.75, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax.vlines(x=-0.50, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax.vlines(x=-0.25, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax.vlines(x=-0, ymin=0, ymax=49, color='lightgray', linewidth=0.6)
-ax.vlines(x=0.25, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax.vlines(x=0.50, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax.vlines(x=0.75, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-
-ax.hlines(y=predicted_by_property_50['serial'], xmin=-1, xmax=1, color='lightgray', linewidth=0.2, linestyles='--')
-
-# for i, p2 in zip(predicted_by_property_50['serial'], predicted_by_property_50['f1']):
-#     newline([0, i], [p2, i], l_width=0.4, color='#0c374d')
-
-
-ax.scatter(y=predicted_by_property_50['serial'], x=predicted_by_property_50['f1'], s=40, color='#0c374d')
-ax.scatter(y=predicted_by_property_50['serial'], x=predicted_by_property_50['mcc'], s=40, color='#eb4034')
-
-
-ax.set_yticks(predicted_by_property_50['serial'])
-ax.set_yticklabels(predicted_by_property_50['stat_property'], fontdict={'horizontalalignment': 'right'})
-ax.invert_yaxis()
-
-ax2 = plt.subplot(122)
-# ax2.vlines(x=-0.8, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=-0.75, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=-0.50, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=-0.25, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=-0, ymin=0, ymax=49, color='lightgray', linewidth=0.6)
-ax2.vlines(x=0.25, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=0.50, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-ax2.vlines(x=0.75, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-# ax2.vlines(x=0.8, ymin=0, ymax=49, color='lightgray', linewidth=0.3, linestyles='--')
-
-
-ax2.hlines(y=predicted_by_property_50['serial'], xmin=-1, xmax=1, color='lightgray', linewidth=0.2, linestyles='--')
-
-ax.scatter(y=predicted_by_property_50['serial'], x=predicted_by_property_50['f1'], s=40, color='#0c374d')
-ax2.scatter(y=predicted_by_property_50['serial'], x=predicted_by_property_50['mcc'], s=40, color='#eb4034')
-# for i, p2 in zip(predicted_by_property_50['serial'], predicted_by_property_50['mcc']):
-#     newline([0, i], [p2, i], l_width=0.4, color='#eb4034')
-
-ax2.set_yticks([])
-ax2.invert_yaxis()
-
-plt.yticks(fontsize=11.7)
-plt.tight_layout()
-plt.show()
-plt.savefig('f1_mcc_by_property.eps', format='eps', transparent=True)
+def plot_f1_mcc_scatter(predicted_by_property_50, path):
+    ymax = predicted_by_property_50['serial'].max()
+    fig = plt.figure(figsize=(20, 10))
+
+    ax = plt.subplot(121)
+    ax2 = plt.subplot(122)
+    for axis in (ax, ax2):
+        for x in np.arange(-0.75, 1, 0.25):
+            if x == 0:
+                axis.vlines(x=0, ymin=0, ymax=ymax, color='lightgray', linewidth=0.6)
+            else:
+                axis.vlines(x=x, ymin=0, ymax=ymax, color='lightgray', linewidth=0.3, linestyles='--')
+        axis.hlines(y=predicted_by_property_50['serial'], xmin=-1, xmax=1, color='lightgray', linewidth=0.2,
+                    linestyles='--')
+
+    ax.scatter(y=predicted_by_property_50['serial'], x=predicted_by_property_50['f1'], s=40, color='#0c374d')
+    ax.scatter(y=predicted_by_property_50['serial'], x=predicted_by_property_50['mcc'], s=40, color='#eb4034')
+
+    ax.set_yticks(predicted_by_property_50['serial'])
+    ax.set_yticklabels(predicted_by_property_50['stat_property'], fontdict={'horizontalalignment': 'right'})
+    ax.invert_yaxis()
+
+    ax2.scatter(y=predicted_by_property_50['serial'], x=predicted_by_property_50['mcc'], s=40, color='#eb4034')
+
+    ax2.set_yticks([])
+    ax2.invert_yaxis()
+
+    plt.yticks(fontsize=11.7)
+    plt.tight_layout()
+    fig.savefig(path, format=os.path.splitext(path)[1][1:], transparent=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Prediction quality per property and its figures')
+    parser.add_argument('--data', default='./results/train_set_references.csv',
+                        help='Training references the predictions were made on')
+    parser.add_argument('--predictions', default=prediction_path('rf_model_cv', 'authoritative'))
+    parser.add_argument('--output_dir', default='./results/report')
+    parser.add_argument('--top', type=int, default=50, help='Number of most used properties plotted')
+    parser.add_argument('--n_jobs', type=int, default=None, help='Figure rendering processes')
+    parser.add_argument('--force', action='store_true', help='Render the figures even when unchanged')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # compute all the aggregate tables first, then render from the tables only
+    predicted_by_property_50 = property_table(args.data, args.predictions, args.top)
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+    predicted_by_property_50.to_csv(os.path.join(args.output_dir, 'metrics_by_property.csv'), index=False)
+
+    figures = [('f1_mcc_by_property.eps', plot_f1_mcc_lollipop, predicted_by_property_50, None),
+               ('f1_mcc_scatter_by_property.eps', plot_f1_mcc_scatter, predicted_by_property_50, None)]
+    render_figures(figures, args.output_dir, n_jobs=args.n_jobs, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
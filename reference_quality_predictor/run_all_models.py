@@ -1,6 +1,23 @@
 # -*- coding: utf-8 -*-
+"""
+Runs every model on every task in one process pool. The features are built once, saved uncompressed and
+memory-mapped by the workers; each worker returns the structured result records of its job.
+A job is skipped when its model, task, parameters, input files and code are the same as in a previous run;
+cross-validation jobs only when their folds are seeded (--cv_seed), since unseeded folds change on every run.
+"""
+import argparse
+import glob
+import hashlib
+import json
 import os
-import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from joblib import dump, load
+
+from data_preprocessing import build_features, REDUCTION_METHODS
+from model_bundle import sha256_file
+from model_trainer import MODELS, modelTrainer
 
 # Models to run
 models = [
@@ -17,41 +34,172 @@ models = [
 
 # Prediction tasks
 targets = {
-    'authoritativeness': '0',
-    'relevance': '1'
+    'authoritativeness': 'authoritative',
+    'relevance': 'support_object'
 }
 
 # Output text file (not CSV)
 output_file = 'all_model_results.txt'
 
-# Clear the file before writing
-with open(output_file, 'w') as f:
-    f.write("All Model Results\n==================\n\n")
-
-for task_name in targets:
-    task_id = targets[task_name]
-
-    for model in models:
-        print("\n>>> Running model: {}, task: {}".format(model, task_name))
-
-        process = subprocess.Popen(
-            ['python', 'model_trainer.py'],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-
-        input_data = model + '\n' + task_id + '\n'
-        stdout, stderr = process.communicate(input=input_data)
-
-        lines = stdout.splitlines()
-        result_line = ''
-        for line in lines:
-            if 'precision:' in line and ';' in line:
-                result_line = line
-                break
-
-        with open(output_file, 'a') as f:
-            f.write("Model: {}\nTask: {}\nResult: {}\n\n".format(model, task_name, result_line))
-            if not result_line:
-                f.write("Could not parse output.\n\n")
+# files read by a job besides the train and test data
+extra_inputs = {
+    'baseline': ['./results/prediction_data.csv', 'data/authoritative_baseline.csv']
+}
+
+_features = None
+
+
+def load_features(features_path):
+    # worker initializer: the matrices are memory-mapped, so all the workers share one copy
+    global _features
+    _features = load(features_path, mmap_mode='r')
+
+
+def run_job(model, target, train_data, test_data, options):
+    try:
+        trainer = modelTrainer(train_data, test_data, means=model, prediction_column=target, features=_features,
+                               **options)
+        return trainer.results
+    except Exception as e:
+        return [{'model': model, 'target': target, 'error': '{}: {}'.format(type(e).__name__, e)}]
+
+
+def code_version():
+    # any change to the training code invalidates the cached results
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def input_hashes(model, train_data, test_data):
+    # SHA-256 of every file the job reads, None for the ones that do not exist
+    paths = [train_data, test_data] + extra_inputs.get(model, [])
+    return [(os.path.realpath(path), sha256_file(path) if os.path.exists(path) else None) for path in paths if path]
+
+
+def cacheable(model, options):
+    # a cross-validation gives the same results again only when its folds are seeded
+    return not model.endswith('_cv') or options.get('cv_seed') is not None
+
+
+def job_key(model, target, data_hashes, options, code):
+    description = json.dumps({'model': model, 'target': target, 'data': data_hashes, 'options': options,
+                              'code': code}, sort_keys=True)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+def read_cache(cache_file):
+    if not os.path.exists(cache_file):
+        return {}
+    with open(cache_file) as f:
+        return json.load(f)
+
+
+def write_cache(cache, cache_file):
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(cache, f, indent=1, default=float)
+    os.replace(tmp_file, cache_file)
+
+
+def write_text_summary(records, file_name):
+    # same layout as the former all_model_results.txt
+    with open(file_name, 'w') as f:
+        f.write("All Model Results\n==================\n\n")
+        for record in records:
+            if record.get('error'):
+                result_line = 'error: ' + record['error']
+            else:
+                result_line = "precision:{precision}; recall:{recall}; f1:{f1}; auc_pr:{auc_pr}; mcc:{mcc}".format(
+                    **record)
+            f.write("Model: {}\nTask: {}\nResult: {}\n\n".format(record['model'], record['target'], result_line))
+
+
+def run_all(job_models, job_targets, train_data, test_data=None, n_workers=None, options=None, force=False,
+            output_dir='results'):
+    """
+    Runs the (model, target) jobs that are not cached yet in a process pool and returns every result record,
+    cached ones included.
+    """
+    options = dict(options or {})
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    cache_file = os.path.join(output_dir, 'job_cache.json')
+    cache = {} if force else read_cache(cache_file)
+    code = code_version()
+
+    jobs = []
+    cached = []
+    for target in job_targets:
+        for model in job_models:
+            key = job_key(model, target, input_hashes(model, train_data, test_data), options, code)
+            if key in cache and cacheable(model, options):
+                print('>>> Skipping model: {}, task: {} (unchanged)'.format(model, target))
+                cached.extend(cache[key])
+            else:
+                jobs.append((key, model, target))
+
+    records = list(cached)
+    if jobs:
+        # featurize once for all the targets; only y differs between them
+        features_path = os.path.join(output_dir, 'features.joblib')
+        dump(build_features(train_data, test_data), features_path)
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=load_features,
+                                 initargs=(features_path,)) as executor:
+            futures = dict((executor.submit(run_job, model, target, train_data, test_data, options),
+                            (key, model, target)) for key, model, target in jobs)
+            for future in as_completed(futures):
+                key, model, target = futures[future]
+                job_records = future.result()
+                print('>>> Finished model: {}, task: {}'.format(model, target))
+                records.extend(job_records)
+                if cacheable(model, options) and not any(r.get('error') for r in job_records):
+                    cache[key] = job_records
+                    write_cache(cache, cache_file)
+        os.remove(features_path)
+
+    order = dict((m, i) for i, m in enumerate(job_models))
+    records.sort(key=lambda r: (list(job_targets).index(r['target']) if r['target'] in job_targets else 0,
+                                order.get(r['model'], len(order))))
+    return records
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run all models on all tasks')
+    parser.add_argument('--train_data', default=os.path.realpath('./results/prediction_data.csv'),
+                        help='Train dataset path')
+    parser.add_argument('--test_data', default=None,
+                        help='Test dataset path')
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=models)
+    parser.add_argument('--targets', nargs='+', choices=sorted(targets.values()), default=list(targets.values()))
+    parser.add_argument('--n_workers', type=int, default=None,
+                        help='Number of worker processes (default: number of cores)')
+    parser.add_argument('--n_jobs', type=int, default=1,
+                        help='Processes per cross-validation inside each worker')
+    parser.add_argument('--cv_seed', type=int, default=0,
+                        help='Seed of the cross-validation folds; pass -1 for new folds on every run '
+                             '(such jobs are never cached)')
+    parser.add_argument('--reduction', default=None, choices=REDUCTION_METHODS)
+    parser.add_argument('--n_components', type=int, default=1000)
+    parser.add_argument('--force', action='store_true',
+                        help='Run every job, even when its inputs did not change')
+    parser.add_argument('--output', default='results/all_model_results.csv',
+                        help='Consolidated table, one row per model and task')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    options = {'n_jobs': args.n_jobs, 'reduction': args.reduction, 'n_components': args.n_components,
+               'cv_seed': args.cv_seed if args.cv_seed >= 0 else None}
+    records = run_all(args.models, args.targets, args.train_data, args.test_data, n_workers=args.n_workers,
+                      options=options, force=args.force, output_dir=os.path.dirname(args.output) or '.')
+    pd.DataFrame(records).to_csv(args.output, index=False)
+    write_text_summary(records, os.path.join(os.path.dirname(args.output) or '.', output_file))
+    print('results written to ' + args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Scores new reference records with a model bundle saved by model_trainer.py.
+Concurrent requests are collected for a few milliseconds and featurized/scored as one sparse matrix.
+Usable as a library (ReferenceScorer) or over HTTP (POST /score, GET /stats).
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import issparse
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+
+from data_preprocessing import transform_features
+from forest_compiler import compile_forest
+from model_bundle import load_bundle
+
+RECORD_FIELDS = ['item_text_clean', 'object_text', 'stat_property', 'user_type', 'code_2',
+                 'user_edits', 'user_ref_edits_pc', 'ref_count', 'domain_count']
+
+
+def check_record(record):
+    if not isinstance(record, dict):
+        raise ValueError('A reference must be a JSON object, got {}'.format(type(record).__name__))
+    missing = [field for field in RECORD_FIELDS if field not in record]
+    if missing:
+        raise ValueError('Missing reference fields: {}'.format(', '.join(missing)))
+
+
+def records_to_frame(records):
+    for record in records:
+        check_record(record)
+    df = pd.DataFrame.from_records(records, columns=RECORD_FIELDS)
+    df[['item_text_clean', 'object_text']] = df[['item_text_clean', 'object_text']].fillna('')
+    return df
+
+
+class ReferenceScorer(object):
+
+    def __init__(self, model, vectorizers, max_batch_size=256, max_wait=0.005, latency_window=10000,
+                 flat_forest_rows=32):
+        self.model = model
+        # small batches of a random forest are scored with the compiled forest, which skips sklearn's
+        # per-tree overhead; larger ones are faster through sklearn's compiled traversal
+        self.flat_forest = compile_forest(model) if isinstance(model, RandomForestClassifier) else None
+        self.flat_forest_rows = flat_forest_rows
+        self.vectorizers = vectorizers
+        self.reducer = vectorizers.get('reducer')
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = Queue()
+        self.latencies = deque(maxlen=latency_window)
+        self.batch_sizes = deque(maxlen=latency_window)
+        self.scored = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def score_batch(self, records):
+        """
+        Featurizes and scores a list of reference records in one call.
+        Returns one {'prediction', 'score'} dict per record, in order.
+        """
+        X = transform_features(records_to_frame(records), self.vectorizers)
+        if self.reducer is not None:
+            X = self.reducer.transform(X)
+        if isinstance(self.model, HistGradientBoostingClassifier) and issparse(X):
+            X = X.toarray()
+        if self.flat_forest is not None and X.shape[0] <= self.flat_forest_rows:
+            proba = self.flat_forest.predict_proba(X)
+            predicted = self.flat_forest.classes_.take(np.argmax(proba, axis=1))
+            return [{'prediction': int(p), 'score': float(s)} for p, s in zip(predicted, proba[:, 1])]
+        predicted = self.model.predict(X)
+        if hasattr(self.model, 'decision_function'):
+            scores = self.model.decision_function(X)
+        elif hasattr(self.model, 'predict_proba'):
+            scores = self.model.predict_proba(X)[:, 1]
+        else:
+            scores = predicted
+        return [{'prediction': int(p), 'score': float(s)} for p, s in zip(predicted, scores)]
+
+    ###micro-batching
+    def start(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run, daemon=True)
+            self.worker.start()
+        return self
+
+    def submit(self, record):
+        # returns a Future resolved by the batching thread; invalid records are rejected before they can
+        # fail a batch shared with other requests
+        check_record(record)
+        future = Future()
+        self.queue.put((record, future, time.time()))
+        return future
+
+    def score(self, records, timeout=None):
+        self.start()
+        futures = [self.submit(record) for record in records]
+        return [future.result(timeout) for future in futures]
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = self.score_batch([record for record, _, _ in batch])
+            except Exception as e:
+                # one bad record fails its batch, the service keeps running
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            done = time.time()
+            with self.lock:
+                self.scored += len(batch)
+                self.batch_sizes.append(len(batch))
+                for (_, future, submitted), result in zip(batch, results):
+                    self.latencies.append(done - submitted)
+                    future.set_result(result)
+
+    def stats(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            batch_sizes = list(self.batch_sizes)
+            scored = self.scored
+        elapsed = time.time() - self.started
+        stats = {'scored': scored,
+                 'throughput': scored / elapsed if elapsed > 0 else 0.0,
+                 'mean_batch_size': float(np.mean(batch_sizes)) if batch_sizes else 0.0}
+        for q in [50, 95, 99]:
+            stats['latency_p{}_ms'.format(q)] = float(np.percentile(latencies, q)) if len(latencies) else 0.0
+        return stats
+
+
+def make_handler(scorer):
+    class ScoringHandler(BaseHTTPRequestHandler):
+
+        def send_json(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self.send_json(200, scorer.stats())
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/score':
+                self.send_json(404, {'error': 'not found'})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                records = body if isinstance(body, list) else [body]
+                self.send_json(200, scorer.score(records))
+            except (ValueError, KeyError) as e:
+                self.send_json(400, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+def serve(scorer, host='127.0.0.1', port=8000):
+    scorer.start()
+    server = ThreadingHTTPServer((host, port), make_handler(scorer))
+    print('scoring service listening on http://{}:{}'.format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Batch inference service for reference quality models')
+    parser.add_argument('--bundle', required=True, help='Model bundle directory, e.g. bundles/svm_model_authoritative')
+    parser.add_argument('--input', default=None,
+                        help='Score a tab-separated file offline instead of starting the HTTP service')
+    parser.add_argument('--output', default='scored_references.csv')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max_batch_size', type=int, default=256)
+    parser.add_argument('--max_wait_ms', type=float, default=5.0,
+                        help='How long requests are collected into one batch')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start = time.time()
+    bundle = load_bundle(args.bundle)
+    print('loaded {} ({}) in {:.3f}s'.format(args.bundle, bundle['manifest']['estimator'], time.time() - start))
+    scorer = ReferenceScorer(bundle['model'], bundle['vectorizers'], max_batch_size=args.max_batch_size,
+                             max_wait=args.max_wait_ms / 1000.0)
+    if args.input:
+        df = pd.read_csv(args.input, sep='\t')
+        start = time.time()
+        results = []
+        for begin in range(0, len(df), args.max_batch_size):
+            chunk = df.iloc[begin:begin + args.max_batch_size]
+            results.extend(scorer.score_batch(chunk[RECORD_FIELDS].to_dict(orient='records')))
+        elapsed = time.time() - start
+        df['prediction'] = [r['prediction'] for r in results]
+        df['score'] = [r['score'] for r in results]
+        df.to_csv(args.output, sep='\t', index=False)
+        print('scored {} references in {:.3f}s ({:.1f} references/s)'.format(len(df), elapsed,
+                                                                            len(df) / elapsed if elapsed else 0.0))
+    else:
+        serve(scorer, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Quality of the predictions on slices of the references: confusion counts of every slice (any combination of
+columns, e.g. stat_property, code_2, user_type or fold) in one bincount, and precision, recall, f1, auc_pr and mcc
+computed for all the slices at once.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from metrics import grouped_confusion_counts, scores_from_counts
+from model_bundle import sha256_file
+from prediction_store import load_predictions, row_source
+
+SCORE_COLUMNS = ['precision', 'recall', 'f1', 'auc_pr', 'mcc']
+
+
+def slice_metrics(predicted, keys, min_support=1):
+    """
+    predicted holds 'expected' and 'predicted' 0/1 columns and the key columns.
+    Returns one row per slice with the key values, support, tp, fp, fn, tn and the scores, keeping the slices
+    with at least min_support rows. Rows with a missing key value are left out, as groupby does.
+    """
+    keys = [keys] if isinstance(keys, str) else list(keys)
+    keep = predicted[keys].notnull().all(axis=1).values
+    rows = predicted.loc[keep]
+    # each key is factorized on its own and the codes are combined into one slice code
+    combined = np.zeros(len(rows), dtype=np.int64)
+    key_values = []
+    for key in keys:
+        codes, values = pd.factorize(rows[key], sort=True)
+        combined = combined * len(values) + codes
+        key_values.append(values)
+    slice_codes, codes = np.unique(combined, return_inverse=True)
+    tp, fp, fn, tn = grouped_confusion_counts(codes, rows['expected'].values, rows['predicted'].values,
+                                              len(slice_codes))
+    table = pd.DataFrame(index=range(len(slice_codes)))
+    for key, values in reversed(list(zip(keys, key_values))):
+        table[key] = values.take(slice_codes % len(values))
+        slice_codes = slice_codes // len(values)
+    table = table[keys]
+    table['support'] = tp + fp + fn + tn
+    table['tp'], table['fp'], table['fn'], table['tn'] = tp, fp, fn, tn
+    scores = scores_from_counts(tp, fp, fn, tn)
+    for column in SCORE_COLUMNS:
+        table[column] = scores[column]
+    return table[table['support'] >= min_support].reset_index(drop=True)
+
+
+def join_references(predicted, references, columns, source=None, references_file=None):
+    """
+    Adds the columns of references to the predictions, matching row_id with the row of references.
+    source is the row_source of the prediction file: held-out predictions are numbered by the rows of the test
+    file and are only joined to that file (references_file, checked by hash).
+    """
+    if source and source.get('rows') == 'test':
+        if references_file is None or sha256_file(references_file) != source.get('data_sha256'):
+            raise ValueError('the row ids are rows of the test file {}, not of {}'.format(
+                source.get('data_file'), references_file))
+    return predicted.join(references[columns], on='row_id')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Prediction quality per slice of the references')
+    parser.add_argument('--predictions', required=True,
+                        help='Prediction file, e.g. predictions/rf_model_cv_authoritative.parquet')
+    parser.add_argument('--data', default=None,
+                        help='File the predictions were made on (tab-separated); default: the test file of '
+                             'held-out predictions, else ./results/prediction_data.csv')
+    parser.add_argument('--keys', nargs='+', default=['stat_property'],
+                        help="Columns of the training file (or 'fold') defining the slices")
+    parser.add_argument('--min_support', type=int, default=1)
+    parser.add_argument('--output', default=None, help='CSV file for the slice table')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    predicted = load_predictions(args.predictions, columns=['fold', 'row_id', 'expected', 'predicted'])
+    source = row_source(args.predictions)
+    data = args.data
+    if data is None:
+        data = source['data_file'] if source.get('rows') == 'test' else './results/prediction_data.csv'
+    columns = [key for key in args.keys if key not in predicted.columns]
+    if columns:
+        references = pd.read_csv(data, sep='\t', usecols=columns)
+        predicted = join_references(predicted, references, columns, source, data)
+    table = slice_metrics(predicted, args.keys, args.min_support)
+    table = table.sort_values(by='support', ascending=False)
+    print(table.head(50).to_string(index=False))
+    if args.output:
+        table.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Out-of-core linear model trained with partial_fit over CSR feature blocks stored on disk.
+Only one block is held in memory at a time, so training memory does not grow with the data.
+"""
+
+import argparse
+import glob
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from joblib import dump, load
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import MaxAbsScaler
+
+from metrics import conf_counter, f1_compute, mcc_compute
+
+
+def save_feature_chunks(X_data, y, directory, chunk_size=10000):
+    # one uncompressed CSR block per chunk_size rows, labels stored next to it
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    # blocks left over from a previous, larger run would otherwise be read back
+    for path in chunk_paths(directory):
+        os.remove(path)
+        os.remove(path.replace('.npz', '_y.npy'))
+    y = np.asarray(y)
+    paths = []
+    for i, start in enumerate(range(0, X_data.shape[0], chunk_size)):
+        path = os.path.join(directory, 'chunk_{:05d}.npz'.format(i))
+        sp.save_npz(path, sp.csr_matrix(X_data[start:start + chunk_size]), compressed=False)
+        np.save(path.replace('.npz', '_y.npy'), y[start:start + chunk_size])
+        paths.append(path)
+    return paths
+
+
+def chunk_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, 'chunk_*.npz')))
+
+
+def load_chunk(path):
+    return sp.load_npz(path), np.load(path.replace('.npz', '_y.npy'))
+
+
+def iter_feature_chunks(directory):
+    for path in chunk_paths(directory):
+        yield load_chunk(path)
+
+
+def balanced_class_weight(directory):
+    # same weights as class_weight='balanced' (not supported by partial_fit), computed from the label files only
+    counts = {}
+    for path in chunk_paths(directory):
+        labels, label_counts = np.unique(np.load(path.replace('.npz', '_y.npy')), return_counts=True)
+        for label, count in zip(labels, label_counts):
+            counts[label] = counts.get(label, 0) + count
+    classes = np.array(sorted(counts))
+    total = float(sum(counts.values()))
+    return classes, {label: total / (len(classes) * counts[label]) for label in classes}
+
+
+def fit_block_scaler(directory):
+    # the count features (user_edits, ref_count, ...) would dominate the SGD updates without scaling
+    scaler = MaxAbsScaler()
+    for X_chunk, _ in iter_feature_chunks(directory):
+        scaler.partial_fit(X_chunk)
+    return scaler
+
+
+def evaluate_chunks(clf, directory):
+    # pooled confusion counts over the held-out blocks
+    true_positive_list = []
+    false_positive_list = []
+    false_negative_list = []
+    true_negative_list = []
+    for X_chunk, y_chunk in iter_feature_chunks(directory):
+        conf_scores = conf_counter(clf.predict(X_chunk), y_chunk)
+        true_positive_list.append(conf_scores[0])
+        false_positive_list.append(conf_scores[1])
+        false_negative_list.append(conf_scores[2])
+        true_negative_list.append(conf_scores[3])
+    f1 = f1_compute(true_positive_list, false_positive_list, false_negative_list)
+    mcc = mcc_compute(sum(true_positive_list), sum(false_positive_list), sum(false_negative_list),
+                      sum(true_negative_list))
+    return f1, mcc
+
+
+def train_sgd_streaming(train_dir, heldout_dir=None, loss='hinge', alpha=0.0001, n_epochs=5, eval_every=10,
+                        checkpoint=None, random_state=0, resume=False):
+    """
+    Trains an SGDClassifier (hinge or log_loss) with one partial_fit call per block of train_dir.
+    Every eval_every blocks the model is scored on heldout_dir and written to checkpoint, with the number of
+    blocks trained so far. With resume, training continues from the checkpoint when it exists: the blocks it has
+    already seen are skipped and the epochs visit the blocks in the same order as an uninterrupted run.
+    Returns the fitted scaler + classifier pipeline and the evaluation history.
+    """
+    paths = chunk_paths(train_dir)
+    step = 0
+    if resume and checkpoint and os.path.exists(checkpoint):
+        state = load(checkpoint)
+        if state['blocks'] != len(paths):
+            raise ValueError('{} was trained on {} blocks, {} has {}'.format(checkpoint, state['blocks'], train_dir,
+                                                                              len(paths)))
+        model, step = state['model'], state['step']
+        scaler, clf = model.steps[0][1], model.steps[-1][1]
+        classes = clf.classes_
+        print("SGD resumed from {} at step:{}".format(checkpoint, step))
+    else:
+        classes, class_weight = balanced_class_weight(train_dir)
+        scaler = fit_block_scaler(train_dir)
+        clf = SGDClassifier(loss=loss, alpha=alpha, class_weight=class_weight, random_state=random_state)
+        model = make_pipeline(scaler, clf)
+    rng = np.random.RandomState(random_state)
+    history = []
+    saved = step
+    for epoch in range(n_epochs):
+        # blocks are visited in a different order at every epoch
+        for i, path in enumerate(rng.permutation(paths)):
+            if epoch * len(paths) + i < step:
+                continue
+            X_chunk, y_chunk = load_chunk(path)
+            clf.partial_fit(scaler.transform(X_chunk), y_chunk, classes=classes)
+            step += 1
+            if step % eval_every == 0:
+                history.append(checkpoint_model(model, heldout_dir, checkpoint, epoch, step, len(paths)))
+                saved = step
+    if step != saved:
+        history.append(checkpoint_model(model, heldout_dir, checkpoint, n_epochs - 1, step, len(paths)))
+    return model, history
+
+
+def checkpoint_model(clf, heldout_dir, checkpoint, epoch, step, blocks):
+    progress = {'epoch': epoch, 'step': step}
+    if heldout_dir:
+        progress['f1'], progress['mcc'] = evaluate_chunks(clf, heldout_dir)
+        print("SGD epoch:{}; step:{}; held-out f1:{}; mcc:{}".format(epoch, step, progress['f1'], progress['mcc']))
+    if checkpoint:
+        # written next to the checkpoint, then renamed, so an interrupted write leaves the previous one intact
+        dump({'model': clf, 'step': step, 'blocks': blocks}, checkpoint + '.tmp')
+        os.replace(checkpoint + '.tmp', checkpoint)
+    return progress
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Streaming SGD training over CSR feature blocks')
+    parser.add_argument('--train_chunks', required=True,
+                        help='Directory of training blocks written by save_feature_chunks')
+    parser.add_argument('--heldout_chunks', default=None,
+                        help='Directory of held-out blocks used for the periodic evaluation')
+    parser.add_argument('--loss', default='hinge', choices=['hinge', 'log_loss'])
+    parser.add_argument('--n_epochs', type=int, default=5)
+    parser.add_argument('--eval_every', type=int, default=10,
+                        help='Number of blocks between two held-out evaluations and checkpoints')
+    parser.add_argument('--checkpoint', default='sgd_model.joblib',
+                        help='Path of the model checkpoint')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue training from the checkpoint instead of starting over')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    train_sgd_streaming(args.train_chunks, args.heldout_chunks, loss=args.loss, n_epochs=args.n_epochs,
+                        eval_every=args.eval_every, checkpoint=args.checkpoint, resume=args.resume)
+
+
+if __name__ == "__main__":
+    main()
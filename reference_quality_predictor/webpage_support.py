@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Relevance baseline: a reference supports its statement when the page it points to contains both the item label
+and the value label. Distinct URLs are fetched concurrently through a cache, every page is normalised once and
+searched only for the labels of the references pointing to it.
+"""
+
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/56.0.2924.76 Safari/537.36',
+    'Upgrade-Insecure-Requests': '1', 'DNT': '1',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5', 'Accept-Encoding': 'gzip, deflate'}
+# text of a page that could not be fetched
+FAILED_PAGE = 'NA'
+
+_local = threading.local()
+_page_cache = {}
+
+
+def normalize(text):
+    # pages and labels are compared as NFC unicode strings, decoded once
+    if not isinstance(text, str):
+        return None
+    return unicodedata.normalize('NFC', text)
+
+
+def _session():
+    # one keep-alive session per worker thread
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+        _local.session.headers.update(HEADERS)
+    return _local.session
+
+
+def extract_webpage_text(link, timeout=5):
+    try:
+        r = _session().get(link, timeout=timeout, auth=('user', 'pass'))
+        return r.text
+    except Exception:
+        return FAILED_PAGE
+
+
+def fetch_pages(links, max_workers=32, timeout=5, cache=None):
+    """
+    Fetches every distinct link once, max_workers at a time, and returns {link: normalised page text}.
+    Pages already in cache (by default a per-process dict) are not fetched again.
+    """
+    cache = _page_cache if cache is None else cache
+    missing = [link for link in set(links) if link not in cache]
+    if missing:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for link, text in zip(missing, executor.map(lambda l: extract_webpage_text(l, timeout), missing)):
+                cache[link] = normalize(text)
+    return dict((link, cache[link]) for link in set(links))
+
+
+def check_webpage_support(value_1, value_2, link):
+    # single reference version of webpage_support_baseline
+    return webpage_support_baseline([value_1], [value_2], [link])[0]
+
+
+def webpage_support_baseline(item_labels, value_labels, links, max_workers=32, timeout=5, cache=None):
+    """
+    1 for every reference whose page contains both its item label and its value label, 0 otherwise
+    (exact, case-sensitive match, as in the 2017 baseline). Returns a list aligned with the inputs.
+    """
+    item_labels = [normalize(label) for label in item_labels]
+    value_labels = [normalize(label) for label in value_labels]
+    links = list(links)
+    pages = fetch_pages(links, max_workers=max_workers, timeout=timeout, cache=cache)
+
+    # substring checks run in C: a page is searched once per distinct label of its own references
+    labels_by_page = {}
+    for item_label, value_label, link in zip(item_labels, value_labels, links):
+        if item_label and value_label:
+            labels_by_page.setdefault(link, set()).update((item_label, value_label))
+    found = dict((link, set(label for label in labels if pages[link] and label in pages[link]))
+                 for link, labels in labels_by_page.items())
+
+    support = []
+    for item_label, value_label, link in zip(item_labels, value_labels, links):
+        if not item_label or not value_label:
+            support.append(0)
+            continue
+        matches = found[link]
+        support.append(1 if item_label in matches and value_label in matches else 0)
+    return support